@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Время построения свечного графика: цикл по iterrows (прежняя версия) против коллекций
+
+Пример: python benchmarks/bench_chart_render.py --candles 100 500 2000 --repeat 5
+"""
+
+import argparse
+import io
+import os
+import statistics
+import sys
+import time
+import warnings
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.dates as mdates
+import numpy as np
+import pandas as pd
+from matplotlib.figure import Figure
+from matplotlib.patches import Rectangle
+
+from chart_generator import ChartGenerator
+
+
+def make_candles(count: int, rng: np.random.Generator) -> pd.DataFrame:
+    """Случайное блуждание свечами 1h"""
+    close = 45000 * np.exp(np.cumsum(rng.normal(0, 0.01, count)))
+    open_ = np.concatenate([[close[0]], close[:-1]])
+    spread = np.abs(rng.normal(0, 0.005, count)) * close
+    return pd.DataFrame({
+        'timestamp': pd.date_range(end='2024-01-01', periods=count, freq='h'),
+        'open': open_,
+        'high': np.maximum(open_, close) + spread,
+        'low': np.minimum(open_, close) - spread,
+        'close': close,
+        'volume': rng.integers(1000, 100000, count),
+    })
+
+
+def legacy_draw_candles(ax, df: pd.DataFrame):
+    """Прежняя отрисовка: патч и линия на каждую свечу"""
+    colors = ['green' if close >= open else 'red'
+              for close, open in zip(df['close'], df['open'])]
+
+    for idx, row in df.iterrows():
+        color = colors[idx]
+
+        body_start = min(row['open'], row['close'])
+        body_height = abs(row['close'] - row['open'])
+
+        if body_height > 0:
+            ax.add_patch(Rectangle(
+                (mdates.date2num(row['timestamp']) - 0.3, body_start),
+                0.6, body_height,
+                color=color, alpha=0.7
+            ))
+
+        ax.plot(
+            [mdates.date2num(row['timestamp']), mdates.date2num(row['timestamp'])],
+            [row['low'], row['high']],
+            color=color,
+            linewidth=1
+        )
+
+
+def render(draw, df: pd.DataFrame) -> tuple:
+    """Построение и сохранение PNG как в create_price_chart; (секунды, число artist'ов)"""
+    start = time.perf_counter()
+    fig = Figure(figsize=(10, 6), dpi=100)
+    ax = fig.add_subplot(111)
+    draw(ax, df)
+    ax.axhline(y=df['close'].iloc[-1], color='orange', linewidth=1, alpha=0.5, label='Current')
+    ax.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M\n%d.%m'))
+    ax.xaxis.set_major_locator(mdates.AutoDateLocator())
+    ax.grid(True, alpha=0.3)
+    ax.legend()
+    fig.tight_layout()
+    fig.savefig(io.BytesIO(), format='PNG', dpi=100)
+    artists = len(ax.patches) + len(ax.lines) + len(ax.collections)
+    return time.perf_counter() - start, artists
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--candles', type=int, nargs='+', default=[100, 500, 2000])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    warnings.simplefilter('ignore')
+    rng = np.random.default_rng(args.seed)
+    print(f"{'candles':>8} {'path':>10} {'artists':>8} {'median ms':>10} {'min ms':>8}")
+    for count in args.candles:
+        df = make_candles(count, rng)
+        results = {}
+        for name, draw in (('legacy', legacy_draw_candles), ('vectorized', ChartGenerator.draw_candles)):
+            render(draw, df)  # прогрев
+            runs = [render(draw, df) for _ in range(args.repeat)]
+            times = [seconds * 1000 for seconds, _ in runs]
+            results[name] = statistics.median(times)
+            print(f"{count:>8} {name:>10} {runs[0][1]:>8} {results[name]:>10.1f} {min(times):>8.1f}")
+        print(f"{count:>8} {'speedup':>10} {'':>8} {results['legacy'] / results['vectorized']:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк очистки старых данных: порционное удаление keyset-пагинацией
+(с архивом в Parquet и без) против загрузки ORM-объектов и одного коммита.
+Во время очистки параллельный писатель с настройками бота (busy_timeout)
+раз в 20 мс обновляет баланс игрока - его ожидание и число записей,
+не дождавшихся блокировки, показывают, насколько очистка мешает боту.
+Каждая реализация запускается в отдельном процессе на копии базы
+
+Пример: python benchmarks/bench_cleanup.py --positions 500000
+"""
+
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from sqlalchemy import create_engine, event, insert, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from bench_export import peak_rss_mb
+from database import Base, Position, PositionType, Transaction, User, set_sqlite_pragmas
+from retention import cleanup
+
+USERS = 10_000
+
+
+def seed(path: str, positions: int, old_share: float, rng: np.random.Generator):
+    """Закрытые позиции и по транзакции на каждую; old_share из них старше срока хранения"""
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    now = datetime.utcnow()
+    with sessionmaker(bind=engine)() as db:
+        db.execute(insert(User), [
+            {'id': i + 1, 'telegram_id': 10_000_000 + i, 'balance': 2000.0} for i in range(USERS)
+        ])
+        for start in range(0, positions, 50_000):
+            size = min(50_000, positions - start)
+            age = np.where(rng.random(size) < old_share, rng.integers(31, 365, size), rng.integers(0, 29, size))
+            closed_at = [now - timedelta(days=int(days)) for days in age]
+            db.execute(insert(Position), [
+                {
+                    'user_id': (start + i) % USERS + 1,
+                    'symbol': 'BTC/USDT',
+                    'position_type': PositionType.LONG if i % 2 else PositionType.SHORT,
+                    'entry_price': 50_000.0,
+                    'current_price': 51_000.0,
+                    'amount': 0.001,
+                    'leverage': 10,
+                    'margin': 5.0,
+                    'liquidation_price': 45_000.0,
+                    'realized_pnl': 1.0,
+                    'is_open': False,
+                    'opened_at': closed_at[i],
+                    'closed_at': closed_at[i],
+                }
+                for i in range(size)
+            ])
+            db.execute(insert(Transaction), [
+                {
+                    'user_id': (start + i) % USERS + 1, 'type': 'trade', 'amount': 1.0,
+                    'balance_before': 2000.0, 'balance_after': 2001.0,
+                    'details': {'position': start + i}, 'created_at': closed_at[i],
+                }
+                for i in range(size)
+            ])
+        db.commit()
+    engine.dispose()
+
+
+def legacy_cleanup(db, cutoff):
+    """Прежняя реализация cleanup_old_data"""
+    deleted = 0
+    for position in db.query(Position).filter(Position.is_open == False, Position.closed_at < cutoff).all():
+        db.delete(position)
+        deleted += 1
+    for transaction in db.query(Transaction).filter(Transaction.created_at < cutoff).all():
+        db.delete(transaction)
+        deleted += 1
+    db.commit()
+    return deleted
+
+
+def writer(path: str, stop: threading.Event, latencies: list, failures: list):
+    """Запись, которую делает бот во время очистки: короткий UPDATE с коммитом"""
+    engine = create_engine(f"sqlite:///{path}")
+    event.listen(engine, 'connect', set_sqlite_pragmas)
+    with engine.connect() as connection:
+        while not stop.is_set():
+            started = time.perf_counter()
+            try:
+                connection.execute(text("UPDATE users SET balance = balance + 1 WHERE id = 1"))
+                connection.commit()
+            except OperationalError:
+                # database is locked: бот получил бы ошибку вместо записи
+                connection.rollback()
+                failures.append(time.perf_counter() - started)
+            latencies.append(time.perf_counter() - started)
+            time.sleep(0.02)
+    engine.dispose()
+
+
+def run_impl(path: str, name: str, archive_dir: str, results):
+    """Очистка в свежем процессе: время, пиковый RSS и задержки писателя"""
+    engine = create_engine(f"sqlite:///{path}", connect_args={'timeout': 600})
+    cutoff = datetime.utcnow() - timedelta(days=30)
+    stop, latencies, failures = threading.Event(), [], []
+    thread = threading.Thread(target=writer, args=(path, stop, latencies, failures))
+    thread.start()
+    started = time.perf_counter()
+    with sessionmaker(bind=engine)() as db:
+        if name == 'legacy':
+            deleted = legacy_cleanup(db, cutoff)
+        else:
+            deleted = sum(cleanup(db, cutoff, archive_dir=archive_dir if name == 'archive' else None).values())
+    seconds = time.perf_counter() - started
+    stop.set()
+    thread.join()
+    size = sum(os.path.getsize(os.path.join(archive_dir, f)) for f in os.listdir(archive_dir)) if name == 'archive' else 0
+    results.put((
+        name, deleted, seconds, peak_rss_mb(), max(latencies), float(np.percentile(latencies, 99)),
+        len(failures), size / 2 ** 20
+    ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--positions', type=int, default=500_000)
+    parser.add_argument('--old-share', type=float, default=0.8)
+    parser.add_argument('--impls', nargs='+', default=['batched', 'archive', 'legacy'])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, 'source.db')
+        seed(source, args.positions, args.old_share, np.random.default_rng(42))
+
+        context = multiprocessing.get_context('spawn')
+        results = context.Queue()
+        print(f"{args.positions} closed positions and transactions, {args.old_share:.0%} older than 30 days")
+        print(f"{'impl':>8} {'deleted':>9} {'seconds':>9} {'peak MB':>9} {'max wait':>9} {'p99 wait':>9} {'failed':>7} {'arch MB':>8}")
+        for name in args.impls:
+            path = os.path.join(tmp, f"{name}.db")
+            shutil.copy(source, path)
+            archive_dir = os.path.join(tmp, f"{name}-archive")
+            process = context.Process(target=run_impl, args=(path, name, archive_dir, results))
+            process.start()
+            process.join()
+            if process.exitcode:
+                print(f"{name:>8} failed with exit code {process.exitcode}")
+                continue
+            impl, deleted, seconds, peak, worst, p99, failed, size = results.get()
+            print(f"{impl:>8} {deleted:>9} {seconds:>9.2f} {peak:>9.0f} {worst:>8.3f}s {p99:>8.3f}s {failed:>7} {size:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк админской выгрузки: потоковая запись курсором во временный файл
+(XLSX constant_memory и gzip CSV) против DataFrame из всех строк в BytesIO.
+Каждая реализация запускается в отдельном процессе; пиковый RSS - VmHWM процесса
+
+Пример: python benchmarks/bench_export.py --users 200000
+"""
+
+import argparse
+import io
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from bench_stop_orders import POSITIONS_PER_USER, seed
+from crypto_data import crypto_data
+from database import Base, User, Position
+from exports import export_admin_data
+from utils import position_mark_price, position_unrealized_pnl
+
+
+def legacy_export(db):
+    """Прежняя реализация admin_export (синхронная сессия вместо асинхронной)"""
+    users_df = pd.DataFrame([
+        {
+            'ID': user.id, 'Telegram ID': user.telegram_id, 'Username': user.username,
+            'Balance': user.balance, 'Total Profit': user.total_profit, 'Total Trades': user.total_trades,
+            'Win Rate': user.win_rate, 'Rank': user.rank, 'Registered': user.registered_at,
+            'Last Active': user.last_active,
+        }
+        for user in db.query(User).all()
+    ])
+    positions_df = pd.DataFrame([
+        {
+            'ID': pos.id, 'User ID': pos.user_id, 'Symbol': pos.symbol, 'Type': pos.position_type.value,
+            'Leverage': pos.leverage, 'Entry Price': pos.entry_price,
+            'Current Price': position_mark_price(pos, crypto_data) if pos.is_open else pos.current_price,
+            'Amount': pos.amount, 'Margin': pos.margin,
+            'Unrealized PnL': position_unrealized_pnl(pos, crypto_data) if pos.is_open else pos.unrealized_pnl,
+            'Realized PnL': pos.realized_pnl, 'Liquidation Price': pos.liquidation_price,
+            'Stop Loss': pos.stop_loss, 'Take Profit': pos.take_profit, 'Is Open': pos.is_open,
+            'Opened At': pos.opened_at, 'Closed At': pos.closed_at,
+        }
+        for pos in db.query(Position).all()
+    ])
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
+        users_df.to_excel(writer, sheet_name='Users', index=False)
+        positions_df.to_excel(writer, sheet_name='Positions', index=False)
+    return [('trading_game_data.xlsx', output)]
+
+
+def peak_rss_mb() -> float:
+    """Пиковый RSS процесса (ru_maxrss на Linux переживает exec и показывает родителя)"""
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_impl(path: str, name: str, results):
+    """Выгрузка в свежем процессе: время, пиковый RSS и размер файлов"""
+    engine = create_engine(f"sqlite:///{path}")
+    baseline = peak_rss_mb()
+    started = time.perf_counter()
+    with sessionmaker(bind=engine)() as db:
+        if name == 'legacy':
+            files = legacy_export(db)
+        else:
+            files = export_admin_data(db, crypto_data, name)
+    seconds = time.perf_counter() - started
+    size = 0
+    for _, output in files:
+        output.seek(0, os.SEEK_END)
+        size += output.tell()
+        output.close()
+    results.put((name, seconds, baseline, peak_rss_mb(), size / 2 ** 20))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=200_000)
+    parser.add_argument('--impls', nargs='+', default=['xlsx', 'csv', 'legacy'])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'export.db')
+        engine = create_engine(f"sqlite:///{path}")
+        Base.metadata.create_all(bind=engine)
+        seed(sessionmaker(bind=engine), args.users * POSITIONS_PER_USER, 0.5, np.random.default_rng(42))
+        engine.dispose()
+
+        context = multiprocessing.get_context('spawn')
+        results = context.Queue()
+        print(f"{args.users} users, {args.users * POSITIONS_PER_USER} positions")
+        print(f"{'impl':>8} {'seconds':>9} {'base MB':>9} {'peak MB':>9} {'file MB':>9}")
+        for name in args.impls:
+            process = context.Process(target=run_impl, args=(path, name, results))
+            process.start()
+            process.join()
+            if process.exitcode:
+                print(f"{name:>8} failed with exit code {process.exitcode}")
+                continue
+            impl, seconds, baseline, peak, size = results.get()
+            print(f"{impl:>8} {seconds:>9.2f} {baseline:>9.0f} {peak:>9.0f} {size:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
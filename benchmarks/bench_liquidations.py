@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк проверки ликвидаций: векторизованный движок против построчного ORM-цикла
+
+Пример: python benchmarks/bench_liquidations.py --sizes 10000 100000 1000000
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from database import Base, User, Position, PositionType
+from liquidation_engine import LiquidationEngine, refresh_pnl
+
+PRICES = {'BTC/USDT': 45000.0, 'ETH/USDT': 2400.0, 'BNB/USDT': 300.0}
+POSITIONS_PER_USER = 5
+
+
+def seed(session_factory, size: int, rng: np.random.Generator):
+    """Заполнение базы пользователями и открытыми позициями"""
+    users = max(1, size // POSITIONS_PER_USER)
+    symbols = list(PRICES)
+    with session_factory() as db:
+        db.execute(insert(User), [
+            {'id': i + 1, 'telegram_id': 10_000_000 + i, 'balance': 2000.0}
+            for i in range(users)
+        ])
+        symbol_idx = rng.integers(0, len(symbols), size)
+        is_long = rng.random(size) < 0.5
+        # ~1% позиций оказываются за ценой ликвидации
+        breach = rng.random(size) < 0.01
+        rows = []
+        for i in range(size):
+            symbol = symbols[symbol_idx[i]]
+            price = PRICES[symbol]
+            offset = 0.95 if breach[i] else 1.10
+            if is_long[i]:
+                liquidation_price = price / offset
+            else:
+                liquidation_price = price * offset
+            rows.append({
+                'user_id': i % users + 1,
+                'symbol': symbol,
+                'position_type': PositionType.LONG if is_long[i] else PositionType.SHORT,
+                'entry_price': price,
+                'current_price': price,
+                'amount': 1.0,
+                'leverage': 10,
+                'margin': 100.0,
+                'liquidation_price': liquidation_price,
+                'is_open': True,
+            })
+            if len(rows) == 50_000:
+                db.execute(insert(Position), rows)
+                rows = []
+        if rows:
+            db.execute(insert(Position), rows)
+        db.commit()
+
+
+def legacy_check_liquidations(db, prices):
+    """Прежняя реализация: ORM-объекты и расчет по одной позиции"""
+    liquidated = []
+    for position in db.query(Position).filter(Position.is_open == True).all():
+        current_price = prices[position.symbol]
+        is_long = position.position_type == PositionType.LONG
+        if (is_long and current_price <= position.liquidation_price) or \
+           (not is_long and current_price >= position.liquidation_price):
+            position.is_open = False
+            position.current_price = current_price
+            position.realized_pnl = -position.margin
+            position.user.balance = max(0, position.user.balance + position.realized_pnl)
+            liquidated.append(position)
+        position.current_price = current_price
+        sign = 1 if is_long else -1
+        position.unrealized_pnl = sign * (current_price - position.entry_price) * \
+            position.amount * position.leverage
+    db.commit()
+    return liquidated
+
+
+def vectorized_check_liquidations(db, prices):
+    refresh_pnl(db, prices)
+    liquidated = LiquidationEngine().run(db, prices)
+    db.commit()
+    return liquidated
+
+
+def run_case(size: int, legacy: bool):
+    with tempfile.TemporaryDirectory() as tmp:
+        seed_path = os.path.join(tmp, 'seed.db')
+        engine = create_engine(f"sqlite:///{seed_path}")
+        Base.metadata.create_all(bind=engine)
+        seed(sessionmaker(bind=engine), size, np.random.default_rng(42))
+        engine.dispose()
+
+        checks = [('vectorized', vectorized_check_liquidations)]
+        if legacy:
+            checks.append(('legacy', legacy_check_liquidations))
+
+        results = {}
+        for name, check in checks:
+            # Каждая реализация работает на своей копии данных
+            path = os.path.join(tmp, f'{name}.db')
+            shutil.copy(seed_path, path)
+            engine = create_engine(f"sqlite:///{path}")
+            with sessionmaker(bind=engine)() as db:
+                started = time.perf_counter()
+                liquidated = check(db, PRICES)
+                results[name] = (time.perf_counter() - started, len(liquidated))
+            engine.dispose()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--legacy-limit', type=int, default=100_000,
+                        help='максимальный размер, на котором запускается старый цикл')
+    args = parser.parse_args()
+
+    print(f"{'positions':>10} {'impl':>11} {'seconds':>9} {'liquidated':>11}")
+    for size in args.sizes:
+        results = run_case(size, legacy=size <= args.legacy_limit)
+        for name, (seconds, count) in results.items():
+            print(f"{size:>10} {name:>11} {seconds:>9.3f} {count:>11}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк живого рейтинга: загрузка, обновление очка, ранг и таблица лидеров
+против полного пересчета calculate_rankings
+
+Пример: python benchmarks/bench_live_leaderboard.py --sizes 100000 1000000 --ops 20000
+"""
+
+import argparse
+import gc
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from bench_rankings import seed
+from database import Base
+from live_leaderboard import LiveLeaderboard
+from utils import calculate_rankings
+
+
+def per_op_us(func, args):
+    started = time.perf_counter()
+    for arg in args:
+        func(*arg)
+    return (time.perf_counter() - started) / len(args) * 1e6
+
+
+def run_case(size: int, ops: int):
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'users.db')}")
+        Base.metadata.create_all(bind=engine)
+        seed(sessionmaker(bind=engine), size, np.random.default_rng(42))
+
+        with sessionmaker(bind=engine)() as db:
+            board = LiveLeaderboard()
+            started = time.perf_counter()
+            board.load(db)
+            seconds = time.perf_counter() - started
+            # Память считается отдельной загрузкой: tracemalloc замедляет ее в разы
+            board = LiveLeaderboard()
+            gc.collect()
+            tracemalloc.start()
+            board.load(db)
+            memory = tracemalloc.get_traced_memory()[0] / 2 ** 20
+            tracemalloc.stop()
+            results.append(('load', f'{seconds:.3f} s', f'{memory:.0f} MB'))
+
+            rng = random.Random(1)
+            user_ids = list(board.scores.scores)
+            updates = [(rng.choice(user_ids), rng.uniform(-5000, 100000)) for _ in range(ops)]
+            lookups = [(rng.choice(user_ids),) for _ in range(ops)]
+            results.append(('set score', f'{per_op_us(board.set_score, updates):.1f} us', ''))
+            results.append(('rank', f'{per_op_us(board.rank, lookups):.1f} us', ''))
+            results.append(('top 20', f'{per_op_us(board.top, [(20,)] * ops):.1f} us', ''))
+            refreshes = [([user_id for (user_id,) in lookups[i:i + 50]],) for i in range(0, min(ops, 5000), 50)]
+            results.append(('refresh 50', f'{per_op_us(lambda ids: board.refresh_users(db, ids), refreshes) / 1000:.2f} ms', ''))
+
+            # Сверка исправляет случайные очки, записанные выше в обход базы
+            started = time.perf_counter()
+            corrections = board.reconcile(db)
+            results.append(('reconcile', f'{time.perf_counter() - started:.3f} s', f'{corrections} fixed'))
+
+            started = time.perf_counter()
+            calculate_rankings(db)
+            results.append(('full SQL', f'{time.perf_counter() - started:.3f} s', ''))
+        engine.dispose()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100_000, 1_000_000])
+    parser.add_argument('--ops', type=int, default=20_000, help='операций на каждый замер')
+    args = parser.parse_args()
+
+    print(f"{'users':>10} {'step':>11} {'time':>12} {'':>12}")
+    for size in args.sizes:
+        for step, value, extra in run_case(size, args.ops):
+            print(f"{size:>10} {step:>11} {value:>12} {extra:>12}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк исполнения лимитных ордеров: книги, отсортированные по цене, против
+построчного просмотра всех ожидающих ордеров на каждом тике
+
+Пример: python benchmarks/bench_matching.py --sizes 100000 1000000 --move 0.01
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from database import Base, User, Order, OrderType, OrderSide, Position, PositionType
+from matching_engine import MatchingEngine, order_margin
+
+PRICES = {'BTC/USDT': 45000.0, 'ETH/USDT': 2400.0, 'BNB/USDT': 300.0}
+ORDERS_PER_USER = 5
+
+
+def seed(session_factory, size: int, rng: np.random.Generator):
+    """Ожидающие ордера: покупки ниже текущей цены, продажи выше (до 10%)"""
+    users = max(1, size // ORDERS_PER_USER)
+    symbols = list(PRICES)
+    with session_factory() as db:
+        db.execute(insert(User), [
+            {'id': i + 1, 'telegram_id': 10_000_000 + i, 'balance': 2000.0}
+            for i in range(users)
+        ])
+        symbol_idx = rng.integers(0, len(symbols), size)
+        is_buy = rng.random(size) < 0.5
+        distance = rng.uniform(0.0005, 0.10, size)
+        rows = []
+        for i in range(size):
+            price = PRICES[symbols[symbol_idx[i]]]
+            rows.append({
+                'user_id': i % users + 1,
+                'symbol': symbols[symbol_idx[i]],
+                'order_type': OrderType.LIMIT,
+                'side': OrderSide.BUY if is_buy[i] else OrderSide.SELL,
+                'price': round(price * (1 - distance[i] if is_buy[i] else 1 + distance[i]), 2),
+                'amount': 100.0,
+                'leverage': 5,
+                'filled': False,
+            })
+            if len(rows) == 50_000:
+                db.execute(insert(Order), rows)
+                rows = []
+        if rows:
+            db.execute(insert(Order), rows)
+        db.commit()
+
+
+def legacy_match(db, prices):
+    """Построчная реализация: все ожидающие ордера из базы и проверка каждого"""
+    filled = []
+    orders = db.query(Order).filter(Order.filled == False, Order.order_type == OrderType.LIMIT).all()
+    for order in orders:
+        price = prices[order.symbol]
+        is_buy = order.side == OrderSide.BUY
+        if (is_buy and price <= order.price) or (not is_buy and price >= order.price):
+            order.filled = True
+            db.add(Position(
+                user_id=order.user_id, symbol=order.symbol,
+                position_type=PositionType.LONG if is_buy else PositionType.SHORT,
+                entry_price=order.price, current_price=order.price, amount=order.amount,
+                leverage=order.leverage, margin=order_margin(order.amount, order.leverage),
+                liquidation_price=order.price, is_open=True,
+            ))
+            filled.append(order)
+    db.commit()
+    return filled
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - started, result
+
+
+def run_case(size: int, move: float, legacy: bool):
+    # Тик без пересечений и тик, сдвигающий цены вниз на move (исполняются покупки)
+    quiet = dict(PRICES)
+    moved = {symbol: price * (1 - move) for symbol, price in PRICES.items()}
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'orders.db')
+        engine = create_engine(f"sqlite:///{path}")
+        Base.metadata.create_all(bind=engine)
+        session_factory = sessionmaker(bind=engine)
+        seed(session_factory, size, np.random.default_rng(42))
+
+        with session_factory() as db:
+            matcher = MatchingEngine()
+            seconds, _ = timed(matcher.load, db)
+            results.append(('books', 'load', seconds, len(matcher)))
+
+            def tick(prices):
+                filled = matcher.match(db, prices)
+                db.commit()
+                return filled
+
+            seconds, filled = timed(tick, quiet)
+            results.append(('books', 'quiet tick', seconds, len(filled)))
+            seconds, filled = timed(tick, moved)
+            results.append(('books', 'moved tick', seconds, len(filled)))
+
+        if legacy:
+            engine.dispose()
+            engine = create_engine(f"sqlite:///{path}")
+            # Исполненные книгами ордера возвращаем, чтобы сравнение было на тех же данных
+            with sessionmaker(bind=engine)() as db:
+                db.query(Order).update({Order.filled: False})
+                db.query(Position).delete()
+                db.commit()
+                seconds, filled = timed(legacy_match, db, quiet)
+                results.append(('legacy', 'quiet tick', seconds, len(filled)))
+                seconds, filled = timed(legacy_match, db, moved)
+                results.append(('legacy', 'moved tick', seconds, len(filled)))
+        engine.dispose()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100_000, 1_000_000])
+    parser.add_argument('--move', type=float, default=0.01, help='относительное падение цены на втором тике')
+    parser.add_argument('--legacy-limit', type=int, default=100_000,
+                        help='максимальный размер, на котором запускается построчный просмотр')
+    args = parser.parse_args()
+
+    print(f"{'orders':>10} {'impl':>7} {'step':>11} {'seconds':>9} {'orders':>9}")
+    for size in args.sizes:
+        for impl, step, seconds, count in run_case(size, args.move, legacy=size <= args.legacy_limit):
+            print(f"{size:>10} {impl:>7} {step:>11} {seconds:>9.3f} {count:>9}")
+
+
+if __name__ == '__main__':
+    main()
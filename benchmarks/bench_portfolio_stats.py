@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк экрана портфеля: чтение поддерживаемых агрегатов игрока против загрузки
+его открытых позиций в ORM-объекты и суммирования в Python
+
+Пример: python benchmarks/bench_portfolio_stats.py --users 100000 --lookups 5000
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from bench_stop_orders import PRICES, POSITIONS_PER_USER, seed
+from database import Base, Position
+import user_stats
+
+
+def legacy_portfolio_stats(user_id: int, db, prices):
+    """Прежняя реализация calculate_portfolio_stats"""
+    positions = db.query(Position).filter(Position.user_id == user_id, Position.is_open == True).all()
+    total_value = total_pnl = total_margin = 0
+    for position in positions:
+        price = prices.get(position.symbol) or position.current_price
+        total_value += position.amount * price * position.leverage
+        total_pnl += position.unrealized_pnl
+        total_margin += position.margin
+    return {
+        'total_value': total_value,
+        'total_pnl': total_pnl,
+        'total_margin': total_margin,
+        'open_positions': len(positions),
+        'average_leverage': np.mean([p.leverage for p in positions]) if positions else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=100_000)
+    parser.add_argument('--lookups', type=int, default=5_000, help='просмотров портфеля на замер')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'portfolio.db')}")
+        Base.metadata.create_all(bind=engine)
+        session_factory = sessionmaker(bind=engine)
+        seed(session_factory, args.users * POSITIONS_PER_USER, 0.0, np.random.default_rng(42))
+
+        with session_factory() as db:
+            started = time.perf_counter()
+            user_stats.backfill(db)
+            db.commit()
+            print(f"backfill {args.users} users: {time.perf_counter() - started:.2f} s")
+
+            rng = random.Random(1)
+            user_ids = [rng.randint(1, args.users) for _ in range(args.lookups)]
+            for name, func in (
+                ('aggregates', lambda uid: user_stats.portfolio_stats(db, uid, PRICES)),
+                ('legacy', lambda uid: legacy_portfolio_stats(uid, db, PRICES)),
+            ):
+                started = time.perf_counter()
+                for user_id in user_ids:
+                    func(user_id)
+                    db.expunge_all()
+                per_call = (time.perf_counter() - started) / len(user_ids) * 1e6
+                print(f"{name:>10}: {per_call:.0f} us per portfolio view")
+        engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Латентность горячих запросов Position/Transaction без индексов и с ними
+
+Пример: python benchmarks/bench_queries.py --rows 1000000 --samples 200
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from sqlalchemy import insert, select, text
+from sqlalchemy.orm import sessionmaker
+
+from database import Base, User, Position, PositionType, Transaction, create_db_engine, ensure_indexes
+
+SYMBOLS = ['BTC/USDT', 'ETH/USDT', 'BNB/USDT']
+OPEN_SHARE = 0.05  # доля открытых позиций
+BATCH = 50_000
+
+
+def seed(db_engine, rows: int, users: int, rng: np.random.Generator):
+    """Заполнение rows позиций и rows транзакций"""
+    now = datetime.utcnow()
+    with db_engine.begin() as connection:
+        connection.execute(insert(User), [
+            {'id': i + 1, 'telegram_id': i + 1, 'balance': 2000.0} for i in range(users)
+        ])
+        for start in range(0, rows, BATCH):
+            size = min(BATCH, rows - start)
+            user_ids = rng.integers(1, users + 1, size)
+            is_open = rng.random(size) < OPEN_SHARE
+            symbols = rng.integers(0, len(SYMBOLS), size)
+            ages = rng.integers(0, 90 * 24 * 3600, size)
+            connection.execute(insert(Position), [
+                {
+                    'user_id': int(user_ids[i]),
+                    'symbol': SYMBOLS[symbols[i]],
+                    'position_type': PositionType.LONG,
+                    'entry_price': 100.0,
+                    'current_price': 100.0,
+                    'amount': 1.0,
+                    'leverage': 2,
+                    'margin': 10.0,
+                    'liquidation_price': 50.0,
+                    'is_open': bool(is_open[i]),
+                    'opened_at': now - timedelta(seconds=int(ages[i])),
+                    'closed_at': None if is_open[i] else now - timedelta(seconds=int(ages[i]) // 2),
+                }
+                for i in range(size)
+            ])
+            connection.execute(insert(Transaction), [
+                {
+                    'user_id': int(user_ids[i]),
+                    'type': 'trade',
+                    'amount': 1.0,
+                    'balance_before': 0.0,
+                    'balance_after': 1.0,
+                    'created_at': now - timedelta(seconds=int(ages[i])),
+                }
+                for i in range(size)
+            ])
+
+
+def hot_queries(users: int):
+    """Горячие запросы обработчиков и фоновых задач"""
+    return {
+        'user open positions': lambda uid: select(Position).where(
+            Position.user_id == uid, Position.is_open == True
+        ),
+        'open by symbol': lambda uid: select(Position.id, Position.liquidation_price).where(
+            Position.is_open == True, Position.symbol == SYMBOLS[uid % len(SYMBOLS)]
+        ),
+        'closed history': lambda uid: select(Position).where(
+            Position.user_id == uid, Position.is_open == False
+        ).order_by(Position.closed_at.desc()).limit(20),
+        'transactions': lambda uid: select(Transaction).where(
+            Transaction.user_id == uid
+        ).order_by(Transaction.created_at.desc()).limit(20),
+    }
+
+
+def measure(db_engine, users: int, samples: int, rng: np.random.Generator):
+    session_factory = sessionmaker(bind=db_engine)
+    results = {}
+    with session_factory() as db:
+        for name, build in hot_queries(users).items():
+            timings = []
+            for uid in rng.integers(1, users + 1, samples):
+                started = time.perf_counter()
+                db.execute(build(int(uid))).all()
+                timings.append((time.perf_counter() - started) * 1000)
+            results[name] = (np.percentile(timings, 50), np.percentile(timings, 99))
+    return results
+
+
+def drop_indexes(db_engine):
+    with db_engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                connection.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--users', type=int, default=50_000)
+    parser.add_argument('--samples', type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_engine = create_db_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(bind=db_engine)
+        drop_indexes(db_engine)
+        seed(db_engine, args.rows, args.users, np.random.default_rng(7))
+
+        before = measure(db_engine, args.users, args.samples, np.random.default_rng(1))
+        started = time.perf_counter()
+        ensure_indexes(db_engine)
+        build_time = time.perf_counter() - started
+        with db_engine.begin() as connection:
+            connection.execute(text("ANALYZE"))
+        after = measure(db_engine, args.users, args.samples, np.random.default_rng(1))
+        db_engine.dispose()
+
+    print(f"rows={args.rows} users={args.users} index build {build_time:.1f}s")
+    print(f"{'query':>20} {'p50 before':>11} {'p99 before':>11} {'p50 after':>10} {'p99 after':>10}  (ms)")
+    for name in before:
+        print(f"{name:>20} {before[name][0]:>11.2f} {before[name][1]:>11.2f} "
+              f"{after[name][0]:>10.2f} {after[name][1]:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
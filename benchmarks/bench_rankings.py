@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк расчета рейтинга: RANK() OVER и UPDATE ... FROM в базе против загрузки
+всех игроков в ORM-объекты, сортировки в Python и записи рангов по одному
+
+Пример: python benchmarks/bench_rankings.py --sizes 100000 1000000 --legacy-limit 200000
+"""
+
+import argparse
+import gc
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from database import Base, User
+from utils import calculate_rankings
+
+
+def seed(session_factory, size: int, rng: np.random.Generator):
+    """Игроки со случайной статистикой; около 10% еще не торговали"""
+    total_trades = rng.integers(0, 200, size)
+    total_trades[rng.random(size) < 0.1] = 0
+    total_profit = np.round(rng.normal(0, 500, size), 2).tolist()
+    win_rate = np.round(rng.uniform(0, 100, size), 1).tolist()
+    total_trades = total_trades.tolist()
+    with session_factory() as db:
+        for start in range(0, size, 50_000):
+            db.execute(insert(User), [
+                {
+                    'id': i + 1,
+                    'telegram_id': 10_000_000 + i,
+                    'first_name': f'user{i}',
+                    'total_profit': total_profit[i],
+                    'win_rate': win_rate[i],
+                    'total_trades': total_trades[i],
+                }
+                for i in range(start, min(start + 50_000, size))
+            ])
+        db.commit()
+
+
+def legacy_calculate_rankings(db):
+    """Прежняя реализация calculate_rankings"""
+    users = db.query(User).filter(User.total_trades > 0).all()
+    ranked_users = []
+    for user in users:
+        score = (
+            user.total_profit * 0.5 +
+            user.win_rate * 1000 +
+            user.total_trades * 10
+        )
+        ranked_users.append({'user': user, 'score': score})
+    ranked_users.sort(key=lambda x: x['score'], reverse=True)
+    for i, item in enumerate(ranked_users, 1):
+        item['user'].rank = i
+    db.commit()
+    return ranked_users[:20]
+
+
+def measure(func, db):
+    """Время и пиковая память Python-кучи (tracemalloc) одного пересчета"""
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    func(db)
+    seconds = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak / 2 ** 20
+
+
+def run_case(size: int, legacy: bool):
+    with tempfile.TemporaryDirectory() as tmp:
+        seed_path = os.path.join(tmp, 'seed.db')
+        engine = create_engine(f"sqlite:///{seed_path}")
+        Base.metadata.create_all(bind=engine)
+        seed(sessionmaker(bind=engine), size, np.random.default_rng(42))
+        engine.dispose()
+
+        implementations = {'sql': calculate_rankings}
+        if legacy:
+            implementations['legacy'] = legacy_calculate_rankings
+        results = {}
+        for name, func in implementations.items():
+            # Каждая реализация работает на своей копии данных
+            path = os.path.join(tmp, f'{name}.db')
+            shutil.copy(seed_path, path)
+            engine = create_engine(f"sqlite:///{path}")
+            with sessionmaker(bind=engine)() as db:
+                first = measure(func, db)
+                # Повторный пересчет без изменений: SQL-версия не переписывает ранги
+                repeat = measure(func, db)
+            results[name] = first + repeat
+            engine.dispose()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100_000, 1_000_000])
+    parser.add_argument('--legacy-limit', type=int, default=200_000,
+                        help='максимальный размер, на котором запускается прежняя реализация')
+    args = parser.parse_args()
+
+    print(f"{'users':>10} {'impl':>7} {'first s':>9} {'peak MB':>9} {'repeat s':>9} {'peak MB':>9}")
+    for size in args.sizes:
+        results = run_case(size, legacy=size <= args.legacy_limit)
+        for name, (seconds, peak, repeat_seconds, repeat_peak) in results.items():
+            print(f"{size:>10} {name:>7} {seconds:>9.3f} {peak:>9.1f} {repeat_seconds:>9.3f} {repeat_peak:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк исполнения стоп-лоссов и тейк-профитов: индекс уровней + векторизованный
+движок против построчного ORM-цикла
+
+Пример: python benchmarks/bench_stop_orders.py --sizes 10000 100000 --trigger-share 0.05
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from database import Base, User, Position, PositionType, Transaction
+from price_index import PriceIndex
+from trigger_engine import TriggerEngine
+
+PRICES = {'BTC/USDT': 45000.0, 'ETH/USDT': 2400.0, 'BNB/USDT': 300.0}
+POSITIONS_PER_USER = 5
+
+
+def seed(session_factory, size: int, trigger_share: float, rng: np.random.Generator):
+    """Пользователи и открытые позиции со стоп-лоссом и тейк-профитом"""
+    users = max(1, size // POSITIONS_PER_USER)
+    symbols = list(PRICES)
+    with session_factory() as db:
+        db.execute(insert(User), [
+            {'id': i + 1, 'telegram_id': 10_000_000 + i, 'balance': 2000.0}
+            for i in range(users)
+        ])
+        symbol_idx = rng.integers(0, len(symbols), size)
+        is_long = rng.random(size) < 0.5
+        triggered = rng.random(size) < trigger_share
+        rows = []
+        for i in range(size):
+            symbol = symbols[symbol_idx[i]]
+            price = PRICES[symbol]
+            # Сработавшие позиции: уровень стоп-лосса уже пересечен текущей ценой
+            stop_offset = 0.02 if triggered[i] else -0.05
+            if is_long[i]:
+                stop_loss, take_profit = price * (1 + stop_offset), price * 1.10
+            else:
+                stop_loss, take_profit = price * (1 - stop_offset), price * 0.90
+            rows.append({
+                'user_id': i % users + 1,
+                'symbol': symbol,
+                'position_type': PositionType.LONG if is_long[i] else PositionType.SHORT,
+                'entry_price': price,
+                'current_price': price,
+                'amount': 0.001,
+                'leverage': 10,
+                'margin': 100.0,
+                'liquidation_price': price * (0.5 if is_long[i] else 1.5),
+                'stop_loss': stop_loss,
+                'take_profit': take_profit,
+                'is_open': True,
+            })
+            if len(rows) == 50_000:
+                db.execute(insert(Position), rows)
+                rows = []
+        if rows:
+            db.execute(insert(Position), rows)
+        db.commit()
+
+
+def legacy_check_stop_orders(db, prices):
+    """Построчная реализация: ORM-объекты, проверка и закрытие по одной позиции"""
+    closed = []
+    for position in db.query(Position).filter(Position.is_open == True).all():
+        current_price = prices[position.symbol]
+        is_long = position.position_type == PositionType.LONG
+        hit_stop = position.stop_loss and (
+            current_price <= position.stop_loss if is_long else current_price >= position.stop_loss)
+        hit_take = position.take_profit and (
+            current_price >= position.take_profit if is_long else current_price <= position.take_profit)
+        if not (hit_stop or hit_take):
+            continue
+        sign = 1 if is_long else -1
+        pnl = max(sign * (current_price - position.entry_price) * position.amount * position.leverage,
+                  -position.margin)
+        user = position.user
+        balance_before = user.balance
+        user.balance += position.margin + pnl
+        position.is_open = False
+        position.current_price = current_price
+        position.realized_pnl = pnl
+        db.add(Transaction(user_id=user.id, type='trade', amount=position.margin + pnl,
+                           balance_before=balance_before, balance_after=user.balance))
+        closed.append(position)
+    db.commit()
+    return closed
+
+
+def make_vectorized_check(db):
+    """Индекс загружается один раз при старте, на тике - только срез и bulk-закрытие"""
+    index = PriceIndex()
+    index.load(db)
+    engine = TriggerEngine()
+
+    def check(db, prices):
+        candidates = []
+        for symbol, price in prices.items():
+            triggered = index.triggered(symbol, price)
+            candidates += triggered['stop_loss'] + triggered['take_profit']
+        closed = engine.run(db, prices, candidates)
+        db.commit()
+        index.remove_positions(position.id for position in closed)
+        return closed
+
+    return check
+
+
+def run_case(size: int, trigger_share: float, legacy: bool):
+    with tempfile.TemporaryDirectory() as tmp:
+        seed_path = os.path.join(tmp, 'seed.db')
+        engine = create_engine(f"sqlite:///{seed_path}")
+        Base.metadata.create_all(bind=engine)
+        seed(sessionmaker(bind=engine), size, trigger_share, np.random.default_rng(42))
+        engine.dispose()
+
+        names = ['vectorized'] + (['legacy'] if legacy else [])
+        results = {}
+        for name in names:
+            # Каждая реализация работает на своей копии данных
+            path = os.path.join(tmp, f'{name}.db')
+            shutil.copy(seed_path, path)
+            engine = create_engine(f"sqlite:///{path}")
+            with sessionmaker(bind=engine)() as db:
+                check = make_vectorized_check(db) if name == 'vectorized' else legacy_check_stop_orders
+                started = time.perf_counter()
+                closed = check(db, PRICES)
+                results[name] = (time.perf_counter() - started, len(closed))
+            engine.dispose()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000])
+    parser.add_argument('--trigger-share', type=float, default=0.05, help='доля сработавших позиций')
+    parser.add_argument('--legacy-limit', type=int, default=100_000,
+                        help='максимальный размер, на котором запускается построчный цикл')
+    args = parser.parse_args()
+
+    print(f"{'positions':>10} {'impl':>11} {'seconds':>9} {'closed':>8}")
+    for size in args.sizes:
+        results = run_case(size, args.trigger_share, legacy=size <= args.legacy_limit)
+        for name, (seconds, count) in results.items():
+            print(f"{size:>10} {name:>11} {seconds:>9.3f} {count:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест: тысячи одновременных пользователей проходят реальные
+обработчики TradingHandler / PortfolioHandler / ChartHandler через
+поддельные Update/Context на локальной базе и симуляторе рынка
+
+Отчет по каждому обработчику: число вызовов, ошибки, пропускная способность,
+перцентили латентности и конкуренция за базу (время записи, записи дольше
+--lock-threshold-ms, ошибки "database is locked").
+
+Пример: python benchmarks/load_test.py --users 2000 --actions 20
+        python benchmarks/load_test.py --users 500 --tick-interval 0.5 --render-workers 4
+"""
+
+import argparse
+import asyncio
+import contextvars
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from types import SimpleNamespace
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+# Текущий обработчик - для привязки запросов к базе к вызову
+current_handler = contextvars.ContextVar('current_handler', default='other')
+
+
+class HandlerStats:
+    """Метрики одного обработчика"""
+    __slots__ = ('latencies', 'errors', 'db_write_time', 'slow_writes', 'locked')
+
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.db_write_time = 0.0
+        self.slow_writes = 0
+        self.locked = 0
+
+
+class FakeBot:
+    """Telegram Bot API с задержкой сети"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = defaultdict(int)
+
+    async def _call(self, method: str):
+        self.calls[method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def send_message(self, chat_id, text, **kwargs):
+        await self._call('send_message')
+
+    async def send_photo(self, chat_id, photo, caption=None, **kwargs):
+        await self._call('send_photo')
+        return SimpleNamespace(photo=[SimpleNamespace(file_id=f'file-{self.calls["send_photo"]}')])
+
+    async def send_document(self, chat_id, document, **kwargs):
+        await self._call('send_document')
+
+
+class FakeMessage:
+    def __init__(self, bot: FakeBot, chat_id: int):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.text = None
+        self.replies = []
+
+    async def reply_text(self, text=None, **kwargs):
+        await self.bot._call('send_message')
+        self.replies.append(text)
+
+
+class FakeCallbackQuery:
+    def __init__(self, bot: FakeBot, user, message: FakeMessage):
+        self.bot = bot
+        self.from_user = user
+        self.message = message
+        self.data = ''
+
+    async def edit_message_text(self, text=None, reply_markup=None, **kwargs):
+        await self.bot._call('edit_message_text')
+
+    async def answer(self, text=None, **kwargs):
+        await self.bot._call('answer_callback_query')
+
+
+class SimulatedUser:
+    """Пользователь Telegram: поддельные Update и Context, общие для всех его действий"""
+
+    def __init__(self, telegram_id: int, bot: FakeBot):
+        user = SimpleNamespace(id=telegram_id, username=f'user{telegram_id}', first_name='Load', last_name='Test')
+        self.message = FakeMessage(bot, telegram_id)
+        self.query = FakeCallbackQuery(bot, user, self.message)
+        self.update = SimpleNamespace(effective_user=user, message=self.message, callback_query=None)
+        self.context = SimpleNamespace(bot=bot, user_data={})
+
+    def callback(self, data: str):
+        self.query.data = data
+        self.update.callback_query = self.query
+        return self.update
+
+    def text(self, text: str):
+        self.message.text = text
+        self.update.callback_query = None
+        return self.update
+
+
+def instrument_engine(sync_engine, stats, threshold: float):
+    """Учет времени записи и блокировок SQLite по текущему обработчику"""
+    from sqlalchemy import event
+
+    @event.listens_for(sync_engine, 'before_cursor_execute')
+    def before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, 'after_cursor_execute')
+    def after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_start'].pop()
+        if not statement.lstrip().upper().startswith('SELECT'):
+            handler = stats[current_handler.get()]
+            handler.db_write_time += elapsed
+            if elapsed > threshold:
+                handler.slow_writes += 1
+
+    @event.listens_for(sync_engine, 'handle_error')
+    def on_error(exception_context):
+        if exception_context.connection is not None:
+            starts = exception_context.connection.info.get('query_start')
+            if starts:
+                starts.pop()
+        if 'locked' in str(exception_context.original_exception):
+            stats[current_handler.get()].locked += 1
+
+
+async def call(stats, name: str, handler, update, context, user: SimulatedUser):
+    """Вызов обработчика с замером; ответ '❌ Ошибка' тоже считается ошибкой"""
+    current_handler.set(name)
+    replies = len(user.message.replies)
+    start = time.perf_counter()
+    try:
+        await handler(update, context)
+    except Exception:
+        stats[name].errors += 1
+    else:
+        if any(str(reply).startswith('❌ Ошибка') for reply in user.message.replies[replies:]):
+            stats[name].errors += 1
+    stats[name].latencies.append(time.perf_counter() - start)
+
+
+async def run_user(user: SimulatedUser, handlers, stats, args, rng: random.Random):
+    """Регистрация и случайная последовательность действий пользователя"""
+    trading, portfolio, chart, start = handlers
+    coins = args.coins
+
+    async def open_position():
+        coin = rng.choice(coins)
+        side = rng.choice(['long', 'short'])
+        leverage = rng.choice(args.leverage)
+        await call(stats, 'trade_menu', trading.trade_menu, user.callback('trade'), user.context, user)
+        await call(stats, 'select_coin', trading.select_coin, user.callback(f'open_{side}'), user.context, user)
+        await call(stats, 'process_coin_selection', trading.process_coin_selection,
+                   user.callback(f'select_coin_{coin}'), user.context, user)
+        await call(stats, 'process_leverage', trading.process_leverage,
+                   user.callback(f'lev_{coin}_{side}_{leverage}'), user.context, user)
+        await call(stats, 'process_order_type', trading.process_order_type,
+                   user.callback(f'market_{coin}_{side}_{leverage}'), user.context, user)
+        await call(stats, 'process_amount', trading.process_amount,
+                   user.text(str(rng.choice([10, 25, 50, 100]))), user.context, user)
+
+    actions = [
+        (20, open_position),
+        (20, lambda: call(stats, 'my_positions', trading.my_positions, user.callback('my_positions'), user.context, user)),
+        (15, lambda: call(stats, 'portfolio_menu', portfolio.portfolio_menu, user.callback('portfolio'), user.context, user)),
+        (10, lambda: call(stats, 'positions_detail', portfolio.positions_detail, user.callback('positions_detail'), user.context, user)),
+        (10, lambda: call(stats, 'trade_history', portfolio.trade_history, user.callback('trade_history'), user.context, user)),
+        (10, lambda: call(stats, 'balance_command', start.balance_command, user.text('/balance'), user.context, user)),
+        (10, lambda: call(stats, 'show_chart', chart.show_chart,
+                          user.callback(f'chart_{rng.choice(coins)}_{rng.choice(args.timeframes)}'), user.context, user)),
+        (5, lambda: call(stats, 'pnl_chart', chart.pnl_chart, user.callback('pnl_chart'), user.context, user)),
+    ]
+    weights = [weight for weight, _ in actions]
+
+    await call(stats, 'start', start.start, user.text('/start'), user.context, user)
+    for _ in range(args.actions):
+        if args.think_ms:
+            await asyncio.sleep(rng.expovariate(1000 / args.think_ms))
+        _, action = rng.choices(actions, weights)[0]
+        await action()
+
+
+def report(stats, elapsed: float, bot: FakeBot):
+    total = sum(len(s.latencies) for s in stats.values())
+    print(f"\nВсего вызовов: {total} за {elapsed:.1f} с, {total / elapsed:.0f} вызовов/с")
+    print("Bot API: " + ", ".join(f"{method}={count}" for method, count in sorted(bot.calls.items())))
+    print(f"\n{'handler':<24} {'calls':>7} {'err':>5} {'rps':>7} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'p99 ms':>8} {'max ms':>8} {'db write s':>10} {'slow wr':>8} {'locked':>7}")
+    for name, s in sorted(stats.items(), key=lambda item: -len(item[1].latencies)):
+        if s.latencies:
+            ms = np.asarray(s.latencies) * 1000
+            p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+            latency = f"{p50:>8.1f} {p95:>8.1f} {p99:>8.1f} {ms.max():>8.1f}"
+        else:
+            latency = f"{'-':>8} {'-':>8} {'-':>8} {'-':>8}"
+        print(f"{name:<24} {len(s.latencies):>7} {s.errors:>5} {len(s.latencies) / elapsed:>7.1f} {latency} "
+              f"{s.db_write_time:>10.2f} {s.slow_writes:>8} {s.locked:>7}")
+
+
+async def run(args):
+    from database import init_db, engine, async_engine
+    from crypto_data import crypto_data
+    from handlers.trading import TradingHandler
+    from handlers.portfolio import PortfolioHandler
+    from handlers.chart import ChartHandler
+    from handlers.start import StartHandler
+    from price_feed import PriceFeed
+    from render_pool import render_pool
+    from bot import TradingBot, format_liquidations, format_stop_orders, format_filled_orders
+    from notifier import notifier
+
+    init_db()
+    stats = defaultdict(HandlerStats)
+    threshold = args.lock_threshold_ms / 1000
+    instrument_engine(engine, stats, threshold)
+    instrument_engine(async_engine.sync_engine, stats, threshold)
+
+    bot = FakeBot(args.api_latency_ms / 1000)
+    crypto_data.update_prices()
+    await asyncio.to_thread(render_pool.start)
+
+    # Фоновая лента цен с пересчетом PnL и ликвидациями, как в боте
+    feed = None
+    if args.tick_interval > 0:
+        trading_bot = TradingBot('load-test')
+        trading_bot.application = SimpleNamespace(bot=bot)
+        notifier.register('liquidation', format_liquidations)
+        notifier.register('stop_order', format_stop_orders)
+        notifier.register('order_filled', format_filled_orders)
+        notifier.start(bot)
+        feed = PriceFeed(crypto_data, interval=args.tick_interval)
+
+        async def on_ticks(ticks):
+            current_handler.set('price_feed')
+            start = time.perf_counter()
+            await trading_bot.on_price_ticks_pnl(ticks)
+            await trading_bot.on_price_ticks_limit_orders(ticks)
+            await trading_bot.on_price_ticks_stop_orders(ticks)
+            await trading_bot.on_price_ticks_liquidations(ticks)
+            stats['price_feed'].latencies.append(time.perf_counter() - start)
+
+        feed.subscribe(on_ticks)
+        feed.start()
+
+    handlers = (TradingHandler(), PortfolioHandler(), ChartHandler(), StartHandler())
+    rng = random.Random(args.seed)
+    users = [SimulatedUser(1_000_000 + i, bot) for i in range(args.users)]
+
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        run_user(user, handlers, stats, args, random.Random(rng.random())) for user in users
+    ))
+    elapsed = time.perf_counter() - started
+
+    if feed is not None:
+        await feed.stop()
+        await notifier.stop()
+    render_pool.shutdown()
+    report(stats, elapsed, bot)
+    if feed is not None:
+        n = notifier.stats()
+        print(f"\nУведомления: отправлено {n['sent']}, склеено {n['coalesced']}, ошибок {n['failed']}, "
+              f"задержка p50/p95 {n['latency_p50_ms']:.0f}/{n['latency_p95_ms']:.0f} мс")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=1000, help='одновременных пользователей')
+    parser.add_argument('--actions', type=int, default=10, help='действий на пользователя после /start')
+    parser.add_argument('--think-ms', type=float, default=50.0, help='средняя пауза между действиями')
+    parser.add_argument('--api-latency-ms', type=float, default=0.0, help='задержка ответа Bot API')
+    parser.add_argument('--tick-interval', type=float, default=1.0, help='секунд между тиками цен, 0 - без ленты')
+    parser.add_argument('--lock-threshold-ms', type=float, default=20.0, help='запись дольше - ожидание блокировки')
+    parser.add_argument('--render-workers', type=int, default=2)
+    parser.add_argument('--timeframes', nargs='+', default=['15m', '1h', '4h'])
+    parser.add_argument('--leverage', type=int, nargs='+', default=[2, 5, 10])
+    parser.add_argument('--url', help='DATABASE_URL (по умолчанию - временный файл SQLite)')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    # Окружение задается до импорта модулей проекта: Config читается при импорте
+    tmpdir = tempfile.TemporaryDirectory()
+    os.environ['DATABASE_URL'] = args.url or f"sqlite:///{os.path.join(tmpdir.name, 'load_test.db')}"
+    os.environ['PRICE_SOURCE'] = 'simulator'
+    os.environ['SIM_SEED'] = str(args.seed)
+    os.environ['RENDER_WORKERS'] = str(args.render_workers)
+
+    from config import Config
+    args.coins = Config.AVAILABLE_COINS
+
+    try:
+        asyncio.run(run(args))
+    finally:
+        tmpdir.cleanup()
+
+
+if __name__ == '__main__':
+    main()
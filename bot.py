@@ -1,16 +1,23 @@
 import logging
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, filters
-from database import init_db
+from telegram import Update
+from database import init_db, get_db
 from crypto_data import crypto_data
-from utils import check_liquidations
+from liquidation_engine import refresh_pnl
+from price_feed import PriceFeed, SharedPriceSource, create_price_source, publish_prices
+from render_pool import render_pool
+from notifier import notifier
+from live_leaderboard import live_leaderboard
+from utils import check_liquidations, check_stop_orders, match_limit_orders
 from handlers.start import StartHandler
 from handlers.trading import TradingHandler
 from handlers.portfolio import PortfolioHandler
 from handlers.chart import ChartHandler
 from handlers.admin import AdminHandler
+from handlers.leaderboard import LeaderboardHandler
+from webhook import telegram_api_urls, run_webhook
 from config import Config
 import asyncio
-from datetime import datetime
 
 # Настройка логирования
 logging.basicConfig(
@@ -19,71 +26,175 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-class TradingBot:
-    def __init__(self, token: str):
-        self.token = token
-        self.application = None
-        
-    async def check_liquidations_task(self, context):
-        """Фоновая задача проверки ликвидаций"""
-        db = next(get_db())
-        liquidated = check_liquidations(db, crypto_data)
-        
-        if liquidated:
-            for position in liquidated:
-                try:
-                    # Уведомляем пользователя о ликвидации
-                    await context.bot.send_message(
-                        chat_id=position.user.telegram_id,
-                        text=f"""
+# Сколько позиций перечислять в одном уведомлении
+NOTIFY_LIST_LIMIT = 10
+
+def format_liquidations(positions) -> str:
+    """Одно сообщение о ликвидации одной или нескольких позиций пользователя"""
+    lines = [
+        f"""📊 {p.symbol} {p.position_type.upper()} {p.leverage}x
+💰 Потеряно: ${p.margin:.2f}
+🎯 Цена входа: ${p.entry_price:.2f}
+📊 Цена ликвидации: ${p.liquidation_price:.2f}"""
+        for p in positions[:NOTIFY_LIST_LIMIT]
+    ]
+    if len(positions) > NOTIFY_LIST_LIMIT:
+        lines.append(f"...и еще {len(positions) - NOTIFY_LIST_LIMIT}")
+    header = "Ваша позиция была ликвидирована:" if len(positions) == 1 else f"Ликвидировано позиций: {len(positions)}"
+    total_lost = sum(p.margin for p in positions)
+    summary = f"\n\n💸 Всего потеряно: ${total_lost:.2f}" if len(positions) > 1 else ""
+    body = "\n\n".join(lines)
+    return f"""
 ⚠️ ЛИКВИДАЦИЯ!
 
-Ваша позиция была ликвидирована:
+{header}
 
-📊 {position.symbol} {position.position_type.value.upper()} {position.leverage}x
-💰 Потеряно: ${position.margin:.2f}
-🎯 Цена входа: ${position.entry_price:.2f}
-📊 Цена ликвидации: ${position.liquidation_price:.2f}
+{body}{summary}
 
-💸 Новый баланс: ${position.user.balance:.2f}
+💸 Новый баланс: ${positions[-1].balance:.2f}
 
 ⚠️ Снизьте плечо для уменьшения рисков!
-                        """
-                    )
-                except Exception as e:
-                    logger.error(f"Failed to notify user about liquidation: {e}")
+"""
+
+STOP_ORDER_TITLES = {'stop_loss': '⛔ Стоп-лосс', 'take_profit': '🎯 Тейк-профит'}
+
+def format_stop_orders(positions) -> str:
+    """Одно сообщение о позициях, закрытых по стоп-лоссу или тейк-профиту"""
+    lines = [
+        f"""{STOP_ORDER_TITLES[p.reason]}: {p.symbol} {p.position_type.upper()} {p.leverage}x
+🎯 Цена входа: ${p.entry_price:.2f}
+📊 Цена закрытия: ${p.close_price:.2f}
+💰 PnL: ${p.pnl:+.2f}"""
+        for p in positions[:NOTIFY_LIST_LIMIT]
+    ]
+    if len(positions) > NOTIFY_LIST_LIMIT:
+        lines.append(f"...и еще {len(positions) - NOTIFY_LIST_LIMIT}")
+    body = "\n\n".join(lines)
+    return f"""
+✅ Позиции закрыты по заявке:
+
+{body}
+
+💸 Новый баланс: ${positions[-1].balance:.2f}
+"""
+
+def format_filled_orders(orders) -> str:
+    """Одно сообщение об исполненных лимитных ордерах пользователя"""
+    lines = [
+        f"""📊 {o.symbol} {o.position_type.upper()} {o.leverage}x
+🎯 Цена входа: ${o.price:.2f}
+💰 Маржа: ${o.margin:.2f}
+🛑 Ликвидация: ${o.liquidation_price:.2f}"""
+        for o in orders[:NOTIFY_LIST_LIMIT]
+    ]
+    if len(orders) > NOTIFY_LIST_LIMIT:
+        lines.append(f"...и еще {len(orders) - NOTIFY_LIST_LIMIT}")
+    body = "\n\n".join(lines)
+    return f"""
+✅ Лимитный ордер исполнен, позиция открыта:
+
+{body}
+"""
+
+class TradingBot:
+    def __init__(self, token: str, leader_lock=None):
+        self.token = token
+        self.application = None
+        self.price_feed = None
+        # Без блокировки (один процесс) бот всегда ведущий
+        self.leader_lock = leader_lock
+        self.leader_task = None
+        self.leaderboard_task = None
         
-        # Перезапускаем задачу через 30 секунд
-        await asyncio.sleep(30)
-        asyncio.create_task(self.check_liquidations_task(context))
+    def refresh_positions_pnl(self, prices):
+        """Обновление PnL открытых позиций по новым ценам"""
+        db = next(get_db())
+        try:
+            refresh_pnl(db, prices)
+            db.commit()
+        finally:
+            db.close()
+    
+    def store_prices(self):
+        """Публикация текущих цен для остальных процессов"""
+        db = next(get_db())
+        try:
+            publish_prices(db, dict(crypto_data.prices))
+            db.commit()
+        finally:
+            db.close()
+    
+    async def on_price_ticks_publish(self, ticks):
+        """Подписчик ленты цен: цены для процессов, не опрашивающих биржу"""
+        await asyncio.to_thread(self.store_prices)
+    
+    def run_liquidations(self):
+        """Проверка ликвидаций по текущим ценам"""
+        db = next(get_db())
+        try:
+            return check_liquidations(db, crypto_data)
+        finally:
+            db.close()
     
-    async def update_prices_task(self, context):
-        """Фоновая задача обновления цен"""
+    async def on_price_ticks_pnl(self, ticks):
+        """Подписчик ленты цен: пересчет PnL"""
+        prices = {tick.symbol: tick.price for tick in ticks}
+        await asyncio.to_thread(self.refresh_positions_pnl, prices)
+    
+    def run_limit_orders(self):
+        """Исполнение лимитных ордеров по текущим ценам"""
+        db = next(get_db())
+        try:
+            return match_limit_orders(db, crypto_data)
+        finally:
+            db.close()
+    
+    async def on_price_ticks_limit_orders(self, ticks):
+        """Подписчик ленты цен: лимитные ордера и уведомления"""
+        filled = await asyncio.to_thread(self.run_limit_orders)
+        for order in filled:
+            notifier.notify(order.telegram_id, 'order_filled', order)
+    
+    def run_stop_orders(self):
+        """Исполнение стоп-лоссов и тейк-профитов по текущим ценам"""
+        db = next(get_db())
+        try:
+            return check_stop_orders(db, crypto_data)
+        finally:
+            db.close()
+    
+    async def on_price_ticks_stop_orders(self, ticks):
+        """Подписчик ленты цен: стоп-лоссы, тейк-профиты и уведомления"""
+        closed = await asyncio.to_thread(self.run_stop_orders)
+        for position in closed:
+            notifier.notify(position.telegram_id, 'stop_order', position)
+    
+    async def on_price_ticks_liquidations(self, ticks):
+        """Подписчик ленты цен: ликвидации и уведомления"""
+        liquidated = await asyncio.to_thread(self.run_liquidations)
+        await self.notify_liquidations(liquidated)
+    
+    def reconcile_leaderboard(self):
+        """Загрузка живого рейтинга или его сверка с базой"""
+        db = next(get_db())
+        try:
+            return live_leaderboard.reconcile(db)
+        finally:
+            db.close()
+    
+    async def leaderboard_loop(self):
+        """Периодическая сверка живого рейтинга - в каждом процессе, статистику меняет ведущий"""
         while True:
             try:
-                crypto_data.update_prices()
-                
-                # Обновляем PnL открытых позиций
-                db = next(get_db())
-                positions = db.query(Position).filter(Position.is_open == True).all()
-                
-                for position in positions:
-                    current_price = crypto_data.get_current_price(position.symbol)
-                    position.current_price = current_price
-                    position.unrealized_pnl = crypto_data.calculate_pnl(
-                        position.entry_price,
-                        current_price,
-                        position.amount,
-                        position.leverage,
-                        position.position_type.value
-                    )
-                
-                db.commit()
-                
+                await asyncio.to_thread(self.reconcile_leaderboard)
             except Exception as e:
-                logger.error(f"Error in update_prices_task: {e}")
-            
-            await asyncio.sleep(60)  # Обновляем каждую минуту
+                logger.error(f"Live leaderboard reconcile failed: {e}")
+            await asyncio.sleep(Config.LEADERBOARD_RECONCILE_INTERVAL)
+    
+    async def notify_liquidations(self, liquidated):
+        """Уведомление пользователей о ликвидации через очередь уведомлений"""
+        for position in liquidated:
+            notifier.notify(position.telegram_id, 'liquidation', position)
     
     def setup_handlers(self):
         """Настройка обработчиков"""
@@ -108,6 +219,9 @@ class TradingBot:
             # Графики
             *chart_handler.get_handlers(),
             
+            # Рейтинг
+            *LeaderboardHandler.get_handlers(),
+            
             # Админ
             *admin_handler.get_handlers(),
             
@@ -115,32 +229,93 @@ class TradingBot:
             CallbackQueryHandler(start_handler.start, pattern='^back_main$'),
         ])
     
+    def start_background_jobs(self):
+        """PnL, заявки и ликвидации - только в ведущем процессе, чтобы не дублировать записи и уведомления"""
+        if self.leader_lock is not None:
+            self.price_feed.subscribe(self.on_price_ticks_publish)
+        if not Config.PNL_ON_READ:
+            self.price_feed.subscribe(self.on_price_ticks_pnl)
+        # Подписчики вызываются по очереди: стоп-лосс срабатывает раньше ликвидации
+        self.price_feed.subscribe(self.on_price_ticks_limit_orders)
+        self.price_feed.subscribe(self.on_price_ticks_stop_orders)
+        self.price_feed.subscribe(self.on_price_ticks_liquidations)
+        logger.info("Leader: PnL, order matching, stop order and liquidation jobs started")
+    
+    async def acquire_leadership(self):
+        """Ожидание блокировки ведущего, если ее держит другой процесс"""
+        while not self.leader_lock.acquire():
+            await asyncio.sleep(Config.LEADER_RETRY_INTERVAL)
+        # Ведущий сам опрашивает биржу вместо чтения опубликованных цен
+        self.price_feed.source = create_price_source(crypto_data)
+        self.start_background_jobs()
+    
     async def post_init(self, application):
         """Выполняется после инициализации бота"""
-        # Запускаем обновление цен
-        crypto_data.start_updates()
+        # Единая лента цен: PnL, ликвидации и уведомления - ее подписчики.
+        # Цены нужны каждому процессу для ответов пользователям, но биржу
+        # опрашивает только ведущий - остальные читают опубликованные им цены
+        notifier.register('liquidation', format_liquidations)
+        notifier.register('stop_order', format_stop_orders)
+        notifier.register('order_filled', format_filled_orders)
+        notifier.start(application.bot)
+        is_leader = self.leader_lock is None or self.leader_lock.acquire()
+        self.price_feed = PriceFeed(crypto_data, None if is_leader else SharedPriceSource())
+        if is_leader:
+            self.start_background_jobs()
+        else:
+            self.leader_task = asyncio.create_task(self.acquire_leadership())
+        self.price_feed.start()
+        self.leaderboard_task = asyncio.create_task(self.leaderboard_loop())
         
-        # Запускаем фоновые задачи
-        asyncio.create_task(self.check_liquidations_task(application))
-        asyncio.create_task(self.update_prices_task(application))
+        # Процессы отрисовки графиков запускаются и прогреваются заранее
+        await asyncio.to_thread(render_pool.start)
         
         logger.info("Bot initialized and background tasks started")
     
     async def post_stop(self, application):
         """Выполняется при остановке бота"""
-        crypto_data.stop_updates()
+        if self.leader_task:
+            self.leader_task.cancel()
+        if self.leaderboard_task:
+            self.leaderboard_task.cancel()
+        if self.price_feed:
+            await self.price_feed.stop()
+        await crypto_data.close()
+        await notifier.stop()
+        if self.leader_lock:
+            self.leader_lock.release()
+        render_pool.shutdown()
         logger.info("Bot stopped")
     
+    def build_application(self, updater: bool = True):
+        """Создание приложения и регистрация обработчиков"""
+        builder = Application.builder().token(self.token)
+        api_urls = telegram_api_urls()
+        if api_urls:
+            builder = builder.base_url(api_urls['base_url']).base_file_url(api_urls['base_file_url'])
+        if updater:
+            builder = builder.post_init(self.post_init).post_stop(self.post_stop)
+        else:
+            # Обновления приходят от диспетчера webhook, а не через getUpdates
+            builder = builder.updater(None)
+        self.application = builder.build()
+        
+        # Настройка обработчиков
+        self.setup_handlers()
+        return self.application
+    
     def run(self):
         """Запуск бота"""
         # Инициализация базы данных
         init_db()
         
-        # Создание приложения
-        self.application = Application.builder().token(self.token).post_init(self.post_init).post_stop(self.post_stop).build()
+        if Config.BOT_MODE == 'webhook':
+            logger.info(f"Starting bot in webhook mode with {Config.WEBHOOK_WORKERS} workers...")
+            run_webhook(self.token)
+            return
         
-        # Настройка обработчиков
-        self.setup_handlers()
+        # Создание приложения
+        self.build_application()
         
         # Запуск бота
         logger.info("Starting bot...")
@@ -0,0 +1,172 @@
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import ccxt
+import pandas as pd
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from config import Config
+from database import Candle, SessionLocal
+
+candles_table = Candle.__table__
+
+COLUMNS = ['timestamp', 'open', 'high', 'low', 'close', 'volume']
+
+INSERTS = {
+    'sqlite': sqlite.insert,
+    'postgresql': postgresql.insert,
+}
+
+
+def timeframe_ms(timeframe: str) -> int:
+    """Длительность свечи в миллисекундах"""
+    return ccxt.Exchange.parse_timeframe(timeframe) * 1000
+
+
+class CandleStore:
+    """Постоянное хранилище свечей OHLCV с инкрементальной догрузкой с биржи
+
+    С биржи запрашиваются только свечи начиная с последней сохраненной
+    (она перезаписывается, так как могла быть незакрытой), графики строятся
+    по локальным данным.
+    """
+
+    def __init__(self, session_factory=None, refresh_interval: float = None, max_candles: int = None,
+                 clock=None):
+        self.session_factory = session_factory or SessionLocal
+        # Текущее время в мс; подменяется в тестах
+        self.clock = clock or (lambda: int(time.time() * 1000))
+        self.refresh_interval = (
+            refresh_interval if refresh_interval is not None else Config.CANDLE_REFRESH_INTERVAL
+        )
+        self.max_candles = max_candles if max_candles is not None else Config.CANDLE_STORE_MAX_CANDLES
+        self.synced_at: Dict[Tuple[str, str], float] = {}
+        # Один поток догружает пару symbol/timeframe, остальные ждут результата
+        self.locks: Dict[Tuple[str, str], threading.Lock] = {}
+        self.locks_guard = threading.Lock()
+
+    def _lock(self, key: Tuple[str, str]) -> threading.Lock:
+        with self.locks_guard:
+            if key not in self.locks:
+                self.locks[key] = threading.Lock()
+            return self.locks[key]
+
+    def last_timestamp(self, db, symbol: str, timeframe: str) -> Optional[int]:
+        return db.scalar(
+            select(func.max(Candle.timestamp))
+            .where(Candle.symbol == symbol, Candle.timeframe == timeframe)
+        )
+
+    def upsert(self, db, symbol: str, timeframe: str, ohlcv: Sequence[Sequence[float]]) -> int:
+        """Вставка свечей с заменой уже сохраненных по тому же времени"""
+        rows = [
+            {
+                'symbol': symbol,
+                'timeframe': timeframe,
+                'timestamp': int(ts),
+                'open': float(o),
+                'high': float(h),
+                'low': float(l),
+                'close': float(c),
+                'volume': float(v or 0.0),
+            }
+            for ts, o, h, l, c, v in ohlcv
+        ]
+        if not rows:
+            return 0
+
+        insert = INSERTS.get(db.get_bind().dialect.name)
+        if insert is None:
+            # Прочие диалекты: удаление перекрывающегося диапазона и вставка
+            db.execute(delete(candles_table).where(
+                candles_table.c.symbol == symbol,
+                candles_table.c.timeframe == timeframe,
+                candles_table.c.timestamp.in_([row['timestamp'] for row in rows]),
+            ))
+            db.execute(candles_table.insert(), rows)
+            return len(rows)
+
+        stmt = insert(candles_table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['symbol', 'timeframe', 'timestamp'],
+            set_={name: stmt.excluded[name] for name in ('open', 'high', 'low', 'close', 'volume')},
+        )
+        db.execute(stmt, rows)
+        return len(rows)
+
+    def prune(self, db, symbol: str, timeframe: str):
+        """Удаление свечей старше max_candles последних"""
+        if not self.max_candles:
+            return
+        last = self.last_timestamp(db, symbol, timeframe)
+        if last is None:
+            return
+        cutoff = last - self.max_candles * timeframe_ms(timeframe)
+        db.execute(delete(candles_table).where(
+            candles_table.c.symbol == symbol,
+            candles_table.c.timeframe == timeframe,
+            candles_table.c.timestamp <= cutoff,
+        ))
+
+    def load(self, db, symbol: str, timeframe: str, limit: int) -> pd.DataFrame:
+        """Последние limit свечей в порядке возрастания времени"""
+        rows = db.execute(
+            select(Candle.timestamp, Candle.open, Candle.high, Candle.low, Candle.close, Candle.volume)
+            .where(Candle.symbol == symbol, Candle.timeframe == timeframe)
+            .order_by(Candle.timestamp.desc())
+            .limit(limit)
+        ).all()
+        df = pd.DataFrame(list(reversed(rows)), columns=COLUMNS)
+        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
+        return df
+
+    def fetch_new(self, db, exchange, symbol: str, timeframe: str, limit: int) -> int:
+        """Догрузка свечей, начиная с последней сохраненной
+
+        После долгого простоя догружается не больше max_candles последних
+        свечей: более старые все равно были бы удалены prune.
+        """
+        since = self.last_timestamp(db, symbol, timeframe)
+        if since is None:
+            # Пустое хранилище: только последние limit свечей
+            return self.upsert(db, symbol, timeframe, exchange.fetch_ohlcv(symbol, timeframe, limit=limit))
+        if self.max_candles:
+            since = max(since, self.clock() - self.max_candles * timeframe_ms(timeframe))
+
+        stored = 0
+        while True:
+            batch: List = exchange.fetch_ohlcv(symbol, timeframe, since=since, limit=limit)
+            stored += self.upsert(db, symbol, timeframe, batch)
+            # Неполная страница или нет новых свечей - данные догружены
+            if len(batch) < limit or batch[-1][0] <= since:
+                return stored
+            since = batch[-1][0]
+
+    def is_fresh(self, symbol: str, timeframe: str) -> bool:
+        synced_at = self.synced_at.get((symbol, timeframe))
+        return synced_at is not None and time.monotonic() - synced_at < self.refresh_interval
+
+    def get(self, exchange, symbol: str, timeframe: str, limit: int) -> pd.DataFrame:
+        """Свечи для графика; при устаревших данных догружаются с биржи
+
+        При ошибке биржи возвращаются сохраненные данные (возможно, пустые).
+        """
+        key = (symbol, timeframe)
+        db = self.session_factory()
+        try:
+            if not self.is_fresh(symbol, timeframe):
+                with self._lock(key):
+                    if not self.is_fresh(symbol, timeframe):
+                        try:
+                            self.fetch_new(db, exchange, symbol, timeframe, limit)
+                            self.prune(db, symbol, timeframe)
+                            db.commit()
+                            self.synced_at[key] = time.monotonic()
+                        except Exception as e:
+                            db.rollback()
+                            print(f"Error fetching candles for {symbol} {timeframe}: {e}")
+            return self.load(db, symbol, timeframe, limit)
+        finally:
+            db.close()
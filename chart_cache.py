@@ -0,0 +1,94 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Tuple
+
+import pandas as pd
+
+from config import Config
+
+
+class CachedChart:
+    """PNG графика и file_id, полученный от Telegram после первой отправки"""
+    __slots__ = ('data', 'file_id')
+
+    def __init__(self, data: bytes, file_id: Optional[str] = None):
+        self.data = data
+        self.file_id = file_id
+
+
+class ChartCache:
+    """LRU-кэш отрисованных графиков, ограниченный числом записей и объемом"""
+
+    def __init__(self, max_entries: int = None, max_bytes: int = None):
+        self.max_entries = max_entries if max_entries is not None else Config.CHART_CACHE_SIZE
+        self.max_bytes = max_bytes if max_bytes is not None else Config.CHART_CACHE_MAX_BYTES
+        self.entries: 'OrderedDict[Hashable, CachedChart]' = OrderedDict()
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @staticmethod
+    def key(symbol: str, timeframe: str, df: pd.DataFrame, *overlays: Optional[float]) -> Tuple:
+        """Ключ: символ, таймфрейм и версия последней свечи
+
+        Последняя свеча до закрытия меняется без смены времени, поэтому
+        в версию входит и ее цена закрытия. Без overlays ключ общий для
+        всех игроков; линии позиции (вход, SL, TP) дают отдельную запись.
+        Текущая цена в ключ не входит - она меняется каждый тик.
+        """
+        last = df.iloc[-1]
+        version = (pd.Timestamp(last['timestamp']).isoformat(), float(last['close']))
+        return (symbol, timeframe, len(df), version) + ((overlays,) if any(overlays) else ())
+
+    def get(self, key: Hashable) -> Optional[CachedChart]:
+        with self.lock:
+            chart = self.entries.get(key)
+            if chart is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return chart
+
+    def put(self, key: Hashable, data: bytes) -> CachedChart:
+        chart = CachedChart(data)
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.total_bytes -= len(previous.data)
+            self.entries[key] = chart
+            self.total_bytes += len(data)
+            while self.entries and (
+                len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes
+            ):
+                _, evicted = self.entries.popitem(last=False)
+                self.total_bytes -= len(evicted.data)
+                self.evictions += 1
+        return chart
+
+    def set_file_id(self, key: Hashable, file_id: Optional[str]):
+        """Запоминание file_id загруженного в Telegram изображения"""
+        with self.lock:
+            chart = self.entries.get(key)
+            if chart is not None:
+                chart.file_id = file_id
+
+    def stats(self) -> Dict[str, float]:
+        requests = self.hits + self.misses
+        return {
+            'size': len(self.entries),
+            'bytes': self.total_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / requests if requests else 0.0,
+            'evictions': self.evictions,
+        }
+
+
+# Глобальный экземпляр
+chart_cache = ChartCache()
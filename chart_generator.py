@@ -1,7 +1,8 @@
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
+from matplotlib.collections import LineCollection, PolyCollection
+from matplotlib.colors import to_rgba
 from matplotlib.figure import Figure
-from matplotlib.patches import Rectangle
 import pandas as pd
 import numpy as np
 from datetime import datetime
@@ -9,7 +10,56 @@ import io
 from typing import Optional, Tuple, List
 from config import Config
 
+UP_COLOR = to_rgba('green', 0.7)
+DOWN_COLOR = to_rgba('red', 0.7)
+WICK_UP_COLOR = to_rgba('green')
+WICK_DOWN_COLOR = to_rgba('red')
+BODY_WIDTH = 0.6  # доля интервала между свечами
+
 class ChartGenerator:
+    @staticmethod
+    def draw_candles(ax, df: pd.DataFrame):
+        """Свечи двумя коллекциями: тела - PolyCollection, тени - LineCollection"""
+        if df.empty:
+            return
+        
+        x = mdates.date2num(df['timestamp'].to_numpy())
+        opens = df['open'].to_numpy(dtype=float)
+        closes = df['close'].to_numpy(dtype=float)
+        highs = df['high'].to_numpy(dtype=float)
+        lows = df['low'].to_numpy(dtype=float)
+        up = closes >= opens
+        
+        # Ширина тела - доля шага между свечами (в днях для оси дат)
+        step = np.median(np.diff(x)) if len(x) > 1 else 1.0
+        half = BODY_WIDTH * step / 2
+        
+        # Тени свечи: отрезки (x, low) - (x, high)
+        wicks = np.stack([np.column_stack([x, lows]), np.column_stack([x, highs])], axis=1)
+        ax.add_collection(LineCollection(
+            wicks,
+            colors=np.where(up[:, None], WICK_UP_COLOR, WICK_DOWN_COLOR),
+            linewidths=1
+        ))
+        
+        # Тела свечи: прямоугольники нулевой высоты не рисуем
+        body = closes != opens
+        bottom = np.minimum(opens, closes)[body]
+        top = np.maximum(opens, closes)[body]
+        left = x[body] - half
+        right = x[body] + half
+        bodies = np.stack([
+            np.column_stack([left, bottom]),
+            np.column_stack([left, top]),
+            np.column_stack([right, top]),
+            np.column_stack([right, bottom]),
+        ], axis=1)
+        colors = np.where(up[body][:, None], UP_COLOR, DOWN_COLOR)
+        ax.add_collection(PolyCollection(bodies, facecolors=colors, edgecolors=colors))
+        
+        ax.xaxis_date()
+        ax.autoscale_view()
+    
     @staticmethod
     def create_price_chart(
         df: pd.DataFrame,
@@ -23,32 +73,7 @@ class ChartGenerator:
         fig = Figure(figsize=(10, 6), dpi=100)
         ax = fig.add_subplot(111)
         
-        # Определяем цвет свечей
-        colors = ['green' if close >= open else 'red' 
-                 for close, open in zip(df['close'], df['open'])]
-        
-        # Рисуем свечи
-        for idx, row in df.iterrows():
-            color = colors[idx]
-            
-            # Тело свечи
-            body_start = min(row['open'], row['close'])
-            body_height = abs(row['close'] - row['open'])
-            
-            if body_height > 0:
-                ax.add_patch(Rectangle(
-                    (mdates.date2num(row['timestamp']) - 0.3, body_start),
-                    0.6, body_height,
-                    color=color, alpha=0.7
-                ))
-            
-            # Тени свечи
-            ax.plot(
-                [mdates.date2num(row['timestamp']), mdates.date2num(row['timestamp'])],
-                [row['low'], row['high']],
-                color=color,
-                linewidth=1
-            )
+        ChartGenerator.draw_candles(ax, df)
         
         # Линии для отметок
         if entry_price:
@@ -90,7 +115,7 @@ class ChartGenerator:
         fig = Figure(figsize=(8, 4), dpi=100)
         ax = fig.add_subplot(111)
         
-        dates = pd.date_range(end=datetime.now(), periods=len(pnl_history), freq='H')
+        dates = pd.date_range(end=datetime.now(), periods=len(pnl_history), freq='h')
         
         # График PnL
         ax.plot(dates, pnl_history, color='blue', linewidth=2, label='PnL')
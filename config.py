@@ -18,11 +18,90 @@ class Config:
     CHART_TIME_FRAMES = ['1m', '5m', '15m', '1h', '4h', '1d']
     DEFAULT_TIME_FRAME = '1h'
     CHART_PERIODS = 100
+    CANDLE_REFRESH_INTERVAL = int(os.getenv('CANDLE_REFRESH_INTERVAL', '60'))  # секунды между догрузками свечей
+    CHART_CACHE_SIZE = int(os.getenv('CHART_CACHE_SIZE', '256'))  # отрисованных графиков в памяти
+    CHART_CACHE_MAX_BYTES = int(os.getenv('CHART_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+    RENDER_WORKERS = int(os.getenv('RENDER_WORKERS', '2'))  # процессов отрисовки, 0 - в потоке
+    RENDER_QUEUE_SIZE = int(os.getenv('RENDER_QUEUE_SIZE', '32'))  # ожидающих отрисовки графиков
+    RENDER_TIMEOUT = float(os.getenv('RENDER_TIMEOUT', '15'))  # секунды на один график
+    CANDLE_STORE_MAX_CANDLES = int(os.getenv('CANDLE_STORE_MAX_CANDLES', '5000'))  # на пару symbol/timeframe
     
     # Game settings
     MIN_TRADE_AMOUNT = 10.0  # Минимальная сумма сделки
     UPDATE_INTERVAL = 60  # Обновление данных каждые 60 секунд
     MAX_OPEN_POSITIONS = 5  # Максимальное количество открытых позиций
     
+    # Market data
+    BATCH_TICKER_FETCH = os.getenv('BATCH_TICKER_FETCH', '1') == '1'  # fetch_tickers одним запросом
+    PRICE_FETCH_CONCURRENCY = int(os.getenv('PRICE_FETCH_CONCURRENCY', '10'))
+    PRICE_SOURCE = os.getenv('PRICE_SOURCE', 'exchange')  # exchange | replay | simulator
+    PRICE_REPLAY_FILE = os.getenv('PRICE_REPLAY_FILE', 'prices.csv')
+    PNL_ON_READ = os.getenv('PNL_ON_READ', '0') == '1'  # PnL считается при чтении, а не пишется на каждом тике
+    SYNC_OVERLAP = float(os.getenv('SYNC_OVERLAP', '60'))  # секунды перекрытия окна догрузки позиций и ордеров
+    
+    # Market simulator (PRICE_SOURCE=simulator)
+    SIM_SEED = int(os.getenv('SIM_SEED')) if os.getenv('SIM_SEED') else None
+    SIM_DRIFT = float(os.getenv('SIM_DRIFT', '0.0'))  # годовой снос
+    SIM_VOLATILITY = float(os.getenv('SIM_VOLATILITY', '0.8'))  # годовая волатильность
+    SIM_JUMP_INTENSITY = float(os.getenv('SIM_JUMP_INTENSITY', '2.0'))  # скачков в сутки
+    SIM_JUMP_SIZE = float(os.getenv('SIM_JUMP_SIZE', '0.02'))  # СКО скачка логарифма цены
+    SIM_CORRELATION = float(os.getenv('SIM_CORRELATION', '0.6'))  # попарная корреляция символов
+    SIM_TICK_SECONDS = float(os.getenv('SIM_TICK_SECONDS', '60'))  # рыночное время одного тика
+    
     # Database
-    DATABASE_URL = 'sqlite:///trading_game.db'
+    DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///trading_game.db')  # sqlite:///... или postgresql://...
+    ASYNC_DATABASE_URL = os.getenv('ASYNC_DATABASE_URL')  # по умолчанию выводится из DATABASE_URL
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+    DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '10'))
+    DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', '30'))
+    DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '1800'))  # секунды, для Postgres
+    SQLITE_JOURNAL_MODE = os.getenv('SQLITE_JOURNAL_MODE', 'WAL')
+    SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+    
+    # Conversation state
+    STATE_BACKEND = os.getenv('STATE_BACKEND', 'memory')  # memory | sqlite | redis
+    STATE_TTL = float(os.getenv('STATE_TTL', '900'))  # секунды жизни незавершенного диалога
+    STATE_MAX_ENTRIES = int(os.getenv('STATE_MAX_ENTRIES', '100000'))  # для memory
+    STATE_SQLITE_PATH = os.getenv('STATE_SQLITE_PATH', 'conversation_state.db')
+    STATE_REDIS_URL = os.getenv('STATE_REDIS_URL', 'redis://localhost:6379/0')
+    
+    # Webhook mode
+    BOT_MODE = os.getenv('BOT_MODE', 'polling')  # polling | webhook
+    WEBHOOK_URL = os.getenv('WEBHOOK_URL')  # публичный адрес, регистрируется через setWebhook
+    WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+    WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+    WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+    WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+    WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', '4'))  # процессы-обработчики
+    TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL')  # например, telegram_stub.py
+    LEADER_LOCK_FILE = os.getenv('LEADER_LOCK_FILE', 'bot_leader.lock')
+    LEADER_RETRY_INTERVAL = float(os.getenv('LEADER_RETRY_INTERVAL', '5'))  # секунды
+    
+    # Notifications (лимиты Bot API: ~30 сообщений/с всего, 1/с в один чат)
+    NOTIFY_WORKERS = int(os.getenv('NOTIFY_WORKERS', '8'))
+    NOTIFY_GLOBAL_RATE = float(os.getenv('NOTIFY_GLOBAL_RATE', '25'))  # сообщений в секунду
+    NOTIFY_CHAT_RATE = float(os.getenv('NOTIFY_CHAT_RATE', '1'))  # сообщений в секунду в один чат
+    NOTIFY_MAX_RETRIES = int(os.getenv('NOTIFY_MAX_RETRIES', '5'))
+    
+    # Leaderboard
+    LEADERBOARD_SIZE = int(os.getenv('LEADERBOARD_SIZE', '100'))  # строк в материализованной таблице
+    LEADERBOARD_SHOW = int(os.getenv('LEADERBOARD_SHOW', '20'))  # строк на экране рейтинга
+    LEADERBOARD_RECONCILE_INTERVAL = float(os.getenv('LEADERBOARD_RECONCILE_INTERVAL', '300'))  # секунды между сверками живого рейтинга с базой
+    
+    # Exports
+    ADMIN_EXPORT_FORMAT = os.getenv('ADMIN_EXPORT_FORMAT', 'xlsx')  # xlsx | csv (csv.gz по таблице)
+    EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', '5000'))  # строк за одну выборку курсора
+    EXPORT_SPOOL_SIZE = int(os.getenv('EXPORT_SPOOL_SIZE', str(8 * 1024 * 1024)))  # байт в памяти до сброса на диск
+    
+    # Cleanup
+    CLEANUP_DAYS = int(os.getenv('CLEANUP_DAYS', '30'))  # хранить закрытые позиции и транзакции, дней
+    CLEANUP_BATCH_SIZE = int(os.getenv('CLEANUP_BATCH_SIZE', '2000'))  # строк в одной транзакции удаления
+    CLEANUP_PAUSE = float(os.getenv('CLEANUP_PAUSE', '0.05'))  # секунды между транзакциями удаления
+    CLEANUP_ARCHIVE_DIR = os.getenv('CLEANUP_ARCHIVE_DIR')  # каталог архива Parquet; не задан - без архива
+    ARCHIVE_FILE_ROWS = int(os.getenv('ARCHIVE_FILE_ROWS', '200000'))  # строк в одном файле архива
+    ARCHIVE_COMPRESSION = os.getenv('ARCHIVE_COMPRESSION', 'zstd')  # zstd | snappy | gzip
+    
+    # User cache
+    USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', '10000'))
+    USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', '30'))  # секунды
@@ -2,8 +2,9 @@
 
 # CRON задания для Trading Game Bot
 
-# Обновление данных каждые 5 минут
-*/5 * * * * cd /path/to/telegram-trading-game && /usr/bin/python3 update_data.py >> logs/cron.log 2>&1
+# Обновление рейтингов каждые 5 минут
+# (цены, PnL и ликвидации обновляет лента цен внутри бота; update_data.py --market - только без бота)
+*/5 * * * * cd /path/to/telegram-trading-game && /usr/bin/python3 update_data.py --rankings >> logs/cron.log 2>&1
 
 # Ежедневная очистка в 3:00
 0 3 * * * cd /path/to/telegram-trading-game && /usr/bin/python3 update_data.py --cleanup >> logs/cron.log 2>&1
@@ -1,110 +1,165 @@
+import asyncio
+import zlib
 import ccxt
 import pandas as pd
-import numpy as np
-from datetime import datetime, timedelta
+from datetime import datetime
 import time
 from typing import Dict, List, Optional
-import threading
 from config import Config
+from price_index import PriceIndex
+from candle_store import CandleStore
+from market_simulator import MarketSimulator, SimulatedExchange, AsyncSimulatedExchange, create_simulated_exchange
+
+EXCHANGE_OPTIONS = {
+    'enableRateLimit': True,
+    'options': {
+        'defaultType': 'spot'
+    }
+}
+
+def create_async_exchange():
+    """Асинхронный клиент биржи для параллельной загрузки тикеров"""
+    import ccxt.async_support as ccxt_async
+    return ccxt_async.binance(EXCHANGE_OPTIONS)
+
+def create_exchange():
+    """Биржа согласно Config.PRICE_SOURCE: симулятор или Binance"""
+    if Config.PRICE_SOURCE == 'simulator':
+        return create_simulated_exchange()
+    return ccxt.binance(EXCHANGE_OPTIONS)
 
 class CryptoData:
-    def __init__(self):
-        self.exchange = ccxt.binance({
-            'enableRateLimit': True,
-            'options': {
-                'defaultType': 'spot'
-            }
-        })
+    def __init__(self, exchange=None, async_exchange_factory=None, candle_store=None):
+        self.exchange = exchange or create_exchange()
+        if async_exchange_factory is None and isinstance(self.exchange, SimulatedExchange):
+            async_exchange_factory = lambda: AsyncSimulatedExchange(self.exchange)
+        self.async_exchange_factory = async_exchange_factory or create_async_exchange
+        self.async_exchange = None  # создается при первой параллельной загрузке и переиспользуется
         self.prices = {}
-        self.historical_data = {}
-        self.update_thread = None
-        self.running = False
-        
-    def start_updates(self):
-        """Запуск потока обновления цен"""
-        self.running = True
-        self.update_thread = threading.Thread(target=self._update_prices_loop)
-        self.update_thread.daemon = True
-        self.update_thread.start()
+        self.price_timestamps = {}  # Время последнего успешного обновления цены
+        self.candle_store = candle_store or CandleStore()
+        self.price_index = PriceIndex()
         
-    def stop_updates(self):
-        """Остановка обновления цен"""
-        self.running = False
+    def update_prices(self):
+        """Обновление текущих цен синхронно - для скриптов и нагрузочного теста
+
+        Бот обновляет цены через update_prices_async; здесь запросы идут
+        последовательно, без event loop, поэтому метод можно вызывать и из корутины.
+        """
+        symbols = Config.AVAILABLE_COINS
         
-    def _update_prices_loop(self):
-        """Цикл обновления цен"""
-        while self.running:
+        if Config.BATCH_TICKER_FETCH and self._supports_batch():
             try:
-                self.update_prices()
-                time.sleep(Config.UPDATE_INTERVAL)
+                self._store_tickers(self.exchange.fetch_tickers(symbols))
+                return
             except Exception as e:
-                print(f"Error updating prices: {e}")
-                time.sleep(30)
-                
-    def update_prices(self):
-        """Обновление текущих цен"""
-        for symbol in Config.AVAILABLE_COINS:
+                print(f"Error fetching tickers in batch: {e}")
+        
+        for symbol in symbols:
             try:
                 ticker = self.exchange.fetch_ticker(symbol)
-                self.prices[symbol] = ticker['last']
+                self._store_tickers({symbol: ticker})
             except Exception as e:
                 print(f"Error fetching price for {symbol}: {e}")
+    
+    async def update_prices_async(self):
+        """Обновление текущих цен без блокировки event loop"""
+        symbols = Config.AVAILABLE_COINS
+        
+        if Config.BATCH_TICKER_FETCH and self._supports_batch():
+            try:
+                tickers = await asyncio.to_thread(self.exchange.fetch_tickers, symbols)
+                self._store_tickers(tickers)
+                return
+            except Exception as e:
+                print(f"Error fetching tickers in batch: {e}")
+        
+        await self._fetch_tickers_concurrently(symbols)
+    
+    def _supports_batch(self) -> bool:
+        return bool(getattr(self.exchange, 'has', {}).get('fetchTickers'))
+    
+    async def _fetch_tickers_concurrently(self, symbols: List[str]):
+        """Параллельная загрузка тикеров с ограничением числа запросов"""
+        # Один клиент на все обновления: рынки биржи загружаются один раз
+        if self.async_exchange is None:
+            self.async_exchange = self.async_exchange_factory()
+        exchange = self.async_exchange
+        semaphore = asyncio.Semaphore(Config.PRICE_FETCH_CONCURRENCY)
+        
+        async def fetch(symbol):
+            async with semaphore:
+                try:
+                    return symbol, await exchange.fetch_ticker(symbol)
+                except Exception as e:
+                    print(f"Error fetching price for {symbol}: {e}")
+                    return symbol, None
+        
+        results = await asyncio.gather(*(fetch(symbol) for symbol in symbols))
+        self._store_tickers({symbol: ticker for symbol, ticker in results if ticker})
+    
+    async def close(self):
+        """Закрытие асинхронного клиента биржи"""
+        if self.async_exchange is not None:
+            exchange, self.async_exchange = self.async_exchange, None
+            await exchange.close()
+    
+    def _store_tickers(self, tickers: Dict[str, dict]):
+        """Сохранение цен из тикеров биржи"""
+        self.set_prices({
+            symbol: ticker['last']
+            for symbol, ticker in tickers.items()
+            if ticker and ticker.get('last') is not None
+        })
+    
+    def set_prices(self, prices: Dict[str, float]):
+        """Сохранение цен и времени их получения"""
+        now = time.time()
+        for symbol, price in prices.items():
+            self.prices[symbol] = price
+            self.price_timestamps[symbol] = now
+    
+    def get_price_age(self, symbol: str) -> Optional[float]:
+        """Возраст цены в секундах (None если цена ни разу не загружалась)"""
+        fetched_at = self.price_timestamps.get(symbol)
+        return time.time() - fetched_at if fetched_at is not None else None
+    
+    def get_stale_symbols(self, max_age: float) -> List[str]:
+        """Символы, цена которых не обновлялась дольше max_age секунд"""
+        stale = []
+        for symbol in Config.AVAILABLE_COINS:
+            age = self.get_price_age(symbol)
+            if age is None or age > max_age:
+                stale.append(symbol)
+        return stale
                 
     def get_current_price(self, symbol: str) -> float:
         """Получение текущей цены"""
         return self.prices.get(symbol, 0.0)
     
     def get_historical_data(self, symbol: str, timeframe: str = '1h', limit: int = 100) -> pd.DataFrame:
-        """Получение исторических данных"""
+        """Получение исторических данных из хранилища свечей"""
         try:
-            cache_key = f"{symbol}_{timeframe}"
-            
-            if cache_key not in self.historical_data or \
-               (datetime.now() - self.historical_data[cache_key]['timestamp']).seconds > 300:
-                
-                ohlcv = self.exchange.fetch_ohlcv(symbol, timeframe, limit=limit)
-                df = pd.DataFrame(ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-                df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-                
-                # Добавляем симуляцию случайных колебаний для более реалистичной игры
-                noise = np.random.normal(0, 0.001, len(df))
-                df['close'] = df['close'] * (1 + noise)
-                
-                self.historical_data[cache_key] = {
-                    'data': df,
-                    'timestamp': datetime.now()
-                }
-            
-            return self.historical_data[cache_key]['data'].copy()
-            
+            df = self.candle_store.get(self.exchange, symbol, timeframe, limit)
+            if not df.empty:
+                return df
         except Exception as e:
-            print(f"Error fetching historical data for {symbol}: {e}")
-            # Возвращаем фиктивные данные если API недоступно
-            return self._generate_mock_data(symbol, timeframe, limit)
+            print(f"Error loading historical data for {symbol}: {e}")
+        
+        # Возвращаем фиктивные данные если API и хранилище недоступны
+        return self._generate_mock_data(symbol, timeframe, limit)
     
     def _generate_mock_data(self, symbol: str, timeframe: str, limit: int) -> pd.DataFrame:
         """Генерация моковых данных если API недоступно"""
-        base_prices = {
-            'BTC/USDT': 45000,
-            'ETH/USDT': 2400,
-            'BNB/USDT': 300
-        }
-        
-        base_price = base_prices.get(symbol, 100)
-        dates = pd.date_range(end=datetime.now(), periods=limit, freq=timeframe.replace('m', 'T').replace('h', 'H'))
+        # Собственный генератор с устойчивым к перезапуску зерном, глобальный RNG не трогаем
+        simulator = MarketSimulator([symbol], seed=zlib.crc32(symbol.encode()))
+        seconds = ccxt.Exchange.parse_timeframe(timeframe)
+        rows = simulator.candles(seconds, limit, simulator.price(symbol))
         
-        np.random.seed(hash(symbol) % 10000)
-        returns = np.random.randn(limit) * 0.02
-        prices = base_price * np.exp(np.cumsum(returns))
-        
-        df = pd.DataFrame({
-            'timestamp': dates,
-            'open': prices * (1 + np.random.randn(limit) * 0.01),
-            'high': prices * (1 + np.abs(np.random.randn(limit) * 0.02)),
-            'low': prices * (1 - np.abs(np.random.randn(limit) * 0.02)),
-            'close': prices,
-            'volume': np.random.randint(1000, 100000, limit)
-        })
+        step = pd.Timedelta(seconds=seconds)
+        end = pd.Timestamp(datetime.utcnow()).floor(step)
+        df = pd.DataFrame(rows, columns=['open', 'high', 'low', 'close', 'volume'])
+        df.insert(0, 'timestamp', pd.date_range(end=end, periods=limit, freq=step))
         
         return df
     
@@ -1,14 +1,91 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Boolean, JSON, ForeignKey, Enum
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy import create_engine, event, inspect, text, Index, Column, Integer, BigInteger, String, Float, DateTime, Boolean, JSON, ForeignKey, Enum
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import declarative_base, sessionmaker, relationship
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from contextlib import asynccontextmanager
 from datetime import datetime
 import enum
 from config import Config
 
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg',
+    'postgres': 'postgresql+asyncpg',
+}
+
+def async_database_url(url: str) -> str:
+    """URL с асинхронным драйвером (aiosqlite / asyncpg)"""
+    scheme, sep, rest = url.partition('://')
+    return ASYNC_DRIVERS.get(scheme, scheme) + sep + rest
+
+def is_sqlite(url: str) -> bool:
+    return url.split(':', 1)[0].startswith('sqlite')
+
+def is_sqlite_memory(url: str) -> bool:
+    return is_sqlite(url) and (url.endswith(':memory:') or url.rstrip('/').endswith(':'))
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Настройка каждого нового соединения SQLite"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={Config.SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={Config.SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout={Config.SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.close()
+
+def engine_options(url: str) -> dict:
+    """Параметры пула и драйвера для URL согласно Config"""
+    if is_sqlite_memory(url):
+        return {}
+    if is_sqlite(url):
+        # Блокировки ждет сам SQLite (busy_timeout), пул ограничивает число писателей.
+        # Без overflow: писатель у SQLite один, лишние соединения только дольше ждут блокировку
+        return {
+            'pool_size': Config.DB_POOL_SIZE,
+            'max_overflow': 0,
+            'pool_timeout': Config.DB_POOL_TIMEOUT,
+            'connect_args': {'timeout': Config.SQLITE_BUSY_TIMEOUT_MS / 1000},
+        }
+    return {
+        'pool_size': Config.DB_POOL_SIZE,
+        'max_overflow': Config.DB_MAX_OVERFLOW,
+        'pool_timeout': Config.DB_POOL_TIMEOUT,
+        'pool_pre_ping': True,
+        'pool_recycle': Config.DB_POOL_RECYCLE,
+    }
+
+def create_db_engine(url: str = None, **overrides):
+    """Синхронный движок с профилем из Config (WAL для SQLite, пул для Postgres)"""
+    url = url or Config.DATABASE_URL
+    options = engine_options(url)
+    if is_sqlite(url) and not is_sqlite_memory(url):
+        options['connect_args']['check_same_thread'] = False
+    options.update(overrides)
+    db_engine = create_engine(url, **options)
+    if is_sqlite(url):
+        event.listen(db_engine, 'connect', set_sqlite_pragmas)
+    return db_engine
+
+def create_async_db_engine(url: str = None, **overrides):
+    """Асинхронный движок с тем же профилем"""
+    url = url or Config.ASYNC_DATABASE_URL or async_database_url(Config.DATABASE_URL)
+    options = engine_options(url)
+    if is_sqlite(url) and not is_sqlite_memory(url):
+        # aiosqlite в SQLAlchemy 2.0 по умолчанию без пула (NullPool)
+        options['poolclass'] = AsyncAdaptedQueuePool
+    options.update(overrides)
+    db_engine = create_async_engine(url, **options)
+    if is_sqlite(url):
+        event.listen(db_engine.sync_engine, 'connect', set_sqlite_pragmas)
+    return db_engine
+
 Base = declarative_base()
-engine = create_engine(Config.DATABASE_URL)
+engine = create_db_engine()
 SessionLocal = sessionmaker(bind=engine)
 
+# Асинхронный слой для обработчиков: запросы не блокируют event loop
+async_engine = create_async_db_engine()
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
+
 class OrderType(enum.Enum):
     MARKET = "market"
     LIMIT = "limit"
@@ -40,6 +117,11 @@ class User(Base):
     # Relationships
     positions = relationship("Position", back_populates="user", cascade="all, delete-orphan")
     orders = relationship("Order", back_populates="user", cascade="all, delete-orphan")
+    
+    __table_args__ = (
+        # Выборка лучших игроков для таблицы лидеров
+        Index('ix_users_rank', 'rank'),
+    )
 
 class Position(Base):
     __tablename__ = 'positions'
@@ -64,6 +146,29 @@ class Position(Base):
     
     # Relationships
     user = relationship("User", back_populates="positions")
+    
+    __table_args__ = (
+        # Позиции пользователя (открытые / история, отсортированная по closed_at)
+        Index('ix_positions_user_open_closed_at', 'user_id', 'is_open', 'closed_at'),
+        # Открытые позиции по символу для обновления цен и ликвидаций
+        Index(
+            'ix_positions_open_symbol', 'symbol',
+            sqlite_where=text('is_open = 1'),
+            postgresql_where=text('is_open'),
+        ),
+        # Догрузка недавно открытых позиций в индекс уровней
+        Index(
+            'ix_positions_open_opened_at', 'opened_at',
+            sqlite_where=text('is_open = 1'),
+            postgresql_where=text('is_open'),
+        ),
+        # Очистка старых закрытых позиций
+        Index(
+            'ix_positions_closed_at', 'closed_at',
+            sqlite_where=text('is_open = 0'),
+            postgresql_where=text('NOT is_open'),
+        ),
+    )
 
 class Order(Base):
     __tablename__ = 'orders'
@@ -82,6 +187,17 @@ class Order(Base):
     
     # Relationships
     user = relationship("User", back_populates="orders")
+    
+    __table_args__ = (
+        # Ожидающие ордера пользователя
+        Index('ix_orders_user_filled', 'user_id', 'filled'),
+        # Догрузка недавно выставленных ордеров в книги
+        Index(
+            'ix_orders_unfilled_created_at', 'created_at',
+            sqlite_where=text('filled = 0'),
+            postgresql_where=text('NOT filled'),
+        ),
+    )
 
 class Transaction(Base):
     __tablename__ = 'transactions'
@@ -94,14 +210,128 @@ class Transaction(Base):
     balance_after = Column(Float, nullable=False)
     details = Column(JSON)
     created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index('ix_transactions_user_created_at', 'user_id', 'created_at'),
+        Index('ix_transactions_created_at', 'created_at'),
+    )
+
+class LeaderboardEntry(Base):
+    """Материализованная таблица лидеров: первые LEADERBOARD_SIZE игроков на момент пересчета"""
+    __tablename__ = 'leaderboard'
+    
+    position = Column(Integer, primary_key=True)  # 1..N без пропусков, при равенстве - по id
+    rank = Column(Integer, nullable=False)  # RANK(): равные очки - равный ранг
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    telegram_id = Column(Integer, nullable=False)
+    name = Column(String)
+    score = Column(Float, nullable=False)
+    total_profit = Column(Float, nullable=False)
+    win_rate = Column(Float, nullable=False)
+    total_trades = Column(Integer, nullable=False)
+    updated_at = Column(DateTime, nullable=False)
+
+class UserStats(Base):
+    """Агрегаты игрока, поддерживаемые при открытии, закрытии и ликвидации позиций"""
+    __tablename__ = 'user_stats'
+    
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    open_positions = Column(Integer, nullable=False, default=0)
+    open_margin = Column(Float, nullable=False, default=0.0)
+    leverage_sum = Column(Integer, nullable=False, default=0)  # по открытым позициям
+    closed_trades = Column(Integer, nullable=False, default=0)
+    wins = Column(Integer, nullable=False, default=0)
+    losses = Column(Integer, nullable=False, default=0)
+    liquidations = Column(Integer, nullable=False, default=0)
+    realized_pnl = Column(Float, nullable=False, default=0.0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class UserExposure(Base):
+    """Открытый объем игрока по символу: стоимость и PnL линейны по цене
+    
+    size = сумма amount * leverage, cost = сумма amount * leverage * entry_price;
+    стоимость по цене p равна size * p, PnL лонгов size * p - cost, шортов cost - size * p.
+    """
+    __tablename__ = 'user_exposure'
+    
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    symbol = Column(String, primary_key=True)
+    open_positions = Column(Integer, nullable=False, default=0)
+    long_size = Column(Float, nullable=False, default=0.0)
+    long_cost = Column(Float, nullable=False, default=0.0)
+    short_size = Column(Float, nullable=False, default=0.0)
+    short_cost = Column(Float, nullable=False, default=0.0)
+
+class LatestPrice(Base):
+    """Последние цены ленты ведущего процесса - их читают остальные процессы"""
+    __tablename__ = 'latest_prices'
+    
+    symbol = Column(String, primary_key=True)
+    price = Column(Float, nullable=False)
+    updated_at = Column(Float, nullable=False)  # время публикации, unix
+
+class Candle(Base):
+    __tablename__ = 'candles'
+    
+    # Первичный ключ (symbol, timeframe, timestamp) покрывает выборки для графиков
+    symbol = Column(String, primary_key=True)
+    timeframe = Column(String, primary_key=True)
+    timestamp = Column(BigInteger, primary_key=True)  # начало свечи, мс UTC
+    open = Column(Float, nullable=False)
+    high = Column(Float, nullable=False)
+    low = Column(Float, nullable=False)
+    close = Column(Float, nullable=False)
+    volume = Column(Float, nullable=False)
+
+def ensure_indexes(bind=None):
+    """Создание индексов, отсутствующих в существующей базе
+
+    create_all создает индексы только вместе с новыми таблицами, поэтому
+    для баз, созданных до появления индексов, они добавляются отдельно.
+    """
+    bind = bind or engine
+    created = []
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            with bind.begin() as connection:
+                existing = {i['name'] for i in inspect(connection).get_indexes(table.name)}
+                if index.name not in existing:
+                    index.create(bind=connection)
+                    created.append(index.name)
+    return created
+
+def chunked(values, size: int):
+    """Разбиение последовательности на части фиксированного размера (для IN и bulk-операций)"""
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
 
 def init_db():
     Base.metadata.create_all(bind=engine)
+    ensure_indexes(engine)
+    # Агрегаты игроков для баз, созданных до появления user_stats
+    from user_stats import backfill
+    with SessionLocal() as db:
+        backfill(db)
+        db.commit()
     print("Database initialized successfully!")
 
+def run_in_session(func, *args):
+    """Вызов func(db, *args) в отдельной синхронной сессии - для asyncio.to_thread"""
+    db = SessionLocal()
+    try:
+        return func(db, *args)
+    finally:
+        db.close()
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+@asynccontextmanager
+async def get_async_db():
+    """Асинхронная сессия, закрываемая при выходе из блока async with"""
+    async with AsyncSessionLocal() as db:
+        yield db
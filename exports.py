@@ -0,0 +1,163 @@
+import csv
+import gzip
+import io
+import tempfile
+from typing import Callable, Iterable, List, Sequence, Tuple
+
+import xlsxwriter
+from sqlalchemy import select
+
+from config import Config
+from database import Position, User
+from utils import position_mark_price, position_unrealized_pnl
+
+users_table = User.__table__
+positions_table = Position.__table__
+
+# Колонка выгрузки: заголовок и значение из строки результата
+Column = Tuple[str, Callable]
+
+
+def user_columns() -> List[Column]:
+    """Поля пользователя для админской выгрузки"""
+    return [
+        ('ID', lambda u: u.id),
+        ('Telegram ID', lambda u: u.telegram_id),
+        ('Username', lambda u: u.username),
+        ('Balance', lambda u: u.balance),
+        ('Total Profit', lambda u: u.total_profit),
+        ('Total Trades', lambda u: u.total_trades),
+        ('Win Rate', lambda u: u.win_rate),
+        ('Rank', lambda u: u.rank),
+        ('Registered', lambda u: u.registered_at),
+        ('Last Active', lambda u: u.last_active),
+    ]
+
+
+def position_columns(crypto_data) -> List[Column]:
+    """Все поля позиции для админской выгрузки; открытые - по текущим ценам"""
+    return [
+        ('ID', lambda p: p.id),
+        ('User ID', lambda p: p.user_id),
+        ('Symbol', lambda p: p.symbol),
+        ('Type', lambda p: p.position_type.value),
+        ('Leverage', lambda p: p.leverage),
+        ('Entry Price', lambda p: p.entry_price),
+        ('Current Price', lambda p: position_mark_price(p, crypto_data) if p.is_open else p.current_price),
+        ('Amount', lambda p: p.amount),
+        ('Margin', lambda p: p.margin),
+        ('Unrealized PnL', lambda p: position_unrealized_pnl(p, crypto_data) if p.is_open else p.unrealized_pnl),
+        ('Realized PnL', lambda p: p.realized_pnl),
+        ('Liquidation Price', lambda p: p.liquidation_price),
+        ('Stop Loss', lambda p: p.stop_loss),
+        ('Take Profit', lambda p: p.take_profit),
+        ('Is Open', lambda p: p.is_open),
+        ('Opened At', lambda p: p.opened_at),
+        ('Closed At', lambda p: p.closed_at),
+    ]
+
+
+def history_columns(crypto_data) -> List[Column]:
+    """История сделок игрока"""
+    return [
+        ('ID', lambda p: p.id),
+        ('Symbol', lambda p: p.symbol),
+        ('Type', lambda p: p.position_type.value),
+        ('Leverage', lambda p: p.leverage),
+        ('Entry Price', lambda p: p.entry_price),
+        ('Exit Price', lambda p: p.current_price if not p.is_open else None),
+        ('Amount', lambda p: p.amount),
+        ('Margin', lambda p: p.margin),
+        ('PnL', lambda p: p.realized_pnl if not p.is_open else position_unrealized_pnl(p, crypto_data)),
+        ('Status', lambda p: 'OPEN' if p.is_open else 'CLOSED'),
+        ('Opened At', lambda p: p.opened_at),
+        ('Closed At', lambda p: p.closed_at),
+    ]
+
+
+def stream_rows(db, stmt, columns: Sequence[Column], batch_size: int = None) -> Iterable[list]:
+    """Строки выгрузки порциями по batch_size (серверный курсор там, где он есть)"""
+    batch_size = batch_size or Config.EXPORT_BATCH_SIZE
+    result = db.execute(stmt.execution_options(yield_per=batch_size))
+    for row in result:
+        yield [value(row) for _, value in columns]
+
+
+def spooled_file():
+    """Файл в памяти до EXPORT_SPOOL_SIZE байт, дальше - на диске"""
+    return tempfile.SpooledTemporaryFile(max_size=Config.EXPORT_SPOOL_SIZE)
+
+
+def write_csv(output, columns: Sequence[Column], rows: Iterable[list], compress: bool = False) -> int:
+    """Построчная запись CSV (с gzip при compress); возвращает число строк"""
+    raw = gzip.GzipFile(fileobj=output, mode='wb') if compress else output
+    text = io.TextIOWrapper(raw, encoding='utf-8', newline='')
+    writer = csv.writer(text)
+    writer.writerow([name for name, _ in columns])
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+    text.flush()
+    # Обертки закрываются без закрытия самого файла
+    text.detach()
+    if compress:
+        raw.close()
+    return count
+
+
+def write_xlsx(output, sheets: Sequence[Tuple[str, Sequence[Column], Iterable[list]]]) -> int:
+    """Листы XLSX в режиме constant_memory: каждая строка сбрасывается сразу после записи"""
+    workbook = xlsxwriter.Workbook(output, {
+        'constant_memory': True,
+        'default_date_format': 'yyyy-mm-dd hh:mm:ss',
+        'strings_to_numbers': False,
+    })
+    count = 0
+    for name, columns, rows in sheets:
+        sheet = workbook.add_worksheet(name)
+        sheet.write_row(0, 0, [header for header, _ in columns])
+        for row_index, row in enumerate(rows, 1):
+            sheet.write_row(row_index, 0, row)
+            count += 1
+    workbook.close()
+    return count
+
+
+def export_admin_data(db, crypto_data, fmt: str = None):
+    """Выгрузка пользователей и позиций; возвращает [(имя файла, файл)] - файлы открыты с начала"""
+    fmt = fmt or Config.ADMIN_EXPORT_FORMAT
+    # select(таблица) отдает строки Core - без ORM-объектов и карты идентичности сессии
+    tables = [
+        ('Users', 'users.csv.gz', select(users_table).order_by(users_table.c.id), user_columns()),
+        ('Positions', 'positions.csv.gz', select(positions_table).order_by(positions_table.c.id),
+         position_columns(crypto_data)),
+    ]
+    if fmt == 'csv':
+        files = []
+        for _, filename, stmt, columns in tables:
+            output = spooled_file()
+            write_csv(output, columns, stream_rows(db, stmt, columns), compress=True)
+            output.seek(0)
+            files.append((filename, output))
+        return files
+
+    output = spooled_file()
+    write_xlsx(output, [
+        (sheet, columns, stream_rows(db, stmt, columns))
+        for sheet, _, stmt, columns in tables
+    ])
+    output.seek(0)
+    return [('trading_game_data.xlsx', output)]
+
+
+def export_user_history(db, user_id: int, crypto_data):
+    """CSV истории игрока; None, если выгружать нечего"""
+    stmt = select(positions_table).where(positions_table.c.user_id == user_id).order_by(positions_table.c.id)
+    columns = history_columns(crypto_data)
+    output = spooled_file()
+    if not write_csv(output, columns, stream_rows(db, stmt, columns)):
+        output.close()
+        return None
+    output.seek(0)
+    return output
@@ -1,10 +1,18 @@
-from telegram import Update
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, CallbackQueryHandler, CommandHandler
-from database import get_db, User, Position
+from sqlalchemy import select, func
+from database import get_async_db, run_in_session, User, Position
+from crypto_data import crypto_data
+from live_leaderboard import live_leaderboard
 from utils import calculate_rankings
+from exports import export_admin_data
 from config import Config
-import pandas as pd
-import io
+from user_cache import user_cache
+from chart_cache import chart_cache
+from render_pool import render_pool
+from notifier import notifier
+from datetime import datetime, timedelta
+import asyncio
 
 class AdminHandler:
     @staticmethod
@@ -52,24 +60,35 @@ class AdminHandler:
             await query.answer("⛔ Нет доступа")
             return
         
-        db = next(get_db())
-        
-        # Собираем статистику
-        total_users = db.query(User).count()
-        active_users = db.query(User).filter(
-            User.last_active >= datetime.utcnow() - timedelta(days=1)
-        ).count()
-        
-        total_positions = db.query(Position).count()
-        open_positions = db.query(Position).filter(Position.is_open == True).count()
-        
-        total_volume = db.query(Position).filter(Position.is_open == False).with_entities(
-            db.func.sum(Position.amount * Position.entry_price * Position.leverage)
-        ).scalar() or 0
-        
-        total_profit = db.query(User).with_entities(
-            db.func.sum(User.total_profit)
-        ).scalar() or 0
+        async with get_async_db() as db:
+            # Собираем статистику
+            total_users = await db.scalar(select(func.count(User.id)))
+            active_users = await db.scalar(select(func.count(User.id)).where(
+                User.last_active >= datetime.utcnow() - timedelta(days=1)
+            ))
+            
+            total_positions = await db.scalar(select(func.count(Position.id)))
+            open_positions = await db.scalar(
+                select(func.count(Position.id)).where(Position.is_open == True)
+            )
+            
+            total_volume = await db.scalar(
+                select(func.sum(Position.amount * Position.entry_price * Position.leverage))
+                .where(Position.is_open == False)
+            ) or 0
+            
+            total_profit = await db.scalar(select(func.sum(User.total_profit))) or 0
+            
+            avg_balance = await db.scalar(select(func.avg(User.balance))) or 0
+            avg_win_rate = await db.scalar(select(func.avg(User.win_rate))) or 0
+            avg_leverage = await db.scalar(
+                select(func.avg(Position.leverage)).where(Position.is_open == True)
+            ) or 0
+        
+        cache_stats = user_cache.stats()
+        chart_stats = chart_cache.stats()
+        render_stats = render_pool.stats()
+        notify_stats = notifier.stats()
         
         stats_text = f"""
 📊 Статистика бота:
@@ -85,9 +104,27 @@ class AdminHandler:
 • Общий PnL: ${total_profit:,.2f}
 
 💼 Средние показатели:
-• Средний баланс: ${(total_users > 0) and (db.query(db.func.avg(User.balance)).scalar() or 0):.2f}
-• Средний винрейт: {(total_users > 0) and (db.query(db.func.avg(User.win_rate)).scalar() or 0):.1f}%
-• Среднее плечо: {(open_positions > 0) and (db.query(db.func.avg(Position.leverage)).filter(Position.is_open == True).scalar() or 0):.1f}x
+• Средний баланс: ${avg_balance:.2f}
+• Средний винрейт: {avg_win_rate:.1f}%
+• Среднее плечо: {avg_leverage:.1f}x
+
+🗄 Кэш пользователей:
+• Записей: {cache_stats['size']}
+• Попадания: {cache_stats['hits']} ({cache_stats['hit_rate']:.0%})
+• Промахи: {cache_stats['misses']}
+
+🖼 Кэш графиков:
+• Графиков: {chart_stats['size']} ({chart_stats['bytes'] / 1024 / 1024:.1f} MB)
+• Попадания: {chart_stats['hits']} ({chart_stats['hit_rate']:.0%})
+• Очередь отрисовки: {render_stats['queue_depth']} (в работе {render_stats['in_flight']}/{render_stats['workers']})
+• Отрисовка p50/p95: {render_stats['render_p50_ms']:.0f}/{render_stats['render_p95_ms']:.0f} мс
+• Отклонено/таймауты: {render_stats['rejected']}/{render_stats['timeouts']}
+
+🔔 Уведомления:
+• В очереди: {notify_stats['queue_depth']}
+• Отправлено/склеено: {notify_stats['sent']}/{notify_stats['coalesced']}
+• Ошибки/429: {notify_stats['failed']}/{notify_stats['rate_limited']}
+• Доставка p50/p95: {notify_stats['latency_p50_ms']:.0f}/{notify_stats['latency_p95_ms']:.0f} мс
         """
         
         keyboard = [
@@ -100,6 +137,12 @@ class AdminHandler:
             reply_markup=InlineKeyboardMarkup(keyboard)
         )
     
+    @staticmethod
+    def update_rankings(db):
+        """Пересчет рейтингов и сверка с ними живого рейтинга"""
+        calculate_rankings(db)
+        live_leaderboard.reconcile(db)
+    
     @staticmethod
     async def admin_update_ranks(update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обновление рейтингов"""
@@ -110,10 +153,9 @@ class AdminHandler:
             await query.answer("⛔ Нет доступа")
             return
         
-        db = next(get_db())
-        
-        # Обновляем рейтинги
-        calculate_rankings(db)
+        # Пересчет и сверка живого рейтинга читают всех игроков - в потоке,
+        # чтобы не блокировать цикл событий
+        await asyncio.to_thread(run_in_session, AdminHandler.update_rankings)
         
         await query.answer("✅ Рейтинги обновлены")
     
@@ -127,68 +169,17 @@ class AdminHandler:
             await query.answer("⛔ Нет доступа")
             return
         
-        db = next(get_db())
-        
-        # Экспорт пользователей
-        users = db.query(User).all()
-        users_data = []
-        for user in users:
-            users_data.append({
-                'ID': user.id,
-                'Telegram ID': user.telegram_id,
-                'Username': user.username,
-                'Balance': user.balance,
-                'Total Profit': user.total_profit,
-                'Total Trades': user.total_trades,
-                'Win Rate': user.win_rate,
-                'Rank': user.rank,
-                'Registered': user.registered_at,
-                'Last Active': user.last_active
-            })
-        
-        users_df = pd.DataFrame(users_data)
-        
-        # Экспорт позиций
-        positions = db.query(Position).all()
-        positions_data = []
-        for pos in positions:
-            positions_data.append({
-                'ID': pos.id,
-                'User ID': pos.user_id,
-                'Symbol': pos.symbol,
-                'Type': pos.position_type.value,
-                'Leverage': pos.leverage,
-                'Entry Price': pos.entry_price,
-                'Current Price': pos.current_price,
-                'Amount': pos.amount,
-                'Margin': pos.margin,
-                'Unrealized PnL': pos.unrealized_pnl,
-                'Realized PnL': pos.realized_pnl,
-                'Liquidation Price': pos.liquidation_price,
-                'Stop Loss': pos.stop_loss,
-                'Take Profit': pos.take_profit,
-                'Is Open': pos.is_open,
-                'Opened At': pos.opened_at,
-                'Closed At': pos.closed_at
-            })
-        
-        positions_df = pd.DataFrame(positions_data)
-        
-        # Создаем Excel файл с несколькими листами
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-            users_df.to_excel(writer, sheet_name='Users', index=False)
-            positions_df.to_excel(writer, sheet_name='Positions', index=False)
-        
-        output.seek(0)
-        
-        # Отправляем файл
-        await context.bot.send_document(
-            chat_id=query.message.chat_id,
-            document=output,
-            filename='trading_game_data.xlsx',
-            caption='📊 Экспорт данных бота'
-        )
+        # Строки идут курсором порциями во временный файл, вне цикла событий
+        files = await asyncio.to_thread(run_in_session, export_admin_data, crypto_data)
+        
+        for filename, output in files:
+            with output:
+                await context.bot.send_document(
+                    chat_id=query.message.chat_id,
+                    document=output,
+                    filename=filename,
+                    caption='📊 Экспорт данных бота'
+                )
         
         await query.answer("Файл отправлен")
     
@@ -1,13 +1,46 @@
 from telegram import Update
 from telegram.ext import ContextTypes, CallbackQueryHandler
+from telegram.error import BadRequest
 from crypto_data import crypto_data
-from chart_generator import ChartGenerator
+from chart_cache import chart_cache
+from render_pool import render_pool, RenderQueueFull
 from keyboards import TradingKeyboards
-from database import get_db, Position
+from sqlalchemy import select
+from database import get_async_db, User, Position
 from utils import format_price
+import asyncio
 import io
 
 class ChartHandler:
+    @staticmethod
+    async def send_chart(context: ContextTypes.DEFAULT_TYPE, chat_id: int, key, render, caption: str):
+        """Отправка графика из кэша (по file_id или байтам) либо свежей отрисовки
+
+        render - корутина-функция, возвращающая PNG; key=None - без кэша.
+        """
+        chart = chart_cache.get(key) if key is not None else None
+        if chart is None:
+            try:
+                data = await render()
+            except (RenderQueueFull, asyncio.TimeoutError):
+                await context.bot.send_message(chat_id=chat_id, text="⏳ Графики сейчас перегружены, попробуйте позже")
+                return None
+            if key is None:
+                return await context.bot.send_photo(chat_id=chat_id, photo=data, caption=caption)
+            chart = chart_cache.put(key, data)
+        
+        if chart.file_id:
+            try:
+                return await context.bot.send_photo(chat_id=chat_id, photo=chart.file_id, caption=caption)
+            except BadRequest:
+                # file_id больше недействителен - загружаем байты заново
+                chart_cache.set_file_id(key, None)
+        
+        message = await context.bot.send_photo(chat_id=chat_id, photo=chart.data, caption=caption)
+        if getattr(message, 'photo', None):
+            chart_cache.set_file_id(key, message.photo[-1].file_id)
+        return message
+    
     @staticmethod
     async def chart_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Меню графиков"""
@@ -35,7 +68,7 @@ class ChartHandler:
             _, symbol, timeframe = query.data.split('_')
             
             # Получаем исторические данные
-            df = crypto_data.get_historical_data(symbol, timeframe)
+            df = await asyncio.to_thread(crypto_data.get_historical_data, symbol, timeframe)
             
             if df.empty:
                 await query.answer("Не удалось получить данные")
@@ -45,12 +78,12 @@ class ChartHandler:
             current_price = crypto_data.get_current_price(symbol)
             
             # Проверяем есть ли у пользователя открытая позиция по этой монете
-            db = next(get_db())
-            user_positions = db.query(Position).filter(
-                Position.user_id == query.from_user.id,
-                Position.symbol == symbol,
-                Position.is_open == True
-            ).first()
+            async with get_async_db() as db:
+                user_positions = await db.scalar(select(Position).join(User).where(
+                    User.telegram_id == query.from_user.id,
+                    Position.symbol == symbol,
+                    Position.is_open == True
+                ).limit(1))
             
             entry_price = None
             stop_loss = None
@@ -61,14 +94,17 @@ class ChartHandler:
                 stop_loss = user_positions.stop_loss
                 take_profit = user_positions.take_profit
             
-            # Генерируем график
-            chart_buffer = ChartGenerator.create_price_chart(
+            # График строится только при промахе кэша: без позиции он общий для всех,
+            # линия цены - по закрытию последней свечи, а не по тику
+            chart_key = chart_cache.key(symbol, timeframe, df, entry_price, stop_loss, take_profit)
+            render = lambda: render_pool.render(
+                'price',
                 df,
                 symbol,
                 entry_price,
                 stop_loss,
                 take_profit,
-                current_price
+                float(df['close'].iloc[-1])
             )
             
             # Подготавливаем текст
@@ -99,11 +135,7 @@ class ChartHandler:
                 """
             
             # Отправляем график
-            await context.bot.send_photo(
-                chat_id=query.message.chat_id,
-                photo=chart_buffer,
-                caption=chart_text
-            )
+            await ChartHandler.send_chart(context, query.message.chat_id, chart_key, render, chart_text)
             
             # Показываем меню выбора таймфрейма
             keyboard = TradingKeyboards.timeframe_menu(symbol)
@@ -120,18 +152,18 @@ class ChartHandler:
         if query.data.startswith('position_chart_'):
             position_id = int(query.data.replace('position_chart_', ''))
             
-            db = next(get_db())
-            position = db.query(Position).filter(
-                Position.id == position_id,
-                Position.user_id == query.from_user.id
-            ).first()
+            async with get_async_db() as db:
+                position = await db.scalar(select(Position).join(User).where(
+                    Position.id == position_id,
+                    User.telegram_id == query.from_user.id
+                ))
             
             if not position:
                 await query.answer("Позиция не найдена")
                 return
             
             # Получаем данные для графика
-            df = crypto_data.get_historical_data(position.symbol, '15m')
+            df = await asyncio.to_thread(crypto_data.get_historical_data, position.symbol, '15m')
             
             if df.empty:
                 await query.answer("Не удалось получить данные")
@@ -147,14 +179,19 @@ class ChartHandler:
                 position.position_type.value
             )
             
-            # Генерируем график
-            chart_buffer = ChartGenerator.create_price_chart(
+            # График строится только при промахе кэша (запись на набор уровней позиции)
+            chart_key = chart_cache.key(
+                position.symbol, '15m', df,
+                position.entry_price, position.stop_loss, position.take_profit
+            )
+            render = lambda: render_pool.render(
+                'price',
                 df,
                 position.symbol,
                 position.entry_price,
                 position.stop_loss,
                 position.take_profit,
-                current_price
+                float(df['close'].iloc[-1])
             )
             
             # Подготавливаем текст
@@ -177,11 +214,7 @@ class ChartHandler:
                 chart_text += f"\n🎯 Тейк-профит: ${position.take_profit:.2f}"
             
             # Отправляем график
-            await context.bot.send_photo(
-                chat_id=query.message.chat_id,
-                photo=chart_buffer,
-                caption=chart_text
-            )
+            await ChartHandler.send_chart(context, query.message.chat_id, chart_key, render, chart_text)
             
             await query.answer("График отправлен")
     
@@ -191,12 +224,11 @@ class ChartHandler:
         query = update.callback_query
         user_id = query.from_user.id
         
-        db = next(get_db())
-        
-        # Получаем историю PnL пользователя
-        positions = db.query(Position).filter(
-            Position.user_id == user_id
-        ).order_by(Position.opened_at).all()
+        async with get_async_db() as db:
+            # Получаем историю PnL пользователя
+            positions = (await db.scalars(select(Position).join(User).where(
+                User.telegram_id == user_id
+            ).order_by(Position.opened_at))).all()
         
         if not positions:
             await query.answer("Нет данных для графика")
@@ -225,13 +257,13 @@ class ChartHandler:
         if len(pnl_history) < 2:
             pnl_history = [0, current_pnl]  # Минимум 2 точки
         
-        chart_buffer = ChartGenerator.create_pnl_chart(pnl_history)
-        
-        # Отправляем график
-        await context.bot.send_photo(
-            chat_id=query.message.chat_id,
-            photo=chart_buffer,
-            caption="📉 История вашего PnL"
+        # Отправляем график (история PnL у каждого своя - без кэша)
+        await ChartHandler.send_chart(
+            context,
+            query.message.chat_id,
+            None,
+            lambda: render_pool.render('pnl', pnl_history),
+            "📉 История вашего PnL"
         )
         
         await query.answer("График отправлен")
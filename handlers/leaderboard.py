@@ -0,0 +1,72 @@
+from telegram import Update
+from telegram.ext import ContextTypes, CallbackQueryHandler
+from sqlalchemy import select
+from database import get_async_db, User, LeaderboardEntry
+from live_leaderboard import live_leaderboard
+from user_cache import user_cache
+from keyboards import TradingKeyboards
+from config import Config
+
+MEDALS = {1: '🥇', 2: '🥈', 3: '🥉'}
+
+class LeaderboardHandler:
+    @staticmethod
+    async def live_rows(db):
+        """Первые строки живого рейтинга с именами и статистикой из базы"""
+        top = live_leaderboard.top(Config.LEADERBOARD_SHOW)
+        users = {
+            user.id: user for user in await db.scalars(
+                select(User).where(User.id.in_([user_id for _, user_id, _ in top]))
+            )
+        }
+        return [
+            (rank, users[user_id].first_name or users[user_id].username, users[user_id])
+            for rank, user_id, _ in top if user_id in users
+        ]
+    
+    @staticmethod
+    async def leaderboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Таблица лидеров: живой рейтинг, до его загрузки - материализованная таблица"""
+        query = update.callback_query
+        
+        async with get_async_db() as db:
+            db_user = await user_cache.get_or_load(query.from_user.id, db)
+            if live_leaderboard.loaded:
+                # Свежее очко самого игрока видно сразу, не дожидаясь сверки
+                if db_user:
+                    row = (await db.execute(live_leaderboard.score_query([db_user.id]))).first()
+                    live_leaderboard.set_score(db_user.id, row[1] if row else None)
+                rows = await LeaderboardHandler.live_rows(db)
+                updated = None
+            else:
+                entries = (await db.scalars(
+                    select(LeaderboardEntry)
+                    .order_by(LeaderboardEntry.position)
+                    .limit(Config.LEADERBOARD_SHOW)
+                )).all()
+                rows = [(entry.rank, entry.name, entry) for entry in entries]
+                updated = entries[0].updated_at if entries else None
+        
+        if not rows:
+            text = "🏆 Рейтинг пока не рассчитан"
+        else:
+            text = "🏆 Лучшие трейдеры:\n\n" + "\n".join(
+                f"{MEDALS.get(rank, f'#{rank}')} {name or 'Трейдер'} — "
+                f"${stats.total_profit:,.2f} | {stats.win_rate:.0f}% | {stats.total_trades} сд."
+                for rank, name, stats in rows
+            )
+            if updated:
+                text += f"\n\n🕒 Обновлено: {updated:%d.%m %H:%M} UTC"
+        
+        rank = live_leaderboard.rank(db_user.id) if db_user and live_leaderboard.loaded else db_user and db_user.rank
+        if rank:
+            text += f"\n\n📍 Ваш ранг: #{rank}"
+        
+        await query.edit_message_text(text=text, reply_markup=TradingKeyboards.back_button('main'))
+    
+    @staticmethod
+    def get_handlers():
+        """Возвращает обработчики"""
+        return [
+            CallbackQueryHandler(LeaderboardHandler.leaderboard, pattern='^leaderboard$'),
+        ]
@@ -1,11 +1,17 @@
-from telegram import Update
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, CallbackQueryHandler
-from database import get_db, User, Position, Transaction
+from sqlalchemy import select
+from database import get_async_db, run_in_session, Position, Transaction
 from crypto_data import crypto_data
 from keyboards import TradingKeyboards
-from utils import calculate_portfolio_stats, format_time_delta, format_price, format_percentage
+from user_cache import user_cache
+from utils import (
+    calculate_portfolio_stats, format_time_delta, format_price, format_percentage,
+    position_mark_price
+)
+from exports import export_user_history
 from datetime import datetime
-import pandas as pd
+import asyncio
 
 class PortfolioHandler:
     @staticmethod
@@ -14,16 +20,18 @@ class PortfolioHandler:
         query = update.callback_query
         user_id = query.from_user.id
         
-        db = next(get_db())
-        db_user = db.query(User).filter(User.telegram_id == user_id).first()
+        async with get_async_db() as db:
+            db_user = await user_cache.get_or_load(user_id, db)
+            if db_user:
+                # Расчет статистики портфеля
+                stats = await db.run_sync(
+                    lambda session: calculate_portfolio_stats(db_user.id, session, crypto_data)
+                )
         
         if not db_user:
             await query.answer("Пользователь не найден")
             return
         
-        # Расчет статистики портфеля
-        stats = calculate_portfolio_stats(db_user.id, db)
-        
         portfolio_text = f"""
 💰 Ваш портфель:
 
@@ -57,18 +65,18 @@ class PortfolioHandler:
         query = update.callback_query
         user_id = query.from_user.id
         
-        db = next(get_db())
-        db_user = db.query(User).filter(User.telegram_id == user_id).first()
+        async with get_async_db() as db:
+            db_user = await user_cache.get_or_load(user_id, db)
+            if db_user:
+                positions = (await db.scalars(select(Position).where(
+                    Position.user_id == db_user.id,
+                    Position.is_open == True
+                ).order_by(Position.opened_at.desc()))).all()
         
         if not db_user:
             await query.answer("Пользователь не найден")
             return
         
-        positions = db.query(Position).filter(
-            Position.user_id == db_user.id,
-            Position.is_open == True
-        ).order_by(Position.opened_at.desc()).all()
-        
         if not positions:
             text = "📭 У вас нет открытых позиций"
         else:
@@ -76,9 +84,10 @@ class PortfolioHandler:
             
             for i, pos in enumerate(positions, 1):
                 # Расчет текущего PnL
+                mark_price = position_mark_price(pos, crypto_data)
                 pnl = crypto_data.calculate_pnl(
                     pos.entry_price,
-                    pos.current_price,
+                    mark_price,
                     pos.amount,
                     pos.leverage,
                     pos.position_type.value
@@ -91,16 +100,16 @@ class PortfolioHandler:
                 
                 # Расчет до ликвидации
                 if pos.position_type.value == 'long':
-                    liq_distance = ((pos.current_price - pos.liquidation_price) / pos.current_price) * 100
+                    liq_distance = ((mark_price - pos.liquidation_price) / mark_price) * 100
                 else:
-                    liq_distance = ((pos.liquidation_price - pos.current_price) / pos.current_price) * 100
+                    liq_distance = ((pos.liquidation_price - mark_price) / mark_price) * 100
                 
                 text += f"""
 {i}. {position_emoji} {pos.symbol} {pos.position_type.value.upper()} {pos.leverage}x
    {pnl_emoji} PnL: ${pnl:.2f} ({pnl_percent:+.1f}%)
    💰 Маржа: ${pos.margin:.2f}
    🎯 Вход: ${pos.entry_price:.2f}
-   📊 Текущая: ${pos.current_price:.2f}
+   📊 Текущая: ${mark_price:.2f}
    ⚠️ До ликвидации: {liq_distance:.1f}%
    ⏰ Открыта: {time_open}
    
@@ -124,24 +133,24 @@ class PortfolioHandler:
         query = update.callback_query
         user_id = query.from_user.id
         
-        db = next(get_db())
-        db_user = db.query(User).filter(User.telegram_id == user_id).first()
+        async with get_async_db() as db:
+            db_user = await user_cache.get_or_load(user_id, db)
+            if db_user:
+                # Получаем закрытые позиции
+                closed_positions = (await db.scalars(select(Position).where(
+                    Position.user_id == db_user.id,
+                    Position.is_open == False
+                ).order_by(Position.closed_at.desc()).limit(20))).all()
+                
+                # Получаем транзакции
+                transactions = (await db.scalars(select(Transaction).where(
+                    Transaction.user_id == db_user.id
+                ).order_by(Transaction.created_at.desc()).limit(20))).all()
         
         if not db_user:
             await query.answer("Пользователь не найден")
             return
         
-        # Получаем закрытые позиции
-        closed_positions = db.query(Position).filter(
-            Position.user_id == db_user.id,
-            Position.is_open == False
-        ).order_by(Position.closed_at.desc()).limit(20).all()
-        
-        # Получаем транзакции
-        transactions = db.query(Transaction).filter(
-            Transaction.user_id == db_user.id
-        ).order_by(Transaction.created_at.desc()).limit(20).all()
-        
         text = "📋 История сделок:\n\n"
         
         if not closed_positions and not transactions:
@@ -195,52 +204,27 @@ class PortfolioHandler:
         query = update.callback_query
         user_id = query.from_user.id
         
-        db = next(get_db())
-        db_user = db.query(User).filter(User.telegram_id == user_id).first()
+        async with get_async_db() as db:
+            db_user = await user_cache.get_or_load(user_id, db)
         
         if not db_user:
             await query.answer("Пользователь не найден")
             return
         
-        # Получаем данные для экспорта
-        positions = db.query(Position).filter(
-            Position.user_id == db_user.id
-        ).all()
-        
-        # Создаем DataFrame
-        data = []
-        for pos in positions:
-            data.append({
-                'ID': pos.id,
-                'Symbol': pos.symbol,
-                'Type': pos.position_type.value,
-                'Leverage': pos.leverage,
-                'Entry Price': pos.entry_price,
-                'Exit Price': pos.current_price if not pos.is_open else None,
-                'Amount': pos.amount,
-                'Margin': pos.margin,
-                'PnL': pos.realized_pnl if not pos.is_open else pos.unrealized_pnl,
-                'Status': 'OPEN' if pos.is_open else 'CLOSED',
-                'Opened At': pos.opened_at,
-                'Closed At': pos.closed_at
-            })
-        
-        df = pd.DataFrame(data)
+        # Выгрузка пишется построчно во временный файл вне цикла событий
+        output = await asyncio.to_thread(run_in_session, export_user_history, db_user.id, crypto_data)
         
-        if df.empty:
+        if output is None:
             await query.answer("Нет данных для экспорта")
             return
         
-        # Сохраняем в CSV
-        csv_data = df.to_csv(index=False)
-        
-        # Отправляем файл
-        await context.bot.send_document(
-            chat_id=query.message.chat_id,
-            document=io.BytesIO(csv_data.encode()),
-            filename=f"trading_history_{user_id}.csv",
-            caption="📊 Ваша история торговли"
-        )
+        with output:
+            await context.bot.send_document(
+                chat_id=query.message.chat_id,
+                document=output,
+                filename=f"trading_history_{user_id}.csv",
+                caption="📊 Ваша история торговли"
+            )
         
         await query.answer("Файл отправлен")
     
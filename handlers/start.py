@@ -1,6 +1,8 @@
 from telegram import Update, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, CallbackQueryHandler, CommandHandler
-from database import get_db, User
+from sqlalchemy import select
+from database import get_async_db, User
+from user_cache import user_cache
 from keyboards import TradingKeyboards
 from datetime import datetime
 
@@ -9,26 +11,26 @@ class StartHandler:
     async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик команды /start"""
         user = update.effective_user
-        db = next(get_db())
-        
-        # Проверяем существование пользователя
-        db_user = db.query(User).filter(User.telegram_id == user.id).first()
-        
-        if not db_user:
-            # Создаем нового пользователя
-            db_user = User(
-                telegram_id=user.id,
-                username=user.username,
-                first_name=user.first_name,
-                last_name=user.last_name,
-                balance=2000.0,
-                registered_at=datetime.utcnow(),
-                last_active=datetime.utcnow()
-            )
-            db.add(db_user)
-            db.commit()
+        async with get_async_db() as db:
+            # Проверяем существование пользователя
+            db_user = await db.scalar(select(User).where(User.telegram_id == user.id))
             
-            welcome_text = f"""
+            if not db_user:
+                # Создаем нового пользователя
+                db_user = User(
+                    telegram_id=user.id,
+                    username=user.username,
+                    first_name=user.first_name,
+                    last_name=user.last_name,
+                    balance=2000.0,
+                    registered_at=datetime.utcnow(),
+                    last_active=datetime.utcnow()
+                )
+                db.add(db_user)
+                await db.commit()
+                user_cache.put_user(db_user)
+                
+                welcome_text = f"""
 🎮 Добро пожаловать в Trading Game!
 
 📊 Вы получили начальный баланс: $2,000
@@ -42,13 +44,14 @@ class StartHandler:
 ⚠️ Внимание: Риск ликвидации при убытке >100%
 
 📈 Начните торговать прямо сейчас!
-            """
-        else:
-            # Обновляем время последней активности
-            db_user.last_active = datetime.utcnow()
-            db.commit()
-            
-            welcome_text = f"""
+                """
+            else:
+                # Обновляем время последней активности
+                db_user.last_active = datetime.utcnow()
+                await db.commit()
+                user_cache.put_user(db_user)
+                
+                welcome_text = f"""
 👋 С возвращением, {db_user.first_name}!
 
 💰 Ваш баланс: ${db_user.balance:.2f}
@@ -58,7 +61,7 @@ class StartHandler:
 🏆 Ваш ранг: #{db_user.rank}
 
 Выберите действие:
-            """
+                """
         
         keyboard = TradingKeyboards.main_menu()
         
@@ -112,9 +115,8 @@ class StartHandler:
     async def balance_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик команды /balance"""
         user = update.effective_user
-        db = next(get_db())
-        
-        db_user = db.query(User).filter(User.telegram_id == user.id).first()
+        async with get_async_db() as db:
+            db_user = await user_cache.get_or_load(user.id, db)
         
         if db_user:
             balance_text = f"""
@@ -1,15 +1,34 @@
-from telegram import Update
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, CallbackQueryHandler, MessageHandler, filters
-from database import get_db, User, Position, Order, OrderType, OrderSide, PositionType
+from sqlalchemy import select, func, delete, update
+from database import get_async_db, User, Position, Order, OrderType, OrderSide, PositionType
 from crypto_data import crypto_data
 from keyboards import TradingKeyboards
-from utils import validate_trade_amount, format_price
+from user_cache import user_cache
+from state_store import create_state_store
+from matching_engine import matching_engine, order_margin
+from user_stats import record_opened
+from utils import validate_trade_amount, format_price, position_mark_price
 from datetime import datetime
 import re
 
 class TradingHandler:
-    def __init__(self):
-        self.temp_data = {}  # Временное хранение данных для многошаговых операций
+    def __init__(self, state=None):
+        # Состояние многошаговых операций с TTL (память / SQLite / Redis)
+        self.state = state or create_state_store()
+    
+    @staticmethod
+    async def change_balance(db, user_id: int, delta: float):
+        """Атомарное изменение баланса в базе; списание - только при достаточном балансе.
+        Возвращает новый баланс или None, если средств не хватило"""
+        stmt = update(User).where(User.id == user_id)
+        if delta < 0:
+            stmt = stmt.where(User.balance >= -delta)
+        return (await db.execute(
+            stmt.values(balance=User.balance + delta)
+            .returning(User.balance)
+            .execution_options(synchronize_session=False)
+        )).scalar()
     
     async def trade_menu(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Меню торговли"""
@@ -26,7 +45,7 @@ class TradingHandler:
         
         if data.startswith('open_'):
             position_type = data.replace('open_', '')
-            self.temp_data[query.from_user.id] = {'position_type': position_type}
+            await self.state.set(query.from_user.id, {'position_type': position_type})
             
             keyboard = TradingKeyboards.coins_menu('select_coin')
             await query.edit_message_text(
@@ -41,10 +60,10 @@ class TradingHandler:
         
         if data.startswith('select_coin_'):
             symbol = data.replace('select_coin_', '')
-            user_data = self.temp_data.get(query.from_user.id, {})
+            user_data = await self.state.get(query.from_user.id) or {}
             user_data['symbol'] = symbol
             
-            self.temp_data[query.from_user.id] = user_data
+            await self.state.set(query.from_user.id, user_data)
             
             current_price = crypto_data.get_current_price(symbol)
             price_text = format_price(current_price)
@@ -64,9 +83,9 @@ class TradingHandler:
             _, symbol, position_type, leverage_str = data.split('_')
             leverage = int(leverage_str)
             
-            user_data = self.temp_data.get(query.from_user.id, {})
+            user_data = await self.state.get(query.from_user.id) or {}
             user_data['leverage'] = leverage
-            self.temp_data[query.from_user.id] = user_data
+            await self.state.set(query.from_user.id, user_data)
             
             current_price = crypto_data.get_current_price(symbol)
             price_text = format_price(current_price)
@@ -92,7 +111,7 @@ class TradingHandler:
                 'leverage': leverage,
                 'order_type': 'market'
             }
-            self.temp_data[query.from_user.id] = user_data
+            await self.state.set(query.from_user.id, user_data)
             
             current_price = crypto_data.get_current_price(symbol)
             price_text = format_price(current_price)
@@ -111,88 +130,186 @@ class TradingHandler:
             
             await query.edit_message_text(text=text)
             context.user_data['awaiting_amount'] = True
-    
-    async def process_amount(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Обработка ввода суммы"""
-        if not context.user_data.get('awaiting_amount'):
-            return
         
-        try:
-            amount = float(update.message.text)
-            user_id = update.effective_user.id
-            user_data = self.temp_data.get(user_id, {})
-            
-            if not user_data:
-                await update.message.reply_text("Сессия истекла. Начните заново.")
-                return
-            
-            # Проверяем баланс пользователя
-            db = next(get_db())
-            db_user = db.query(User).filter(User.telegram_id == user_id).first()
-            
-            if not db_user:
-                await update.message.reply_text("Пользователь не найден. Используйте /start")
-                return
-            
-            # Проверяем сумму
-            if not validate_trade_amount(amount, db_user.balance, user_data['leverage']):
-                await update.message.reply_text(
-                    f"❌ Недостаточно средств или сумма меньше ${10}\n"
-                    f"Ваш баланс: ${db_user.balance:.2f}\n"
-                    f"Мин. сумма: ${10}"
-                )
-                return
-            
-            # Проверяем максимальное количество позиций
-            open_positions = db.query(Position).filter(
-                Position.user_id == db_user.id,
-                Position.is_open == True
-            ).count()
+        elif data.startswith('limit_'):
+            _, symbol, position_type, leverage_str = data.split('_')
+            leverage = int(leverage_str)
             
-            if open_positions >= 5:
-                await update.message.reply_text("❌ У вас уже 5 открытых позиций. Закройте некоторые.")
-                return
+            user_data = {
+                'symbol': symbol,
+                'position_type': position_type,
+                'leverage': leverage,
+                'order_type': 'limit'
+            }
+            await self.state.set(query.from_user.id, user_data)
             
-            # Создаем позицию
-            symbol = user_data['symbol']
             current_price = crypto_data.get_current_price(symbol)
+            price_text = format_price(current_price)
+            condition = "ниже" if position_type == 'long' else "выше"
             
-            # Расчет маржи
-            margin = amount * user_data['leverage'] / 10
-            
-            # Расчет цены ликвидации
-            liquidation_price = crypto_data.calculate_liquidation_price(
-                current_price,
-                user_data['leverage'],
-                user_data['position_type'],
-                margin
-            )
+            text = f"""
+📊 Лимитный ордер
+
+Монета: {symbol}
+Направление: {position_type.upper()}
+Плечо: {leverage}x
+Текущая цена: {price_text}
+
+Введите цену входа ({condition} текущей):
+            """
             
-            position = Position(
-                user_id=db_user.id,
-                symbol=symbol,
-                position_type=PositionType.LONG if user_data['position_type'] == 'long' else PositionType.SHORT,
-                entry_price=current_price,
-                current_price=current_price,
-                amount=amount,
-                leverage=user_data['leverage'],
-                margin=margin,
-                liquidation_price=liquidation_price,
-                is_open=True,
-                opened_at=datetime.utcnow()
+            await query.edit_message_text(text=text)
+            context.user_data['awaiting_amount'] = True
+    
+    async def process_limit_price(self, update: Update, user_id: int, user_data: dict):
+        """Ввод цены лимитного ордера"""
+        price = float(update.message.text)
+        current_price = crypto_data.get_current_price(user_data['symbol'])
+        is_long = user_data['position_type'] == 'long'
+        
+        # Ордер по цене хуже рыночной исполнился бы сразу - для этого есть рыночный
+        if price <= 0 or (current_price and (price >= current_price if is_long else price <= current_price)):
+            condition = "ниже" if is_long else "выше"
+            await update.message.reply_text(
+                f"❌ Цена должна быть {condition} текущей ({format_price(current_price)})"
             )
-            
-            # Обновляем баланс пользователя
-            db_user.balance -= margin
-            
-            db.add(position)
-            db.commit()
-            
-            # Форматируем цены
-            entry_text = format_price(current_price)
-            liq_text = format_price(liquidation_price)
-            
-            success_text = f"""
+            return
+        
+        user_data['limit_price'] = price
+        await self.state.set(user_id, user_data)
+        await update.message.reply_text(
+            f"🎯 Цена ордера: {format_price(price)}\n\nВведите сумму в USDT (мин. $10):"
+        )
+    
+    async def place_limit_order(self, db, db_user, user_data: dict, amount: float):
+        """Выставление лимитного ордера: маржа резервируется сразу"""
+        symbol = user_data['symbol']
+        leverage = user_data['leverage']
+        price = user_data['limit_price']
+        margin = order_margin(amount, leverage)
+        
+        order = Order(
+            user_id=db_user.id,
+            symbol=symbol,
+            order_type=OrderType.LIMIT,
+            side=OrderSide.BUY if user_data['position_type'] == 'long' else OrderSide.SELL,
+            price=price,
+            amount=amount,
+            leverage=leverage,
+            filled=False,
+            created_at=datetime.utcnow()
+        )
+        # Баланс меняют и движки исполнения в других потоках - списание одним UPDATE
+        balance = await self.change_balance(db, db_user.id, -margin)
+        if balance is None:
+            await db.rollback()
+            return "❌ Недостаточно средств", False
+        db.add(order)
+        await db.commit()
+        user_cache.invalidate(db_user.telegram_id)
+        
+        return f"""
+✅ Лимитный ордер выставлен!
+
+📊 Детали:
+• Монета: {symbol}
+• Направление: {user_data['position_type'].upper()}
+• Плечо: {leverage}x
+• Сумма: ${amount:.2f}
+• Цена входа: {format_price(price)}
+• Зарезервировано: ${margin:.2f}
+
+💰 Новый баланс: ${balance:.2f}
+📋 Ордер исполнится, когда цена достигнет {format_price(price)}
+        """, True
+    
+    async def open_trade(self, db, user_id: int, user_data: dict, amount: float):
+        """Проверки и открытие позиции или лимитного ордера.
+        Возвращает текст ответа и признак успеха; в Telegram ничего не отправляет"""
+        # Проверяем баланс пользователя
+        db_user = await db.scalar(select(User).where(User.telegram_id == user_id))
+        
+        if not db_user:
+            return "Пользователь не найден. Используйте /start", False
+        
+        # Проверяем сумму
+        if not validate_trade_amount(amount, db_user.balance, user_data['leverage']):
+            return (
+                f"❌ Недостаточно средств или сумма меньше ${10}\n"
+                f"Ваш баланс: ${db_user.balance:.2f}\n"
+                f"Мин. сумма: ${10}"
+            ), False
+        
+        # Проверяем максимальное количество позиций (вместе с ожидающими ордерами)
+        open_positions = await db.scalar(select(func.count(Position.id)).where(
+            Position.user_id == db_user.id,
+            Position.is_open == True
+        ))
+        open_orders = await db.scalar(select(func.count(Order.id)).where(
+            Order.user_id == db_user.id,
+            Order.filled == False
+        ))
+        
+        if open_positions + open_orders >= 5:
+            return "❌ У вас уже 5 открытых позиций и ордеров. Закройте некоторые.", False
+        
+        if user_data.get('order_type') == 'limit':
+            return await self.place_limit_order(db, db_user, user_data, amount)
+        
+        # Создаем позицию
+        symbol = user_data['symbol']
+        current_price = crypto_data.get_current_price(symbol)
+        
+        # Расчет маржи
+        margin = amount * user_data['leverage'] / 10
+        
+        # Расчет цены ликвидации
+        liquidation_price = crypto_data.calculate_liquidation_price(
+            current_price,
+            user_data['leverage'],
+            user_data['position_type'],
+            margin
+        )
+        
+        position = Position(
+            user_id=db_user.id,
+            symbol=symbol,
+            position_type=PositionType.LONG if user_data['position_type'] == 'long' else PositionType.SHORT,
+            entry_price=current_price,
+            current_price=current_price,
+            amount=amount,
+            leverage=user_data['leverage'],
+            margin=margin,
+            liquidation_price=liquidation_price,
+            is_open=True,
+            opened_at=datetime.utcnow()
+        )
+        
+        # Обновляем баланс пользователя одним UPDATE
+        balance = await self.change_balance(db, db_user.id, -margin)
+        if balance is None:
+            await db.rollback()
+            return "❌ Недостаточно средств", False
+        
+        # Агрегаты игрока - до вставки позиции в той же транзакции
+        await db.run_sync(lambda session: record_opened(session, {
+            'user_id': [db_user.id], 'symbol': [symbol], 'is_long': [position.position_type == PositionType.LONG],
+            'amount': [amount], 'leverage': [position.leverage], 'entry_price': [current_price], 'margin': [margin],
+        }))
+        
+        db.add(position)
+        await db.commit()
+        # Индекс уровней ведет только процесс, проверяющий ликвидации (он его загружает);
+        # в остальных воркерах позиции в нем копились бы без удаления
+        if crypto_data.price_index.loaded:
+            crypto_data.price_index.add(position)
+        user_cache.invalidate(user_id)
+        
+        # Форматируем цены
+        entry_text = format_price(current_price)
+        liq_text = format_price(liquidation_price)
+        
+        return f"""
 ✅ Позиция открыта!
 
 📊 Детали:
@@ -204,17 +321,39 @@ class TradingHandler:
 • Маржа: ${margin:.2f}
 • Ликвидация: {liq_text}
 
-💰 Новый баланс: ${db_user.balance:.2f}
+💰 Новый баланс: ${balance:.2f}
 📈 Следите за позицией в разделе "Мои позиции"
-            """
+        """, True
+    
+    async def process_amount(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработка ввода суммы"""
+        if not context.user_data.get('awaiting_amount'):
+            return
+        
+        try:
+            amount = float(update.message.text)
+            user_id = update.effective_user.id
+            user_data = await self.state.get(user_id) or {}
+            
+            if not user_data:
+                await update.message.reply_text("Сессия истекла. Начните заново.")
+                return
             
-            await update.message.reply_text(success_text)
+            if user_data.get('order_type') == 'limit' and 'limit_price' not in user_data:
+                await self.process_limit_price(update, user_id, user_data)
+                return
             
-            # Сбрасываем состояние
-            context.user_data['awaiting_amount'] = False
-            if user_id in self.temp_data:
-                del self.temp_data[user_id]
-                
+            # Сессия закрывается до ответа в Telegram
+            async with get_async_db() as db:
+                text, done = await self.open_trade(db, user_id, user_data, amount)
+            
+            await update.message.reply_text(text)
+            
+            if done:
+                # Сбрасываем состояние
+                context.user_data['awaiting_amount'] = False
+                await self.state.delete(user_id)
+        
         except ValueError:
             await update.message.reply_text("❌ Пожалуйста, введите корректное число")
         except Exception as e:
@@ -226,18 +365,18 @@ class TradingHandler:
         query = update.callback_query
         user_id = query.from_user.id
         
-        db = next(get_db())
-        db_user = db.query(User).filter(User.telegram_id == user_id).first()
+        async with get_async_db() as db:
+            db_user = await user_cache.get_or_load(user_id, db)
+            if db_user:
+                positions = (await db.scalars(select(Position).where(
+                    Position.user_id == db_user.id,
+                    Position.is_open == True
+                ))).all()
         
         if not db_user:
             await query.answer("Пользователь не найден")
             return
         
-        positions = db.query(Position).filter(
-            Position.user_id == db_user.id,
-            Position.is_open == True
-        ).all()
-        
         if not positions:
             text = "📭 У вас нет открытых позиций"
             keyboard = TradingKeyboards.back_button('trade')
@@ -245,9 +384,10 @@ class TradingHandler:
             text = "📊 Ваши открытые позиции:\n\n"
             
             for pos in positions:
+                mark_price = position_mark_price(pos, crypto_data)
                 pnl = crypto_data.calculate_pnl(
                     pos.entry_price,
-                    pos.current_price,
+                    mark_price,
                     pos.amount,
                     pos.leverage,
                     pos.position_type.value
@@ -261,7 +401,7 @@ class TradingHandler:
 {pnl_emoji} PnL: ${pnl:.2f} ({pnl_percent:+.1f}%)
 💰 Маржа: ${pos.margin:.2f}
 🎯 Вход: ${pos.entry_price:.2f}
-📊 Текущая: ${pos.current_price:.2f}
+📊 Текущая: ${mark_price:.2f}
 🛑 Ликвидация: ${pos.liquidation_price:.2f}
                 """
             
@@ -271,6 +411,77 @@ class TradingHandler:
         
         await query.edit_message_text(text=text, reply_markup=keyboard)
     
+    async def my_orders(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Показать неисполненные лимитные ордера"""
+        query = update.callback_query
+        
+        async with get_async_db() as db:
+            db_user = await user_cache.get_or_load(query.from_user.id, db)
+            if db_user:
+                orders = (await db.scalars(select(Order).where(
+                    Order.user_id == db_user.id,
+                    Order.filled == False
+                ).order_by(Order.created_at))).all()
+        
+        if not db_user:
+            await query.answer("Пользователь не найден")
+            return
+        
+        if not orders:
+            await query.edit_message_text(
+                text="📭 У вас нет активных ордеров",
+                reply_markup=TradingKeyboards.back_button('trade')
+            )
+            return
+        
+        text = "📋 Ваши лимитные ордера:\n"
+        keyboard = []
+        for order in orders:
+            direction = 'LONG' if order.side == OrderSide.BUY else 'SHORT'
+            text += f"""
+{order.symbol} {direction} {order.leverage}x
+🎯 Цена: {format_price(order.price)}
+💰 Сумма: ${order.amount:.2f} (резерв ${order_margin(order.amount, order.leverage):.2f})
+"""
+            keyboard.append([InlineKeyboardButton(
+                f"❌ Отменить {order.symbol} {direction} @ {format_price(order.price)}",
+                callback_data=f"cancel_order_{order.id}"
+            )])
+        keyboard.append([InlineKeyboardButton("🔙 Назад", callback_data='back_trade')])
+        
+        await query.edit_message_text(text=text, reply_markup=InlineKeyboardMarkup(keyboard))
+    
+    async def cancel_order(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Отмена лимитного ордера с возвратом резерва"""
+        query = update.callback_query
+        order_id = int(query.data.replace('cancel_order_', ''))
+        
+        async with get_async_db() as db:
+            db_user = await db.scalar(select(User).where(User.telegram_id == query.from_user.id))
+            order = await db.scalar(select(Order).where(Order.id == order_id))
+            
+            # Условное удаление не даст отменить ордер, который уже забрал движок исполнения
+            cancelled = bool(db_user and order) and (await db.execute(delete(Order).where(
+                Order.id == order_id,
+                Order.user_id == db_user.id,
+                Order.filled == False
+            ))).rowcount == 1
+            
+            if cancelled:
+                book_entry = (order.id, order.symbol, order.side == OrderSide.BUY, order.price)
+                await self.change_balance(db, db_user.id, order_margin(order.amount, order.leverage))
+                await db.commit()
+        
+        if not cancelled:
+            await query.answer("Ордер уже исполнен или отменен")
+            await self.my_orders(update, context)
+            return
+        
+        matching_engine.remove_order(*book_entry)
+        user_cache.invalidate(query.from_user.id)
+        await query.answer("Ордер отменен")
+        await self.my_orders(update, context)
+    
     def get_handlers(self):
         """Возвращает обработчики"""
         return [
@@ -280,6 +491,8 @@ class TradingHandler:
             CallbackQueryHandler(self.process_leverage, pattern='^lev_'),
             CallbackQueryHandler(self.process_order_type, pattern='^(market|limit)_'),
             CallbackQueryHandler(self.my_positions, pattern='^my_positions$'),
+            CallbackQueryHandler(self.my_orders, pattern='^my_orders$'),
+            CallbackQueryHandler(self.cancel_order, pattern='^cancel_order_'),
             CallbackQueryHandler(self.trade_menu, pattern='^back_trade$'),
             MessageHandler(filters.TEXT & ~filters.COMMAND, self.process_amount)
         ]
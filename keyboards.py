@@ -23,6 +23,7 @@ class TradingKeyboards:
              InlineKeyboardButton("🔴 Открыть SHORT", callback_data='open_short')],
             [InlineKeyboardButton("📊 Мои позиции", callback_data='my_positions'),
              InlineKeyboardButton("❌ Закрыть позицию", callback_data='close_position')],
+            [InlineKeyboardButton("📋 Мои ордера", callback_data='my_orders')],
             [InlineKeyboardButton("🔙 Назад", callback_data='back_main')]
         ]
         return InlineKeyboardMarkup(keyboard)
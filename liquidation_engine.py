@@ -0,0 +1,206 @@
+from datetime import datetime
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import bindparam, case, select, update
+
+from database import Position, PositionType, User, chunked
+from user_stats import record_closed
+
+# Таблицы для Core-операций: bulk UPDATE без загрузки ORM-объектов
+positions_table = Position.__table__
+
+
+class LiquidatedPosition(NamedTuple):
+    """Данные ликвидированной позиции для уведомления пользователя"""
+    id: int
+    user_id: int
+    telegram_id: int
+    symbol: str
+    position_type: str
+    leverage: int
+    entry_price: float
+    liquidation_price: float
+    margin: float
+    current_price: float
+    balance: float
+
+
+def pnl_expression(price: float):
+    """SQL-выражение нереализованного PnL открытой позиции по цене price"""
+    return case(
+        (
+            Position.position_type == PositionType.LONG,
+            (price - Position.entry_price) * Position.amount * Position.leverage,
+        ),
+        else_=(Position.entry_price - price) * Position.amount * Position.leverage,
+    )
+
+
+def refresh_pnl(db, prices: Dict[str, float]) -> None:
+    """Обновление текущей цены и PnL открытых позиций: один UPDATE на символ
+
+    Строки, уже записанные по этой цене, не перезаписываются.
+    """
+    for symbol, price in prices.items():
+        if not price:
+            continue
+        db.execute(
+            update(Position)
+            .where(
+                Position.is_open == True,
+                Position.symbol == symbol,
+                Position.current_price != price,
+            )
+            .values(current_price=price, unrealized_pnl=pnl_expression(price))
+            .execution_options(synchronize_session=False)
+        )
+
+
+class LiquidationEngine:
+    """Векторизованная проверка ликвидаций по колоночным массивам позиций"""
+
+    COLUMNS = (
+        'id', 'user_id', 'symbol', 'is_long',
+        'entry_price', 'amount', 'leverage', 'liquidation_price', 'margin',
+    )
+
+    def __init__(self, chunk_size: int = 500):
+        self.chunk_size = chunk_size
+
+    def load_open_positions(
+        self,
+        db,
+        symbols: Optional[Iterable[str]] = None,
+        position_ids: Optional[Sequence[int]] = None
+    ) -> Dict[str, np.ndarray]:
+        """Загрузка открытых позиций в виде колонок NumPy"""
+        stmt = select(
+            Position.id,
+            Position.user_id,
+            Position.symbol,
+            (Position.position_type == PositionType.LONG).label('is_long'),
+            Position.entry_price,
+            Position.amount,
+            Position.leverage,
+            Position.liquidation_price,
+            Position.margin,
+        ).where(Position.is_open == True)
+
+        if symbols is not None:
+            stmt = stmt.where(Position.symbol.in_(list(symbols)))
+
+        if position_ids is not None:
+            rows = []
+            for chunk in chunked(list(position_ids), self.chunk_size):
+                rows.extend(db.execute(stmt.where(Position.id.in_(chunk))).all())
+        else:
+            rows = db.execute(stmt).all()
+
+        if not rows:
+            return {name: np.empty(0) for name in self.COLUMNS}
+
+        ids, user_ids, syms, is_long, entry, amount, leverage, liq, margin = zip(*rows)
+        return {
+            'id': np.asarray(ids, dtype=np.int64),
+            'user_id': np.asarray(user_ids, dtype=np.int64),
+            'symbol': np.asarray(syms, dtype=object),
+            'is_long': np.asarray(is_long, dtype=bool),
+            'entry_price': np.asarray(entry, dtype=np.float64),
+            'amount': np.asarray(amount, dtype=np.float64),
+            'leverage': np.asarray(leverage, dtype=np.int64),
+            'liquidation_price': np.asarray(liq, dtype=np.float64),
+            'margin': np.asarray(margin, dtype=np.float64),
+        }
+
+    @staticmethod
+    def current_prices(columns: Dict[str, np.ndarray], prices: Dict[str, float]) -> np.ndarray:
+        """Текущая цена для каждой позиции (группировка по символу)"""
+        if not len(columns['symbol']):
+            return np.empty(0)
+        symbols, inverse = np.unique(columns['symbol'], return_inverse=True)
+        by_symbol = np.array([prices.get(s) or 0.0 for s in symbols], dtype=np.float64)
+        return by_symbol[inverse]
+
+    @staticmethod
+    def find_breaches(columns: Dict[str, np.ndarray], current: np.ndarray) -> np.ndarray:
+        """Маска позиций, пробивших цену ликвидации"""
+        liq = columns['liquidation_price']
+        is_long = columns['is_long']
+        # Без известной цены позицию не ликвидируем
+        known = current > 0
+        return known & np.where(is_long, current <= liq, current >= liq)
+
+    def run(
+        self,
+        db,
+        prices: Dict[str, float],
+        position_ids: Optional[Sequence[int]] = None
+    ) -> List[LiquidatedPosition]:
+        """Ликвидация позиций; изменения пишутся bulk UPDATE, коммит за вызывающим"""
+        columns = self.load_open_positions(db, prices.keys(), position_ids)
+        current = self.current_prices(columns, prices)
+        mask = self.find_breaches(columns, current)
+
+        if not mask.any():
+            return []
+
+        ids = columns['id'][mask]
+        user_ids = columns['user_id'][mask]
+        margins = columns['margin'][mask]
+        closed_prices = current[mask]
+        now = datetime.utcnow()
+
+        # Агрегаты и статистика игроков - до закрытия позиций в той же транзакции
+        record_closed(db, {name: values[mask] for name, values in columns.items()}, -margins, liquidated=True)
+
+        # Закрываем позиции: потеря всей маржи
+        db.execute(
+            update(positions_table)
+            .where(positions_table.c.id == bindparam('pid'))
+            .values(
+                is_open=False,
+                closed_at=now,
+                current_price=bindparam('price'),
+                realized_pnl=bindparam('pnl'),
+            ),
+            [
+                {'pid': int(pid), 'price': float(price), 'pnl': -float(margin)}
+                for pid, price, margin in zip(ids, closed_prices, margins)
+            ]
+        )
+
+        # Маржа списана с баланса при открытии позиции: ликвидация ее не возвращает,
+        # второй раз баланс не меняется (как и закрытие по стоп-лоссу в trigger_engine)
+        accounts = {}
+        for chunk in chunked(np.unique(user_ids).tolist(), self.chunk_size):
+            accounts.update({
+                uid: (telegram_id, balance)
+                for uid, telegram_id, balance in db.execute(
+                    select(User.id, User.telegram_id, User.balance).where(User.id.in_(chunk))
+                )
+            })
+
+        liquidated = []
+        for i in np.flatnonzero(mask):
+            user_id = int(columns['user_id'][i])
+            telegram_id, balance = accounts[user_id]
+            liquidated.append(LiquidatedPosition(
+                id=int(columns['id'][i]),
+                user_id=user_id,
+                telegram_id=telegram_id,
+                symbol=columns['symbol'][i],
+                position_type='long' if columns['is_long'][i] else 'short',
+                leverage=int(columns['leverage'][i]),
+                entry_price=float(columns['entry_price'][i]),
+                liquidation_price=float(columns['liquidation_price'][i]),
+                margin=float(columns['margin'][i]),
+                current_price=float(current[i]),
+                balance=balance,
+            ))
+
+        return liquidated
+
+
+# Глобальный экземпляр
+liquidation_engine = LiquidationEngine()
@@ -0,0 +1,248 @@
+import logging
+import threading
+import time
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, select
+
+from database import User, chunked
+
+logger = logging.getLogger(__name__)
+
+
+def ranking_score(users=User):
+    """Рейтинговое очко игрока (SQL-выражение; можно настроить формулу)"""
+    return (
+        func.coalesce(users.total_profit, 0.0) * 0.5 +
+        func.coalesce(users.win_rate, 0.0) * 1000 +
+        func.coalesce(users.total_trades, 0) * 10
+    )
+
+
+class RankedScores:
+    """Игроки, упорядоченные по убыванию очков, с порядковой статистикой
+
+    Ключи (-score, user_id) лежат в отсортированных блоках ограниченного
+    размера, дерево Фенвика хранит размеры блоков. Ранг игрока и позиция
+    в таблице находятся за O(log n), вставка сдвигает только один блок.
+    """
+
+    def __init__(self, block_size: int = 512):
+        self.block_size = block_size
+        self.blocks: List[List[Tuple[float, int]]] = []
+        self.maxes: List[Tuple[float, int]] = []  # последний ключ каждого блока
+        self.tree: List[int] = [0]
+        self.scores: Dict[int, float] = {}
+
+    def __len__(self) -> int:
+        return len(self.scores)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self.scores
+
+    def _rebuild_tree(self):
+        tree = [0] * (len(self.blocks) + 1)
+        for i, block in enumerate(self.blocks, 1):
+            tree[i] += len(block)
+            parent = i + (i & -i)
+            if parent < len(tree):
+                tree[parent] += tree[i]
+        self.tree = tree
+
+    def _tree_add(self, block: int, delta: int):
+        i = block + 1
+        while i < len(self.tree):
+            self.tree[i] += delta
+            i += i & -i
+
+    def _prefix(self, block: int) -> int:
+        """Число ключей в блоках до block"""
+        total = 0
+        while block > 0:
+            total += self.tree[block]
+            block -= block & -block
+        return total
+
+    def load(self, items: Iterable[Tuple[int, float]]):
+        """Построение из пар (user_id, score) одной сортировкой"""
+        keys = sorted((-score, user_id) for user_id, score in items)
+        self.scores = {user_id: -score for score, user_id in keys}
+        self.blocks = [keys[i:i + self.block_size] for i in range(0, len(keys), self.block_size)]
+        self.maxes = [block[-1] for block in self.blocks]
+        self._rebuild_tree()
+
+    def _insert(self, key: Tuple[float, int]):
+        if not self.blocks:
+            self.blocks, self.maxes = [[key]], [key]
+            self._rebuild_tree()
+            return
+        b = min(bisect_left(self.maxes, key), len(self.blocks) - 1)
+        block = self.blocks[b]
+        insort(block, key)
+        self.maxes[b] = block[-1]
+        if len(block) > 2 * self.block_size:
+            half = len(block) // 2
+            self.blocks[b:b + 1] = [block[:half], block[half:]]
+            self.maxes[b:b + 1] = [block[half - 1], block[-1]]
+            self._rebuild_tree()
+        else:
+            self._tree_add(b, 1)
+
+    def _remove(self, key: Tuple[float, int]):
+        b = bisect_left(self.maxes, key)
+        block = self.blocks[b]
+        del block[bisect_left(block, key)]
+        if block:
+            self.maxes[b] = block[-1]
+            self._tree_add(b, -1)
+        else:
+            del self.blocks[b], self.maxes[b]
+            self._rebuild_tree()
+
+    def set(self, user_id: int, score: float) -> bool:
+        """Вставка или перемещение игрока; False, если очко не изменилось"""
+        old = self.scores.get(user_id)
+        if old == score:
+            return False
+        if old is not None:
+            self._remove((-old, user_id))
+        self._insert((-score, user_id))
+        self.scores[user_id] = score
+        return True
+
+    def discard(self, user_id: int) -> bool:
+        score = self.scores.pop(user_id, None)
+        if score is None:
+            return False
+        self._remove((-score, user_id))
+        return True
+
+    def _count_before(self, key) -> int:
+        b = bisect_left(self.maxes, key)
+        if b == len(self.blocks):
+            return len(self.scores)
+        return self._prefix(b) + bisect_left(self.blocks[b], key)
+
+    def rank(self, user_id: int) -> Optional[int]:
+        """Ранг как RANK(): 1 + число игроков со строго большим очком"""
+        score = self.scores.get(user_id)
+        if score is None:
+            return None
+        # (-score,) меньше любого ключа (-score, user_id) - считаются только лучшие очки
+        return self._count_before((-score,)) + 1
+
+    def top(self, limit: int) -> List[Tuple[int, int, float]]:
+        """Первые limit игроков: (ранг, user_id, очко)"""
+        rows = []
+        rank, previous = 0, None
+        for block in self.blocks:
+            for score, user_id in block:
+                if len(rows) == limit:
+                    return rows
+                if score != previous:
+                    rank, previous = len(rows) + 1, score
+                rows.append((rank, user_id, -score))
+        return rows
+
+
+class LiveLeaderboard:
+    """Живой рейтинг в памяти процесса
+
+    Загружается из базы при старте, обновляется по пользователям, чья
+    статистика изменилась при закрытии позиций, и периодически сверяется
+    с базой: другие процессы меняют статистику без уведомления этого.
+    """
+
+    def __init__(self, chunk_size: int = 500):
+        self.chunk_size = chunk_size
+        self.scores = RankedScores()
+        self.loaded = False
+        self.reconciled_at = None
+        self.corrections = 0  # расхождений найдено при последней сверке
+        self.lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self.scores)
+
+    @staticmethod
+    def score_query(user_ids=None):
+        """Запрос (id, очко) торговавших игроков"""
+        stmt = select(User.id, ranking_score()).where(User.total_trades > 0)
+        if user_ids is not None:
+            stmt = stmt.where(User.id.in_(user_ids))
+        return stmt
+
+    def _score_rows(self, db, user_ids=None):
+        return db.execute(self.score_query(user_ids).execution_options(yield_per=10_000))
+
+    def load(self, db):
+        """Полная загрузка очков всех торговавших игроков"""
+        scores = RankedScores(self.scores.block_size)
+        scores.load(self._score_rows(db))
+        with self.lock:
+            self.scores = scores
+            self.loaded = True
+            self.reconciled_at = time.time()
+
+    def refresh_users(self, db, user_ids: Iterable[int]) -> int:
+        """Перечитывание очков игроков, чья статистика изменилась"""
+        user_ids = sorted(set(user_ids))
+        changed = 0
+        for chunk in chunked(user_ids, self.chunk_size):
+            fresh = dict(self._score_rows(db, chunk).all())
+            with self.lock:
+                for user_id in chunk:
+                    if user_id in fresh:
+                        changed += self.scores.set(user_id, fresh[user_id])
+                    else:
+                        changed += self.scores.discard(user_id)
+        return changed
+
+    def set_score(self, user_id: int, score: Optional[float]) -> bool:
+        """Обновление по уже прочитанному очку; None - игрок еще не торговал"""
+        with self.lock:
+            if score is None:
+                return self.scores.discard(user_id)
+            return self.scores.set(user_id, score)
+
+    def reconcile(self, db) -> int:
+        """Сверка с базой; возвращает число исправленных игроков"""
+        if not self.loaded:
+            self.load(db)
+            return 0
+        fresh = dict(self._score_rows(db).all())
+        with self.lock:
+            current = self.scores.scores
+            stale = [user_id for user_id in current if user_id not in fresh]
+            changed = [(user_id, score) for user_id, score in fresh.items() if current.get(user_id) != score]
+        corrections = len(stale) + len(changed)
+        if corrections > len(fresh) // 4:
+            # Массовые расхождения дешевле исправить перестроением
+            scores = RankedScores(self.scores.block_size)
+            scores.load(fresh.items())
+            with self.lock:
+                self.scores = scores
+        elif corrections:
+            with self.lock:
+                for user_id in stale:
+                    self.scores.discard(user_id)
+                for user_id, score in changed:
+                    self.scores.set(user_id, score)
+        if corrections:
+            logger.info(f"Live leaderboard reconciled: {corrections} corrections, {len(fresh)} players")
+        self.corrections = corrections
+        self.reconciled_at = time.time()
+        return corrections
+
+    def rank(self, user_id: int) -> Optional[int]:
+        with self.lock:
+            return self.scores.rank(user_id)
+
+    def top(self, limit: int) -> List[Tuple[int, int, float]]:
+        with self.lock:
+            return self.scores.top(limit)
+
+
+# Глобальный экземпляр
+live_leaderboard = LiveLeaderboard()
@@ -0,0 +1,224 @@
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import ccxt
+import numpy as np
+
+from config import Config
+
+SECONDS_PER_YEAR = 365 * 24 * 3600
+SECONDS_PER_DAY = 24 * 3600
+
+DEFAULT_PRICES = {
+    'BTC/USDT': 45000.0,
+    'ETH/USDT': 2400.0,
+    'BNB/USDT': 300.0,
+}
+
+
+class MarketSimulator:
+    """Векторизованный генератор цен: геометрическое броуновское движение
+    с коррелированными шоками и пуассоновскими скачками
+
+    drift и volatility - годовые, jump_intensity - среднее число скачков
+    в сутки, jump_size - стандартное отклонение скачка логарифма цены,
+    correlation - попарная корреляция шоков всех символов.
+    """
+
+    def __init__(
+        self,
+        symbols: Sequence[str],
+        prices: Optional[Dict[str, float]] = None,
+        drift: float = None,
+        volatility: float = None,
+        jump_intensity: float = None,
+        jump_size: float = None,
+        correlation: float = None,
+        tick_seconds: float = None,
+        seed: Optional[int] = None,
+        start_ms: Optional[int] = None
+    ):
+        self.symbols: List[str] = list(symbols)
+        self.index = {symbol: i for i, symbol in enumerate(self.symbols)}
+        prices = prices or {}
+        self.prices = np.array(
+            [prices.get(s, DEFAULT_PRICES.get(s, 100.0)) for s in self.symbols], dtype=np.float64
+        )
+        self.drift = drift if drift is not None else Config.SIM_DRIFT
+        self.volatility = volatility if volatility is not None else Config.SIM_VOLATILITY
+        self.jump_intensity = jump_intensity if jump_intensity is not None else Config.SIM_JUMP_INTENSITY
+        self.jump_size = jump_size if jump_size is not None else Config.SIM_JUMP_SIZE
+        self.correlation = correlation if correlation is not None else Config.SIM_CORRELATION
+        self.tick_seconds = tick_seconds if tick_seconds is not None else Config.SIM_TICK_SECONDS
+        self.rng = np.random.default_rng(seed)
+        self.now_ms = start_ms if start_ms is not None else int(time.time() * 1000)
+        self.cholesky = self.correlation_factor(len(self.symbols), self.correlation)
+
+    @staticmethod
+    def correlation_factor(size: int, correlation: float) -> np.ndarray:
+        """Множитель Холецкого для матрицы с одинаковой попарной корреляцией"""
+        matrix = np.full((size, size), correlation, dtype=np.float64)
+        np.fill_diagonal(matrix, 1.0)
+        return np.linalg.cholesky(matrix)
+
+    def log_returns(self, steps: int, seconds: float, columns: int = None) -> np.ndarray:
+        """Приращения логарифма цены за steps шагов длиной seconds: (steps, columns)
+
+        Без columns шоки коррелированы между всеми символами.
+        """
+        correlated = columns is None
+        columns = len(self.symbols) if correlated else columns
+        dt = seconds / SECONDS_PER_YEAR
+
+        shocks = self.rng.standard_normal((steps, columns))
+        if correlated:
+            shocks = shocks @ self.cholesky.T
+        returns = (self.drift - 0.5 * self.volatility ** 2) * dt + self.volatility * np.sqrt(dt) * shocks
+
+        if self.jump_intensity > 0 and self.jump_size > 0:
+            # Сумма k нормальных скачков ~ N(0, k * jump_size^2)
+            jumps = self.rng.poisson(self.jump_intensity * seconds / SECONDS_PER_DAY, (steps, columns))
+            returns += self.rng.standard_normal((steps, columns)) * self.jump_size * np.sqrt(jumps)
+        return returns
+
+    def step(self, steps: int = 1) -> np.ndarray:
+        """Продвижение на steps тиков; возвращает путь цен (steps, symbols)"""
+        path = self.prices * np.exp(np.cumsum(self.log_returns(steps, self.tick_seconds), axis=0))
+        self.prices = path[-1].copy()
+        self.now_ms += int(steps * self.tick_seconds * 1000)
+        return path
+
+    def tick(self) -> Dict[str, float]:
+        """Один тик: текущие цены всех символов"""
+        self.step()
+        return self.current_prices()
+
+    def current_prices(self) -> Dict[str, float]:
+        return {symbol: float(price) for symbol, price in zip(self.symbols, self.prices)}
+
+    def price(self, symbol: str) -> float:
+        i = self.index.get(symbol)
+        return float(self.prices[i]) if i is not None else DEFAULT_PRICES.get(symbol, 100.0)
+
+    def candles(
+        self,
+        seconds: float,
+        count: int,
+        end_price: float,
+        start_price: Optional[float] = None,
+        substeps: int = 16
+    ) -> np.ndarray:
+        """Свечи (count, 5): open, high, low, close, volume
+
+        Путь строится из substeps шагов на свечу и заканчивается в end_price;
+        при заданном start_price это броуновский мост между двумя ценами.
+        """
+        if count <= 0:
+            return np.empty((0, 5))
+
+        returns = self.log_returns(count * substeps, seconds / substeps, columns=1)[:, 0]
+        log_path = np.concatenate([[0.0], np.cumsum(returns)])
+        if start_price is None:
+            log_path += np.log(end_price) - log_path[-1]
+        else:
+            target = np.log(end_price / start_price)
+            log_path += np.linspace(0.0, 1.0, len(log_path)) * (target - log_path[-1])
+            log_path += np.log(start_price)
+        path = np.exp(log_path)
+
+        segments = path[np.arange(count)[:, None] * substeps + np.arange(substeps + 1)]
+        volume = self.rng.integers(1000, 100000, count).astype(np.float64)
+        return np.column_stack([
+            segments[:, 0],
+            segments.max(axis=1),
+            segments.min(axis=1),
+            segments[:, -1],
+            volume,
+        ])
+
+
+class SimulatedExchange:
+    """Биржа поверх MarketSimulator с интерфейсом ccxt (fetch_tickers / fetch_ohlcv)
+
+    Каждый запрос тикеров продвигает симулятор на один тик. Выданные свечи
+    запоминаются, поэтому повторные запросы и догрузка по since согласованы.
+    """
+
+    has = {'fetchTickers': True, 'fetchOHLCV': True}
+
+    def __init__(self, simulator: MarketSimulator, max_candles: int = None):
+        self.simulator = simulator
+        self.max_candles = max_candles if max_candles is not None else Config.CANDLE_STORE_MAX_CANDLES
+        self.history: Dict[Tuple[str, str], Tuple[np.ndarray, np.ndarray]] = {}
+
+    def _ticker(self, symbol: str) -> dict:
+        return {'symbol': symbol, 'last': self.simulator.price(symbol), 'timestamp': self.simulator.now_ms}
+
+    def fetch_tickers(self, symbols: Optional[Sequence[str]] = None) -> Dict[str, dict]:
+        self.simulator.step()
+        symbols = symbols or self.simulator.symbols
+        return {symbol: self._ticker(symbol) for symbol in symbols if symbol in self.simulator.index}
+
+    def fetch_ticker(self, symbol: str) -> dict:
+        self.simulator.step()
+        return self._ticker(symbol)
+
+    def fetch_ohlcv(self, symbol: str, timeframe: str = '1h', since: Optional[int] = None, limit: int = 100) -> List[list]:
+        seconds = ccxt.Exchange.parse_timeframe(timeframe)
+        step_ms = seconds * 1000
+        current = self.simulator.now_ms // step_ms * step_ms
+        price = self.simulator.price(symbol)
+        key = (symbol, timeframe)
+
+        if key not in self.history:
+            rows = self.simulator.candles(seconds, limit, price)
+            timestamps = current - np.arange(limit)[::-1] * step_ms
+        else:
+            timestamps, rows = self.history[key]
+            new = int((current - timestamps[-1]) // step_ms)
+            if new > 0:
+                # Новые свечи продолжают путь от закрытия последней сохраненной
+                rows = np.vstack([rows, self.simulator.candles(seconds, new, price, start_price=rows[-1, 3])])
+                timestamps = np.concatenate([timestamps, timestamps[-1] + np.arange(1, new + 1) * step_ms])
+            else:
+                # Текущая свеча еще не закрыта - обновляем ее по последней цене
+                rows = rows.copy()
+                rows[-1, 1] = max(rows[-1, 1], price)
+                rows[-1, 2] = min(rows[-1, 2], price)
+                rows[-1, 3] = price
+
+        if since is None and len(rows) < limit:
+            # Недостающая история достраивается назад до открытия первой свечи
+            older = limit - len(rows)
+            rows = np.vstack([self.simulator.candles(seconds, older, rows[0, 0]), rows])
+            timestamps = np.concatenate([timestamps[0] - np.arange(older, 0, -1) * step_ms, timestamps])
+
+        if self.max_candles and len(rows) > self.max_candles:
+            rows = rows[-self.max_candles:]
+            timestamps = timestamps[-self.max_candles:]
+        self.history[key] = (timestamps, rows)
+
+        if since is not None:
+            selected = np.flatnonzero(timestamps >= since)[:limit]
+        else:
+            selected = np.arange(len(rows))[-limit:]
+        return [[int(timestamps[i]), *map(float, rows[i])] for i in selected]
+
+
+class AsyncSimulatedExchange:
+    """Асинхронный интерфейс к SimulatedExchange для параллельной загрузки тикеров"""
+
+    def __init__(self, exchange: SimulatedExchange):
+        self.exchange = exchange
+
+    async def fetch_ticker(self, symbol: str) -> dict:
+        return self.exchange.fetch_ticker(symbol)
+
+    async def close(self):
+        pass
+
+
+def create_simulated_exchange(symbols: Sequence[str] = None, seed: Optional[int] = None) -> SimulatedExchange:
+    """Симулированная биржа с параметрами из Config"""
+    seed = seed if seed is not None else Config.SIM_SEED
+    return SimulatedExchange(MarketSimulator(symbols or Config.AVAILABLE_COINS, seed=seed))
@@ -0,0 +1,258 @@
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional, Sequence, Set
+
+import numpy as np
+from sqlalchemy import insert, select, update
+
+from config import Config
+from database import Order, OrderSide, OrderType, Position, PositionType, User, chunked
+from price_index import SortedLevels
+from user_stats import record_opened
+
+# Таблицы для Core-операций: bulk INSERT/UPDATE без загрузки ORM-объектов
+orders_table = Order.__table__
+positions_table = Position.__table__
+
+
+def order_margin(amount: float, leverage: int):
+    """Маржа, резервируемая под ордер (та же формула, что и для рыночной сделки)"""
+    return amount * leverage / 10
+
+
+def liquidation_prices(entry: np.ndarray, leverage: np.ndarray, is_long: np.ndarray) -> np.ndarray:
+    """Цены ликвидации для массива позиций (как CryptoData.calculate_liquidation_price)"""
+    offset = 1 / leverage - Config.MAINTENANCE_MARGIN
+    return np.where(is_long, entry * (1 - offset), entry * (1 + offset))
+
+
+class FilledOrder(NamedTuple):
+    """Данные исполненного лимитного ордера для уведомления пользователя"""
+    id: int
+    position_id: int
+    user_id: int
+    telegram_id: int
+    symbol: str
+    position_type: str
+    leverage: int
+    price: float
+    amount: float
+    margin: float
+    liquidation_price: float
+
+
+class OrderBook:
+    """Лимитные ордера одного символа, отсортированные по цене
+
+    Покупка исполняется, когда цена опускается до лимита, продажа - когда
+    поднимается. Пересеченные ордера покупки образуют хвост массива, продажи -
+    его начало, поэтому все они снимаются одним срезом.
+    """
+    __slots__ = ('buys', 'sells')
+
+    def __init__(self):
+        self.buys = SortedLevels()
+        self.sells = SortedLevels()
+
+    def __len__(self) -> int:
+        return len(self.buys) + len(self.sells)
+
+    def side(self, is_buy: bool) -> SortedLevels:
+        return self.buys if is_buy else self.sells
+
+    def pop_crossed(self, price: float) -> List[int]:
+        """Снятие всех ордеров, пересеченных ценой price"""
+        buys, sells = self.buys, self.sells
+        start = len(buys.prices) - len(buys.at_or_above(price))
+        end = len(sells.at_or_below(price))
+        crossed = buys.ids[start:] + sells.ids[:end]
+        del buys.prices[start:], buys.ids[start:]
+        del sells.prices[:end], sells.ids[:end]
+        return crossed
+
+
+class MatchingEngine:
+    """Книги лимитных ордеров по символам и их исполнение по тикам цен
+
+    Книги заполняются из базы при первом тике и догружаются ордерами,
+    выставленными с начала прошлой загрузки (окно по created_at с
+    перекрытием SYNC_OVERLAP), поэтому ордера любого процесса бота попадают
+    в книгу ведущего, даже если коммитятся не в порядке id. Отмененный в
+    другом процессе ордер остается в книге до пересечения и отбрасывается
+    при сверке с базой.
+    """
+
+    def __init__(self, chunk_size: int = 500):
+        self.chunk_size = chunk_size
+        self.books: Dict[str, OrderBook] = {}
+        self.loaded = False
+        self.order_ids: Set[int] = set()  # ордера в книгах - повторно из окна не добавляются
+        self.synced_at: Optional[datetime] = None
+        self.lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return sum(len(book) for book in self.books.values())
+
+    def book(self, symbol: str) -> OrderBook:
+        if symbol not in self.books:
+            self.books[symbol] = OrderBook()
+        return self.books[symbol]
+
+    def _unfilled(self, db, since: Optional[datetime] = None):
+        stmt = (
+            select(Order.id, Order.symbol, Order.side == OrderSide.BUY, Order.price)
+            .where(Order.filled == False, Order.order_type == OrderType.LIMIT)
+            .order_by(Order.price, Order.id)
+        )
+        if since is not None:
+            stmt = stmt.where(Order.created_at >= since)
+        return db.execute(stmt)
+
+    def load(self, db):
+        """Полная загрузка неисполненных ордеров; строки уже отсортированы по цене"""
+        with self.lock:
+            self.books = {}
+            self.order_ids = set()
+            self.synced_at = datetime.utcnow()
+            for order_id, symbol, is_buy, price in self._unfilled(db):
+                levels = self.book(symbol).side(bool(is_buy))
+                levels.prices.append(price)
+                levels.ids.append(order_id)
+                self.order_ids.add(order_id)
+            self.loaded = True
+
+    def load_new(self, db) -> int:
+        """Догрузка ордеров, выставленных с начала прошлой загрузки"""
+        with self.lock:
+            started = datetime.utcnow()
+            count = 0
+            for order_id, symbol, is_buy, price in self._unfilled(
+                db, self.synced_at - timedelta(seconds=Config.SYNC_OVERLAP)
+            ):
+                if order_id in self.order_ids:
+                    continue
+                self.book(symbol).side(bool(is_buy)).add(price, order_id)
+                self.order_ids.add(order_id)
+                count += 1
+            self.synced_at = started
+            return count
+
+    def sync(self, db):
+        if not self.loaded:
+            self.load(db)
+        else:
+            self.load_new(db)
+
+    def remove_order(self, order_id: int, symbol: str, is_buy: bool, price: float) -> bool:
+        """Удаление отмененного ордера из книги"""
+        with self.lock:
+            book = self.books.get(symbol)
+            self.order_ids.discard(order_id)
+            return book is not None and book.side(is_buy).remove(price, order_id)
+
+    def crossed(self, prices: Dict[str, float]) -> List[int]:
+        """Снятие из книг всех ордеров, пересеченных текущими ценами"""
+        with self.lock:
+            order_ids = []
+            for symbol, price in prices.items():
+                book = self.books.get(symbol)
+                if book is not None and price:
+                    order_ids += book.pop_crossed(price)
+            self.order_ids.difference_update(order_ids)
+            return order_ids
+
+    def fill(self, db, order_ids: Sequence[int]) -> List[FilledOrder]:
+        """Исполнение ордеров по их лимитной цене: позиции открываются bulk INSERT,
+        маржа уже зарезервирована при выставлении; коммит за вызывающим"""
+        now = datetime.utcnow()
+        rows = []
+        # UPDATE ... RETURNING атомарно забирает только еще не исполненные и не отмененные ордера
+        stmt = (
+            update(orders_table)
+            .where(orders_table.c.filled == False)
+            .values(filled=True, filled_at=now)
+            .returning(
+                orders_table.c.id, orders_table.c.user_id, orders_table.c.symbol,
+                orders_table.c.side == OrderSide.BUY, orders_table.c.price,
+                orders_table.c.amount, orders_table.c.leverage,
+            )
+        )
+        for chunk in chunked(list(order_ids), self.chunk_size):
+            rows.extend(db.execute(stmt.where(orders_table.c.id.in_(chunk))).all())
+        if not rows:
+            return []
+
+        ids, user_ids, symbols, is_buy, price, amount, leverage = zip(*rows)
+        telegram_ids = {}
+        for chunk in chunked(sorted(set(user_ids)), self.chunk_size):
+            telegram_ids.update(db.execute(select(User.id, User.telegram_id).where(User.id.in_(chunk))).all())
+        is_long = np.asarray(is_buy, dtype=bool)
+        price = np.asarray(price, dtype=np.float64)
+        amount = np.asarray(amount, dtype=np.float64)
+        leverage = np.asarray(leverage, dtype=np.int64)
+        margin = order_margin(amount, leverage)
+        liquidation = liquidation_prices(price, leverage, is_long)
+
+        price, amount, leverage, margin, liquidation, is_long = (
+            values.tolist() for values in (price, amount, leverage, margin, liquidation, is_long)
+        )
+        # Агрегаты игроков - до вставки позиций в той же транзакции
+        record_opened(db, {
+            'user_id': user_ids, 'symbol': symbols, 'is_long': is_long, 'amount': amount,
+            'leverage': leverage, 'entry_price': price, 'margin': margin,
+        })
+        # id новых позиций в порядке строк - для индекса уровней
+        position_ids = db.scalars(insert(positions_table).returning(
+            positions_table.c.id, sort_by_parameter_order=True
+        ), [
+            {
+                'user_id': user_ids[i],
+                'symbol': symbols[i],
+                'position_type': PositionType.LONG if is_long[i] else PositionType.SHORT,
+                'entry_price': price[i],
+                'current_price': price[i],
+                'amount': amount[i],
+                'leverage': leverage[i],
+                'margin': margin[i],
+                'liquidation_price': liquidation[i],
+                'unrealized_pnl': 0.0,
+                'realized_pnl': 0.0,
+                'is_open': True,
+                'opened_at': now,
+            }
+            for i in range(len(ids))
+        ]).all()
+
+        return [
+            FilledOrder(
+                id=ids[i],
+                position_id=position_ids[i],
+                user_id=user_ids[i],
+                telegram_id=telegram_ids[user_ids[i]],
+                symbol=symbols[i],
+                position_type='long' if is_long[i] else 'short',
+                leverage=leverage[i],
+                price=price[i],
+                amount=amount[i],
+                margin=margin[i],
+                liquidation_price=liquidation[i],
+            )
+            for i in range(len(ids))
+        ]
+
+    def match(self, db, prices: Dict[str, float]) -> List[FilledOrder]:
+        """Один проход по тику: догрузка книг, снятие пересеченных ордеров и их исполнение"""
+        self.sync(db)
+        order_ids = self.crossed(prices)
+        if not order_ids:
+            return []
+        try:
+            return self.fill(db, order_ids)
+        except Exception:
+            # Снятые из книги ордера не исполнены - при следующем тике книги перечитываются
+            self.loaded = False
+            raise
+
+
+# Глобальный экземпляр
+matching_engine = MatchingEngine()
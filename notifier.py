@@ -0,0 +1,184 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+from config import Config
+from render_pool import percentile_ms
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Ограничение частоты: rate токенов в секунду, запас до capacity
+
+    reserve() сразу списывает токен (баланс может уйти в минус) и возвращает,
+    сколько нужно подождать, - поэтому конкурентным корутинам не нужна блокировка.
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        """Списание токена; возвращает задержку до отправки в секундах"""
+        self._refill(time.monotonic())
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def idle(self, now: float) -> bool:
+        """Запас полностью восстановлен - ведро можно забыть"""
+        return self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+
+class PendingNotification:
+    """Накопленные для одного чата события и время первого из них"""
+    __slots__ = ('items', 'enqueued_at')
+
+    def __init__(self, enqueued_at: float):
+        self.items: List[Any] = []
+        self.enqueued_at = enqueued_at
+
+
+class NotificationDispatcher:
+    """Очередь уведомлений с параллельной отправкой
+
+    События одного вида для одного чата, еще не отправленные, склеиваются
+    в одно сообщение. Частота ограничена общим ведром токенов и ведром на чат,
+    ответ 429 (RetryAfter) приостанавливает всех отправителей на указанное время.
+    """
+
+    MAX_CHAT_BUCKETS = 10000
+
+    def __init__(self, workers: int = None, global_rate: float = None, chat_rate: float = None,
+                 max_retries: int = None):
+        self.workers = workers if workers is not None else Config.NOTIFY_WORKERS
+        self.global_bucket = TokenBucket(global_rate if global_rate is not None else Config.NOTIFY_GLOBAL_RATE)
+        self.chat_rate = chat_rate if chat_rate is not None else Config.NOTIFY_CHAT_RATE
+        self.max_retries = max_retries if max_retries is not None else Config.NOTIFY_MAX_RETRIES
+        self.formatters: Dict[str, Callable[[List[Any]], str]] = {}
+        self.chat_buckets: 'OrderedDict[int, TokenBucket]' = OrderedDict()
+        self.pending: Dict[Tuple[int, str], PendingNotification] = {}
+        self.queue: Optional[asyncio.Queue] = None
+        self.tasks: List[asyncio.Task] = []
+        self.bot = None
+        self.paused_until = 0.0
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.coalesced = 0
+        self.latencies = deque(maxlen=1000)
+
+    def register(self, kind: str, formatter: Callable[[List[Any]], str]):
+        """Формирование текста сообщения из накопленных событий вида kind"""
+        self.formatters[kind] = formatter
+
+    def start(self, bot):
+        """Запуск отправителей в текущем event loop"""
+        self.bot = bot
+        self.queue = asyncio.Queue()
+        self.tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self, timeout: float = 10.0):
+        """Досылка очереди (не дольше timeout) и остановка отправителей"""
+        if self.queue is not None:
+            try:
+                await asyncio.wait_for(self.queue.join(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Notification queue not drained: {len(self.pending)} chats pending")
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    def notify(self, chat_id: int, kind: str, item: Any):
+        """Постановка события в очередь; не блокирует"""
+        key = (chat_id, kind)
+        entry = self.pending.get(key)
+        if entry is None:
+            entry = self.pending[key] = PendingNotification(time.monotonic())
+            self.queue.put_nowait(key)
+        else:
+            self.coalesced += 1
+        entry.items.append(item)
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self.chat_buckets) >= self.MAX_CHAT_BUCKETS:
+                now = time.monotonic()
+                for old_id in [i for i, b in self.chat_buckets.items() if b.idle(now)]:
+                    del self.chat_buckets[old_id]
+            bucket = self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, 1.0)
+        return bucket
+
+    async def _throttle(self, chat_id: int):
+        await asyncio.sleep(self._chat_bucket(chat_id).reserve())
+        await asyncio.sleep(self.global_bucket.reserve())
+        while self.paused_until > time.monotonic():
+            await asyncio.sleep(self.paused_until - time.monotonic())
+
+    async def _worker(self):
+        while True:
+            key = await self.queue.get()
+            try:
+                await self._deliver(key)
+            except Exception as e:
+                logger.error(f"Notification worker error: {e}")
+            finally:
+                self.queue.task_done()
+
+    async def _deliver(self, key: Tuple[int, str]):
+        chat_id, kind = key
+        # Пока ждем лимит, к сообщению успевают добавиться новые события
+        await self._throttle(chat_id)
+        entry = self.pending.pop(key)
+        text = self.formatters[kind](entry.items)
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                await self.bot.send_message(chat_id=chat_id, text=text)
+                self.sent += 1
+                self.latencies.append(time.monotonic() - entry.enqueued_at)
+                return
+            except RetryAfter as e:
+                self.rate_limited += 1
+                self.paused_until = max(self.paused_until, time.monotonic() + float(e.retry_after))
+            except (Forbidden, BadRequest) as e:
+                # Пользователь заблокировал бота или чат недоступен - повтор не поможет
+                logger.info(f"Notification to {chat_id} dropped: {e}")
+                break
+            except NetworkError as e:
+                logger.warning(f"Notification to {chat_id} failed (attempt {attempt + 1}): {e}")
+                await asyncio.sleep(min(2 ** attempt, 30))
+            if attempt < self.max_retries:
+                self.retries += 1
+                await self._throttle(chat_id)
+        self.failed += 1
+
+    def stats(self) -> Dict[str, float]:
+        latencies = list(self.latencies)
+        return {
+            'queue_depth': self.queue.qsize() if self.queue is not None else 0,
+            'sent': self.sent,
+            'failed': self.failed,
+            'retries': self.retries,
+            'rate_limited': self.rate_limited,
+            'coalesced': self.coalesced,
+            'latency_p50_ms': percentile_ms(latencies, 50),
+            'latency_p95_ms': percentile_ms(latencies, 95),
+        }
+
+
+# Глобальный экземпляр
+notifier = NotificationDispatcher()
@@ -0,0 +1,193 @@
+import asyncio
+import csv
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional
+
+from sqlalchemy import bindparam, insert, select, update
+
+from config import Config
+from database import LatestPrice, SessionLocal
+
+logger = logging.getLogger(__name__)
+
+
+class PriceTick(NamedTuple):
+    """Изменение цены символа"""
+    symbol: str
+    price: float
+    previous: Optional[float]
+    timestamp: float
+
+
+Subscriber = Callable[[List[PriceTick]], Awaitable[None]]
+
+
+class ExchangePriceSource:
+    """Цены с биржи через CryptoData"""
+
+    def __init__(self, crypto_data):
+        self.crypto_data = crypto_data
+
+    async def fetch(self) -> Dict[str, float]:
+        await self.crypto_data.update_prices_async()
+        return dict(self.crypto_data.prices)
+
+
+class ReplayPriceSource:
+    """Воспроизведение цен из CSV-файла с колонками timestamp,symbol,price
+
+    Строки с одинаковым timestamp образуют один тик; каждый вызов fetch
+    возвращает следующий тик, после конца файла возвращается пустой словарь.
+    """
+
+    def __init__(self, path: str, loop: bool = False):
+        self.frames: List[Dict[str, float]] = []
+        self.loop = loop
+        self.position = 0
+
+        with open(path, newline='') as f:
+            current_ts = None
+            for row in csv.DictReader(f):
+                if row['timestamp'] != current_ts:
+                    current_ts = row['timestamp']
+                    self.frames.append({})
+                self.frames[-1][row['symbol']] = float(row['price'])
+
+    @property
+    def exhausted(self) -> bool:
+        return not self.loop and self.position >= len(self.frames)
+
+    async def fetch(self) -> Dict[str, float]:
+        if not self.frames or self.exhausted:
+            return {}
+        frame = self.frames[self.position % len(self.frames)]
+        self.position += 1
+        return dict(frame)
+
+
+prices_table = LatestPrice.__table__
+
+
+def publish_prices(db, prices: Dict[str, float], now: float = None):
+    """Запись цен ведущего для остальных процессов; коммит за вызывающим"""
+    now = now or time.time()
+    symbol = prices_table.c.symbol
+    existing = set(db.scalars(select(symbol).where(symbol.in_(list(prices)))))
+    rows = [{'sym': s, 'price': price} for s, price in prices.items() if s in existing]
+    if rows:
+        db.execute(
+            update(prices_table).where(symbol == bindparam('sym'))
+            .values(price=bindparam('price'), updated_at=now),
+            rows
+        )
+    new_rows = [
+        {'symbol': s, 'price': price, 'updated_at': now}
+        for s, price in prices.items() if s not in existing
+    ]
+    if new_rows:
+        db.execute(insert(prices_table), new_rows)
+
+
+class SharedPriceSource:
+    """Цены, опубликованные ведущим процессом в таблице latest_prices
+
+    Биржу опрашивает только ведущий; остальные процессы получают лишь
+    цены, обновленные с прошлого опроса, поэтому возраст цен в CryptoData
+    отражает ленту ведущего.
+    """
+
+    def __init__(self, session_factory=None):
+        self.session_factory = session_factory or SessionLocal
+        self.published: Dict[str, float] = {}
+
+    def _read(self):
+        with self.session_factory() as db:
+            return db.execute(select(prices_table.c.symbol, prices_table.c.price, prices_table.c.updated_at)).all()
+
+    async def fetch(self) -> Dict[str, float]:
+        rows = await asyncio.to_thread(self._read)
+        fresh = {symbol: price for symbol, price, updated_at in rows if self.published.get(symbol) != updated_at}
+        self.published.update({symbol: updated_at for symbol, _, updated_at in rows})
+        return fresh
+
+
+def create_price_source(crypto_data):
+    """Источник цен согласно Config.PRICE_SOURCE
+
+    Для 'simulator' CryptoData сам работает с симулированной биржей.
+    """
+    if Config.PRICE_SOURCE == 'replay':
+        return ReplayPriceSource(Config.PRICE_REPLAY_FILE, loop=True)
+    return ExchangePriceSource(crypto_data)
+
+
+class PriceFeed:
+    """Единственный источник обновления цен с рассылкой тиков подписчикам"""
+
+    def __init__(self, crypto_data, source=None, interval: float = None):
+        self.crypto_data = crypto_data
+        self.source = source or create_price_source(crypto_data)
+        self.interval = interval if interval is not None else Config.UPDATE_INTERVAL
+        self.subscribers: List[Subscriber] = []
+        self.task: Optional[asyncio.Task] = None
+
+    def subscribe(self, callback: Subscriber) -> Subscriber:
+        """Подписка на тики; подписчики вызываются в порядке подписки"""
+        self.subscribers.append(callback)
+        return callback
+
+    def unsubscribe(self, callback: Subscriber):
+        if callback in self.subscribers:
+            self.subscribers.remove(callback)
+
+    async def poll_once(self) -> List[PriceTick]:
+        """Один опрос источника и рассылка тиков по изменившимся символам"""
+        previous = dict(self.crypto_data.prices)
+        prices = await self.source.fetch()
+        prices = {symbol: price for symbol, price in prices.items() if price}
+        if not prices:
+            return []
+
+        self.crypto_data.set_prices(prices)
+
+        # Подписчики получают только символы, цена которых изменилась
+        now = time.time()
+        ticks = [
+            PriceTick(symbol, price, previous.get(symbol), now)
+            for symbol, price in prices.items()
+            if price != previous.get(symbol)
+        ]
+        if ticks:
+            await self.publish(ticks)
+        return ticks
+
+    async def publish(self, ticks: List[PriceTick]):
+        for callback in list(self.subscribers):
+            try:
+                await callback(ticks)
+            except Exception as e:
+                logger.error(f"Price feed subscriber {callback!r} failed: {e}")
+
+    async def run(self):
+        """Цикл опроса источника"""
+        while True:
+            try:
+                await self.poll_once()
+            except Exception as e:
+                logger.error(f"Error in price feed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> asyncio.Task:
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+        return self.task
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
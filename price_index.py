@@ -0,0 +1,218 @@
+import threading
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import select
+
+from config import Config
+from database import Position, PositionType
+
+KINDS = ('liquidation', 'stop_loss', 'take_profit')
+
+
+class SortedLevels:
+    """Отсортированный массив ценовых уровней с идентификаторами"""
+    __slots__ = ('prices', 'ids')
+
+    def __init__(self):
+        self.prices: List[float] = []
+        self.ids: List[int] = []
+
+    def __len__(self) -> int:
+        return len(self.prices)
+
+    def add(self, price: float, item_id: int):
+        i = bisect_right(self.prices, price)
+        self.prices.insert(i, price)
+        self.ids.insert(i, item_id)
+
+    def remove(self, price: float, item_id: int) -> bool:
+        i = bisect_left(self.prices, price)
+        while i < len(self.prices) and self.prices[i] == price:
+            if self.ids[i] == item_id:
+                del self.prices[i]
+                del self.ids[i]
+                return True
+            i += 1
+        return False
+
+    def remove_many(self, item_ids: Set[int]) -> int:
+        """Удаление набора идентификаторов за один проход"""
+        keep = [i for i, item_id in enumerate(self.ids) if item_id not in item_ids]
+        removed = len(self.ids) - len(keep)
+        if removed:
+            self.prices = [self.prices[i] for i in keep]
+            self.ids = [self.ids[i] for i in keep]
+        return removed
+
+    def at_or_below(self, price: float) -> List[int]:
+        """Идентификаторы уровней <= price"""
+        return self.ids[:bisect_right(self.prices, price)]
+
+    def at_or_above(self, price: float) -> List[int]:
+        """Идентификаторы уровней >= price"""
+        return self.ids[bisect_left(self.prices, price):]
+
+
+class PriceIndex:
+    """Индекс уровней ликвидации, стоп-лосса и тейк-профита по символу и стороне
+
+    Сработавшие позиции удаляются из индекса при закрытии, поэтому срез
+    по текущей цене совпадает с диапазоном, пересеченным с прошлого тика,
+    а стоимость проверки пропорциональна числу сработавших позиций.
+
+    Позиции других процессов догружаются по opened_at с перекрытием
+    SYNC_OVERLAP: id не годится как курсор - строки с меньшим id
+    (другие процессы, последовательности Postgres) коммитятся позже.
+    """
+
+    def __init__(self):
+        self.levels: Dict[Tuple[str, bool, str], SortedLevels] = {}
+        self.entries: Dict[int, Tuple[str, bool, Dict[str, float]]] = {}
+        self.loaded = False
+        self.synced_at: Optional[datetime] = None  # начало последней загрузки из базы
+        # Индекс меняют и обработчики, и проверка ликвидаций в рабочем потоке
+        self.lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, position_id: int) -> bool:
+        return position_id in self.entries
+
+    def _levels(self, symbol: str, is_long: bool, kind: str) -> SortedLevels:
+        key = (symbol, is_long, kind)
+        if key not in self.levels:
+            self.levels[key] = SortedLevels()
+        return self.levels[key]
+
+    def add_position(
+        self,
+        position_id: int,
+        symbol: str,
+        is_long: bool,
+        liquidation_price: float,
+        stop_loss: Optional[float] = None,
+        take_profit: Optional[float] = None
+    ):
+        """Добавление (или замена) уровней позиции"""
+        with self.lock:
+            if position_id in self.entries:
+                self.remove_position(position_id)
+
+            prices = {
+                'liquidation': liquidation_price,
+                'stop_loss': stop_loss,
+                'take_profit': take_profit,
+            }
+            prices = {kind: price for kind, price in prices.items() if price}
+            for kind, price in prices.items():
+                self._levels(symbol, is_long, kind).add(price, position_id)
+            self.entries[position_id] = (symbol, is_long, prices)
+
+    def add(self, position: Position):
+        """Добавление ORM-позиции"""
+        self.add_position(
+            position.id,
+            position.symbol,
+            position.position_type == PositionType.LONG,
+            position.liquidation_price,
+            position.stop_loss,
+            position.take_profit
+        )
+
+    def remove_position(self, position_id: int) -> bool:
+        """Удаление позиции из индекса"""
+        with self.lock:
+            entry = self.entries.pop(position_id, None)
+            if entry is None:
+                return False
+            symbol, is_long, prices = entry
+            for kind, price in prices.items():
+                self._levels(symbol, is_long, kind).remove(price, position_id)
+            return True
+
+    def remove_positions(self, position_ids: Iterable[int]) -> int:
+        """Удаление многих позиций: один проход по каждому затронутому уровню
+
+        Поштучное удаление перебирает все позиции с той же ценой уровня,
+        а после резкого движения цены закрываются тысячи позиций сразу.
+        """
+        with self.lock:
+            by_level: Dict[Tuple[str, bool, str], Set[int]] = {}
+            removed = 0
+            for position_id in position_ids:
+                entry = self.entries.pop(position_id, None)
+                if entry is None:
+                    continue
+                removed += 1
+                symbol, is_long, prices = entry
+                for kind in prices:
+                    by_level.setdefault((symbol, is_long, kind), set()).add(position_id)
+            for key, ids in by_level.items():
+                self.levels[key].remove_many(ids)
+            return removed
+
+    def _load_rows(self, db, since: Optional[datetime] = None):
+        stmt = select(
+            Position.id,
+            Position.symbol,
+            (Position.position_type == PositionType.LONG).label('is_long'),
+            Position.liquidation_price,
+            Position.stop_loss,
+            Position.take_profit,
+        ).where(Position.is_open == True)
+        if since is not None:
+            stmt = stmt.where(Position.opened_at >= since)
+        rows = db.execute(stmt)
+        count = 0
+        for position_id, symbol, is_long, liquidation, stop_loss, take_profit in rows:
+            if position_id not in self.entries:
+                self.add_position(position_id, symbol, bool(is_long), liquidation, stop_loss, take_profit)
+                count += 1
+        return count
+    
+    def load(self, db):
+        """Полная загрузка открытых позиций из базы"""
+        with self.lock:
+            self.levels = {}
+            self.entries = {}
+            self.synced_at = datetime.utcnow()
+            self._load_rows(db)
+            self.loaded = True
+    
+    def load_new(self, db) -> int:
+        """Догрузка позиций, открытых после последней загрузки (в том числе другими процессами)
+
+        Позиция, закоммиченная позже начала прошлой загрузки, попадает в окно,
+        если между ее opened_at и коммитом прошло меньше SYNC_OVERLAP секунд.
+        """
+        with self.lock:
+            started = datetime.utcnow()
+            count = self._load_rows(db, self.synced_at - timedelta(seconds=Config.SYNC_OVERLAP))
+            self.synced_at = started
+            return count
+
+    def triggered(self, symbol: str, price: float) -> Dict[str, List[int]]:
+        """Позиции, уровни которых достигнуты при цене price"""
+        with self.lock:
+            result = {}
+            for kind in KINDS:
+                long_levels = self.levels.get((symbol, True, kind))
+                short_levels = self.levels.get((symbol, False, kind))
+                ids = []
+                if kind == 'take_profit':
+                    # Тейк-профит лонга - рост цены, шорта - падение
+                    if long_levels:
+                        ids += long_levels.at_or_below(price)
+                    if short_levels:
+                        ids += short_levels.at_or_above(price)
+                else:
+                    # Ликвидация и стоп-лосс лонга - падение цены, шорта - рост
+                    if long_levels:
+                        ids += long_levels.at_or_above(price)
+                    if short_levels:
+                        ids += short_levels.at_or_below(price)
+                result[kind] = ids
+            return result
@@ -0,0 +1,141 @@
+import asyncio
+import multiprocessing
+import threading
+import time
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Dict, Optional
+
+import numpy as np
+
+from config import Config
+
+
+class RenderQueueFull(Exception):
+    """Очередь отрисовки заполнена"""
+
+
+def percentile_ms(values, q: float) -> float:
+    return float(np.percentile(values, q)) * 1000 if values else 0.0
+
+
+def _init_worker():
+    """Инициализация процесса: backend Agg и прогрев шрифтов первой отрисовкой"""
+    import matplotlib
+    matplotlib.use('Agg')
+    import pandas as pd
+    from chart_generator import ChartGenerator
+
+    df = pd.DataFrame({
+        'timestamp': pd.date_range('2024-01-01', periods=2, freq='h'),
+        'open': [1.0, 2.0], 'high': [2.0, 3.0], 'low': [0.5, 1.5], 'close': [2.0, 1.0],
+    })
+    ChartGenerator.create_price_chart(df, 'WARMUP', current_price=1.0)
+    ChartGenerator.create_pnl_chart([0.0, 1.0])
+
+
+def _render(kind: str, args: tuple) -> tuple:
+    """Отрисовка в рабочем процессе: (PNG, секунды)"""
+    from chart_generator import ChartGenerator
+
+    renderers = {
+        'price': ChartGenerator.create_price_chart,
+        'pnl': ChartGenerator.create_pnl_chart,
+    }
+    start = time.perf_counter()
+    data = renderers[kind](*args).getvalue()
+    return data, time.perf_counter() - start
+
+
+class RenderPool:
+    """Пул процессов для отрисовки графиков вне event loop
+
+    Число одновременно принятых задач ограничено workers + max_queue,
+    сверх этого запросы отклоняются сразу. Задача, не уложившаяся в
+    timeout, продолжает занимать слот до фактического завершения.
+    """
+
+    def __init__(self, workers: int = None, max_queue: int = None, timeout: float = None):
+        self.workers = workers if workers is not None else Config.RENDER_WORKERS
+        self.max_queue = max_queue if max_queue is not None else Config.RENDER_QUEUE_SIZE
+        self.timeout = timeout if timeout is not None else Config.RENDER_TIMEOUT
+        self.executor: Optional[Executor] = None
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.rendered = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.render_times = deque(maxlen=1000)
+        self.wait_times = deque(maxlen=1000)
+
+    def start(self):
+        """Запуск рабочих процессов (workers=0 - отрисовка в потоке)"""
+        if self.executor is None and self.workers > 0:
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+            )
+            # Процессы создаются по требованию - запускаем их заранее
+            for future in [self.executor.submit(time.sleep, 0) for _ in range(self.workers)]:
+                future.result()
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    def _release(self, _future=None):
+        with self.lock:
+            self.pending -= 1
+
+    async def render(self, kind: str, *args) -> bytes:
+        """PNG графика kind ('price' / 'pnl') с аргументами ChartGenerator"""
+        with self.lock:
+            if self.pending >= max(self.workers, 1) + self.max_queue:
+                self.rejected += 1
+                raise RenderQueueFull()
+            self.pending += 1
+
+        try:
+            self.start()
+            submitted = time.perf_counter()
+            if self.workers > 0:
+                future = self.executor.submit(_render, kind, args)
+            else:
+                future = asyncio.get_running_loop().run_in_executor(None, _render, kind, args)
+        except Exception:
+            self._release()
+            raise
+        future.add_done_callback(self._release)
+
+        try:
+            data, seconds = await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+
+        self.rendered += 1
+        self.render_times.append(seconds)
+        self.wait_times.append(time.perf_counter() - submitted - seconds)
+        return data
+
+    def stats(self) -> Dict[str, float]:
+        """Метрики для подбора размера пула"""
+        render_times = list(self.render_times)
+        wait_times = list(self.wait_times)
+        return {
+            'workers': self.workers,
+            'in_flight': min(self.pending, max(self.workers, 1)),
+            'queue_depth': max(0, self.pending - max(self.workers, 1)),
+            'rendered': self.rendered,
+            'rejected': self.rejected,
+            'timeouts': self.timeouts,
+            'render_p50_ms': percentile_ms(render_times, 50),
+            'render_p95_ms': percentile_ms(render_times, 95),
+            'wait_p95_ms': percentile_ms(wait_times, 95),
+        }
+
+
+# Глобальный экземпляр
+render_pool = RenderPool()
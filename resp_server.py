@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Локальный сервер с подмножеством протокола Redis (RESP) для разработки и тестов:
+PING, GET, SET [EX|PX], DEL, EXPIRE, TTL, EXISTS, FLUSHDB, AUTH, SELECT
+
+Пример: python resp_server.py --port 6379
+"""
+
+import argparse
+import asyncio
+import time
+from typing import Dict, Optional, Tuple
+
+from state_store import RespError, read_reply
+
+
+def encode_reply(value) -> bytes:
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, RespError):
+        return f"-{value}\r\n".encode()
+    if isinstance(value, bool):
+        return b"+OK\r\n"
+    if isinstance(value, int):
+        return f":{value}\r\n".encode()
+    if isinstance(value, str):
+        return f"+{value}\r\n".encode()
+    return f"${len(value)}\r\n".encode() + value + b"\r\n"
+
+
+class LocalRespServer:
+    """Хранилище ключей в памяти с TTL, обслуживающее клиентов по RESP"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0):
+        self.host = host
+        self.port = port
+        self.data: Dict[bytes, Tuple[bytes, Optional[float]]] = {}
+        self.server: Optional[asyncio.AbstractServer] = None
+
+    def _alive(self, key: bytes) -> Optional[bytes]:
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self.data[key]
+            return None
+        return value
+
+    def execute(self, args):
+        command = args[0].upper()
+        if command in (b'PING', b'AUTH', b'SELECT'):
+            return 'PONG' if command == b'PING' else True
+        if command == b'GET':
+            return self._alive(args[1])
+        if command == b'SET':
+            expires_at = None
+            options = [a.upper() for a in args[3::2]]
+            values = args[4::2]
+            for option, value in zip(options, values):
+                if option == b'EX':
+                    expires_at = time.monotonic() + int(value)
+                elif option == b'PX':
+                    expires_at = time.monotonic() + int(value) / 1000
+            self.data[args[1]] = (args[2], expires_at)
+            return True
+        if command == b'DEL':
+            return sum(self.data.pop(key, None) is not None for key in args[1:])
+        if command == b'EXISTS':
+            return sum(self._alive(key) is not None for key in args[1:])
+        if command == b'EXPIRE':
+            value = self._alive(args[1])
+            if value is None:
+                return 0
+            self.data[args[1]] = (value, time.monotonic() + int(args[2]))
+            return 1
+        if command == b'TTL':
+            if self._alive(args[1]) is None:
+                return -2
+            expires_at = self.data[args[1]][1]
+            return -1 if expires_at is None else max(0, round(expires_at - time.monotonic()))
+        if command == b'FLUSHDB':
+            self.data.clear()
+            return True
+        return RespError(f"ERR unknown command '{command.decode()}'")
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    args = await read_reply(reader)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    break
+                writer.write(encode_reply(self.execute(args)))
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def start(self) -> int:
+        """Запуск сервера; возвращает фактический порт"""
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self.port
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+
+async def serve(host: str, port: int):
+    server = LocalRespServer(host, port)
+    await server.start()
+    print(f"RESP server listening on {host}:{server.port}")
+    await server.server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6379)
+    args = parser.parse_args()
+    asyncio.run(serve(args.host, args.port))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Sequence
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import Boolean, DateTime, Float, Integer, delete, select, tuple_
+
+from config import Config
+from database import Position, Transaction
+from user_stats import ensure_rows
+
+logger = logging.getLogger(__name__)
+
+positions_table = Position.__table__
+transactions_table = Transaction.__table__
+
+
+def _arrow_field(column):
+    """Тип Arrow для колонки; Enum и JSON пишутся строками"""
+    if isinstance(column.type, Boolean):
+        return pa.field(column.name, pa.bool_())
+    if isinstance(column.type, Integer):
+        return pa.field(column.name, pa.int64())
+    if isinstance(column.type, Float):
+        return pa.field(column.name, pa.float64())
+    if isinstance(column.type, DateTime):
+        return pa.field(column.name, pa.timestamp('us'))
+    return pa.field(column.name, pa.string())
+
+
+def _plain(value):
+    if value is None or isinstance(value, (str, int, float, bool, datetime)):
+        return value
+    if hasattr(value, 'value'):
+        return value.value
+    return json.dumps(value, ensure_ascii=False, default=str)
+
+
+class ParquetArchive:
+    """Архив удаляемых строк таблицы в файлах Parquet
+
+    Каждая порция строк дописывается в файл отдельной группой строк. Файл
+    пишется под именем .part и получает настоящее имя только после закрытия
+    и fsync - строки из него удаляются из базы не раньше этого.
+    """
+
+    def __init__(self, directory: str, table, file_rows: int = None):
+        self.directory = directory
+        self.table = table
+        self.file_rows = file_rows or Config.ARCHIVE_FILE_ROWS
+        self.schema = pa.schema([_arrow_field(column) for column in table.columns])
+        self.writer = None
+        self.path = None
+        self.rows = 0
+        self.files: List[str] = []
+
+    def _open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
+        self.path = os.path.join(self.directory, f"{self.table.name}-{stamp}-{len(self.files) + 1:04d}.parquet")
+        self.writer = pq.ParquetWriter(self.path + '.part', self.schema, compression=Config.ARCHIVE_COMPRESSION)
+        self.rows = 0
+
+    def write(self, rows: Sequence):
+        if self.writer is None:
+            self._open()
+        self.writer.write_table(pa.Table.from_pydict(
+            {name: [_plain(row[i]) for row in rows] for i, name in enumerate(self.schema.names)},
+            schema=self.schema,
+        ))
+        self.rows += len(rows)
+
+    @property
+    def full(self) -> bool:
+        return self.rows >= self.file_rows
+
+    def close(self) -> Optional[str]:
+        """Закрытие текущего файла; возвращает его путь"""
+        if self.writer is None:
+            return None
+        self.writer.close()
+        with open(self.path + '.part', 'rb') as part:
+            os.fsync(part.fileno())
+        os.replace(self.path + '.part', self.path)
+        self.writer = None
+        self.files.append(self.path)
+        logger.info(f"Archived {self.rows} rows of {self.table.name} to {self.path}")
+        return self.path
+
+
+def _delete(db, table, ids: Sequence[int], before_delete: Optional[Callable], batch_size: int, pause: float) -> int:
+    """Удаление по id короткими транзакциями с паузой между ними"""
+    deleted = 0
+    for start in range(0, len(ids), batch_size):
+        chunk = ids[start:start + batch_size]
+        if before_delete:
+            before_delete(db, chunk)
+        deleted += db.execute(delete(table).where(table.c.id.in_(chunk))).rowcount
+        db.commit()
+        if pause:
+            time.sleep(pause)
+    return deleted
+
+
+def purge(db, table, time_column, cutoff: datetime, *conditions, archive_dir: str = None,
+          before_delete: Optional[Callable] = None, batch_size: int = None, pause: float = None) -> int:
+    """Удаление строк с time_column < cutoff порциями по batch_size
+
+    Порции выбираются keyset-пагинацией по (time_column, id), поэтому
+    каждая выборка идет по индексу от места, где остановилась предыдущая.
+    С archive_dir строки сначала пишутся в Parquet и удаляются после
+    закрытия файла. Возвращает число удаленных строк.
+    """
+    batch_size = batch_size or Config.CLEANUP_BATCH_SIZE
+    pause = Config.CLEANUP_PAUSE if pause is None else pause
+    archive = ParquetArchive(archive_dir, table) if archive_dir else None
+    key = tuple_(time_column, table.c.id)
+    # Для архива нужны строки целиком, для удаления - только ключ
+    stmt = (
+        (select(table) if archive else select(time_column, table.c.id))
+        .where(time_column < cutoff, *conditions)
+        .order_by(time_column, table.c.id)
+        .limit(batch_size)
+    )
+
+    deleted = 0
+    pending: List[int] = []  # id строк в еще не закрытом файле архива
+    after = None
+    while True:
+        rows = db.execute(stmt if after is None else stmt.where(key > tuple_(*after))).all()
+        # Читающая транзакция не держится между порциями
+        db.rollback()
+        if not rows:
+            break
+        last = rows[-1]
+        after = (last._mapping[time_column], last._mapping[table.c.id])
+        ids = [row._mapping[table.c.id] for row in rows]
+        if archive is None:
+            deleted += _delete(db, table, ids, before_delete, batch_size, pause)
+        else:
+            archive.write(rows)
+            pending.extend(ids)
+            if archive.full:
+                archive.close()
+                deleted += _delete(db, table, pending, before_delete, batch_size, pause)
+                pending = []
+        if len(rows) < batch_size:
+            break
+
+    if archive is not None and archive.close():
+        deleted += _delete(db, table, pending, before_delete, batch_size, pause)
+    return deleted
+
+
+def _keep_user_stats(db, position_ids: Sequence[int]):
+    # Агрегаты игроков без строки user_stats строятся по позициям до их удаления,
+    # иначе закрытые сделки пропадут из статистики
+    ensure_rows(db, db.scalars(
+        select(positions_table.c.user_id).where(positions_table.c.id.in_(position_ids)).distinct()
+    ).all())
+
+
+def cleanup(db, cutoff: datetime, archive_dir: str = None, **options) -> Dict[str, int]:
+    """Удаление закрытых позиций и транзакций старше cutoff; число удаленных по таблицам"""
+    p, t = positions_table.c, transactions_table.c
+    return {
+        'positions': purge(
+            db, positions_table, p.closed_at, cutoff, p.is_open == False,
+            archive_dir=archive_dir, before_delete=_keep_user_stats, **options
+        ),
+        'transactions': purge(db, transactions_table, t.created_at, cutoff, archive_dir=archive_dir, **options),
+    }
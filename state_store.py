@@ -0,0 +1,223 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+from urllib.parse import urlparse
+
+from config import Config
+
+
+class StateRecord:
+    """Состояние диалога пользователя и время его истечения"""
+    __slots__ = ('data', 'expires_at')
+
+    def __init__(self, data: Dict[str, Any], expires_at: float):
+        self.data = data
+        self.expires_at = expires_at
+
+
+class MemoryStateStore:
+    """Состояния в памяти процесса: TTL и ограничение числа записей (LRU)"""
+
+    def __init__(self, ttl: float = None, max_entries: int = None):
+        self.ttl = ttl if ttl is not None else Config.STATE_TTL
+        self.max_entries = max_entries if max_entries is not None else Config.STATE_MAX_ENTRIES
+        self.records: 'OrderedDict[int, StateRecord]' = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    async def get(self, user_id: int) -> Optional[Dict[str, Any]]:
+        record = self.records.get(user_id)
+        if record is None:
+            return None
+        if record.expires_at <= time.monotonic():
+            del self.records[user_id]
+            return None
+        self.records.move_to_end(user_id)
+        return dict(record.data)
+
+    async def set(self, user_id: int, data: Dict[str, Any]):
+        self.records[user_id] = StateRecord(dict(data), time.monotonic() + self.ttl)
+        self.records.move_to_end(user_id)
+        while len(self.records) > self.max_entries:
+            self.records.popitem(last=False)
+
+    async def delete(self, user_id: int):
+        self.records.pop(user_id, None)
+
+    async def purge_expired(self) -> int:
+        now = time.monotonic()
+        expired = [user_id for user_id, record in self.records.items() if record.expires_at <= now]
+        for user_id in expired:
+            del self.records[user_id]
+        return len(expired)
+
+
+class SQLiteStateStore:
+    """Состояния в файле SQLite, общем для нескольких процессов бота"""
+
+    PURGE_EVERY = 1000  # записей между удалениями истекших состояний
+
+    def __init__(self, path: str = None, ttl: float = None):
+        self.path = path or Config.STATE_SQLITE_PATH
+        self.ttl = ttl if ttl is not None else Config.STATE_TTL
+        self.lock = threading.Lock()
+        self.writes = 0
+        self.connection = sqlite3.connect(self.path, check_same_thread=False, timeout=Config.SQLITE_BUSY_TIMEOUT_MS / 1000)
+        with self.lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS conversation_state ("
+                "user_id INTEGER PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    def _execute(self, sql: str, params: tuple = ()):
+        with self.lock, self.connection:
+            return self.connection.execute(sql, params).fetchone()
+
+    async def get(self, user_id: int) -> Optional[Dict[str, Any]]:
+        row = await asyncio.to_thread(
+            self._execute,
+            "SELECT data FROM conversation_state WHERE user_id = ? AND expires_at > ?",
+            (user_id, time.time())
+        )
+        return json.loads(row[0]) if row else None
+
+    async def set(self, user_id: int, data: Dict[str, Any]):
+        await asyncio.to_thread(
+            self._execute,
+            "INSERT OR REPLACE INTO conversation_state (user_id, data, expires_at) VALUES (?, ?, ?)",
+            (user_id, json.dumps(data), time.time() + self.ttl)
+        )
+        self.writes += 1
+        if self.writes % self.PURGE_EVERY == 0:
+            await self.purge_expired()
+
+    async def delete(self, user_id: int):
+        await asyncio.to_thread(self._execute, "DELETE FROM conversation_state WHERE user_id = ?", (user_id,))
+
+    async def purge_expired(self) -> int:
+        def purge():
+            with self.lock, self.connection:
+                return self.connection.execute(
+                    "DELETE FROM conversation_state WHERE expires_at <= ?", (time.time(),)
+                ).rowcount
+        return await asyncio.to_thread(purge)
+
+
+class RespError(Exception):
+    """Ошибка, возвращенная сервером RESP"""
+
+
+def encode_command(*args) -> bytes:
+    """Команда в формате RESP: массив bulk-строк"""
+    parts = [f"*{len(args)}\r\n".encode()]
+    for arg in args:
+        value = arg if isinstance(arg, bytes) else str(arg).encode()
+        parts.append(f"${len(value)}\r\n".encode() + value + b"\r\n")
+    return b"".join(parts)
+
+
+async def read_reply(reader: asyncio.StreamReader):
+    """Чтение одного ответа RESP"""
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError("RESP connection closed")
+    kind, payload = line[:1], line[1:-2]
+    if kind == b'+':
+        return payload.decode()
+    if kind == b'-':
+        raise RespError(payload.decode())
+    if kind == b':':
+        return int(payload)
+    if kind == b'$':
+        length = int(payload)
+        if length < 0:
+            return None
+        return (await reader.readexactly(length + 2))[:-2]
+    if kind == b'*':
+        length = int(payload)
+        if length < 0:
+            return None
+        return [await read_reply(reader) for _ in range(length)]
+    raise RespError(f"Unexpected RESP reply: {line!r}")
+
+
+class RedisStateStore:
+    """Состояния в Redis (или совместимом сервере, например resp_server.py); TTL - через SET EX"""
+
+    def __init__(self, url: str = None, ttl: float = None, prefix: str = 'conv:'):
+        parsed = urlparse(url or Config.STATE_REDIS_URL)
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port or 6379
+        self.db = int(parsed.path.lstrip('/') or 0)
+        self.password = parsed.password
+        self.ttl = ttl if ttl is not None else Config.STATE_TTL
+        self.prefix = prefix
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.loop = None
+        self.lock: Optional[asyncio.Lock] = None
+
+    async def _connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        if self.password:
+            await self._roundtrip('AUTH', self.password)
+        if self.db:
+            await self._roundtrip('SELECT', self.db)
+
+    async def _roundtrip(self, *args):
+        self.writer.write(encode_command(*args))
+        await self.writer.drain()
+        return await read_reply(self.reader)
+
+    async def command(self, *args):
+        """Выполнение команды; соединение создается заново для нового event loop или после обрыва"""
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop:
+            self.loop, self.lock, self.writer = loop, asyncio.Lock(), None
+        async with self.lock:
+            for attempt in range(2):
+                try:
+                    if self.writer is None or self.writer.is_closing():
+                        await self._connect()
+                    return await self._roundtrip(*args)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    self.writer = None
+                    if attempt:
+                        raise
+
+    def _key(self, user_id: int) -> str:
+        return f"{self.prefix}{user_id}"
+
+    async def get(self, user_id: int) -> Optional[Dict[str, Any]]:
+        value = await self.command('GET', self._key(user_id))
+        return json.loads(value) if value is not None else None
+
+    async def set(self, user_id: int, data: Dict[str, Any]):
+        await self.command('SET', self._key(user_id), json.dumps(data), 'EX', max(1, int(self.ttl)))
+
+    async def delete(self, user_id: int):
+        await self.command('DEL', self._key(user_id))
+
+    async def purge_expired(self) -> int:
+        # Истекшие ключи удаляет сам сервер
+        return 0
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+def create_state_store():
+    """Хранилище состояний согласно Config.STATE_BACKEND"""
+    if Config.STATE_BACKEND == 'sqlite':
+        return SQLiteStateStore()
+    if Config.STATE_BACKEND == 'redis':
+        return RedisStateStore()
+    return MemoryStateStore()
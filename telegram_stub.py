@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Локальная замена Bot API Telegram для разработки и нагрузочных тестов:
+принимает вызовы /bot<token>/<method>, запоминает их и возвращает правдоподобные ответы
+
+Пример: python telegram_stub.py --port 8081
+затем TELEGRAM_API_URL=http://127.0.0.1:8081 python bot.py
+"""
+
+import argparse
+import asyncio
+import email.parser
+import email.policy
+import itertools
+import json
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, unquote
+
+from webhook import read_http_request, write_http_response
+
+BOT_ID = 1000000
+
+
+def parse_params(headers: Dict[str, str], body: bytes) -> Dict[str, object]:
+    """Параметры вызова из JSON, form-urlencoded или multipart; файлы - байтами"""
+    content_type = headers.get('content-type', '')
+    if not body:
+        return {}
+    if content_type.startswith('application/json'):
+        return json.loads(body)
+    if content_type.startswith('multipart/form-data'):
+        message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+            f"Content-Type: {content_type}\r\n\r\n".encode() + body
+        )
+        params = {}
+        for part in message.iter_parts():
+            name = part.get_param('name', header='content-disposition')
+            payload = part.get_payload(decode=True)
+            params[name] = payload if part.get_filename() else payload.decode()
+        return params
+    return dict(parse_qsl(body.decode()))
+
+
+class FakeTelegramApi:
+    """HTTP-сервер с подмножеством методов Bot API"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.calls: List[Tuple[str, Dict[str, object]]] = []
+        self.message_ids = itertools.count(1)
+        self.webhook: Dict[str, object] = {}
+        self.server: Optional[asyncio.AbstractServer] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def calls_to(self, method: str) -> List[Dict[str, object]]:
+        return [params for name, params in self.calls if name == method]
+
+    def _message(self, params: Dict[str, object], **fields) -> dict:
+        chat_id = int(params.get('chat_id', 0))
+        message = {
+            'message_id': int(params.get('message_id') or next(self.message_ids)),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': BOT_ID, 'is_bot': True, 'first_name': 'TradingBot'},
+        }
+        message.update(fields)
+        return message
+
+    def execute(self, method: str, params: Dict[str, object]):
+        method = method.lower()
+        if method == 'getme':
+            return {'id': BOT_ID, 'is_bot': True, 'first_name': 'TradingBot', 'username': 'trading_stub_bot'}
+        if method == 'setwebhook':
+            self.webhook = {'url': params.get('url', ''), 'secret_token': params.get('secret_token')}
+            return True
+        if method == 'deletewebhook':
+            self.webhook = {}
+            return True
+        if method == 'getwebhookinfo':
+            return {'url': self.webhook.get('url', ''), 'has_custom_certificate': False, 'pending_update_count': 0}
+        if method == 'getupdates':
+            return []
+        if method in ('sendmessage', 'editmessagetext'):
+            return self._message(params, text=params.get('text', ''))
+        if method == 'sendphoto':
+            file_id = f"photo-{len(self.calls)}"
+            return self._message(params, photo=[
+                {'file_id': file_id, 'file_unique_id': file_id, 'width': 1200, 'height': 800}
+            ])
+        if method == 'senddocument':
+            file_id = f"document-{len(self.calls)}"
+            return self._message(params, document={'file_id': file_id, 'file_unique_id': file_id})
+        if method in ('answercallbackquery', 'deletemessage', 'setmycommands', 'sendchataction'):
+            return True
+        return None
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        request = await read_http_request(reader)
+        if request is None:
+            await write_http_response(writer, 400)
+            return
+        _, path, headers, body = request
+        # /bot<token>/<method>
+        parts = unquote(path).split('?', 1)[0].strip('/').split('/')
+        if len(parts) != 2 or not parts[0].startswith('bot'):
+            await write_http_response(writer, 404)
+            return
+
+        method = parts[1]
+        params = parse_params(headers, body)
+        self.calls.append((method, params))
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        result = self.execute(method, params)
+        if result is None:
+            response = {'ok': False, 'error_code': 404, 'description': f'Not Found: method {method} is not stubbed'}
+        else:
+            response = {'ok': True, 'result': result}
+        await write_http_response(writer, 200, json.dumps(response).encode())
+
+    async def start(self) -> int:
+        """Запуск сервера; возвращает фактический порт"""
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self.port
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+
+async def serve(host: str, port: int, latency: float):
+    api = FakeTelegramApi(host, port, latency)
+    await api.start()
+    print(f"Telegram API stub listening on {api.url}")
+    await api.server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency', type=float, default=0.0, help='задержка ответа, секунды')
+    args = parser.parse_args()
+    asyncio.run(serve(args.host, args.port, args.latency))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+import unittest
+import pandas as pd
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from database import Base
+from candle_store import CandleStore, timeframe_ms
+
+HOUR = timeframe_ms('1h')
+
+class FakeOHLCVExchange:
+    """Заглушка биржи со свечами 1h, учитывающая since и limit"""
+
+    def __init__(self, count):
+        self.candles = [[i * HOUR, 100.0 + i, 101.0 + i, 99.0 + i, 100.5 + i, 10.0] for i in range(count)]
+        self.calls = []
+
+    def fetch_ohlcv(self, symbol, timeframe, since=None, limit=None):
+        self.calls.append(since)
+        candles = self.candles if since is None else [c for c in self.candles if c[0] >= since]
+        if since is None:
+            return [list(c) for c in candles[-limit:]]
+        return [list(c) for c in candles[:limit]]
+
+class TestCandleStore(unittest.TestCase):
+
+    def setUp(self):
+        engine = create_engine('sqlite://', poolclass=StaticPool, connect_args={'check_same_thread': False})
+        Base.metadata.create_all(bind=engine)
+        self.exchange = FakeOHLCVExchange(30)
+        # Часы хранилища - время последней свечи биржи
+        self.store = CandleStore(sessionmaker(bind=engine), refresh_interval=0, max_candles=50,
+                                 clock=lambda: self.exchange.candles[-1][0])
+
+    def test_initial_load(self):
+        """Пустое хранилище загружает последние limit свечей"""
+        df = self.store.get(self.exchange, 'BTC/USDT', '1h', 10)
+
+        self.assertEqual(self.exchange.calls, [None])
+        self.assertEqual(len(df), 10)
+        self.assertEqual(df['close'].iloc[-1], 129.5)
+        self.assertTrue(df['timestamp'].is_monotonic_increasing)
+
+    def test_incremental_fetch(self):
+        """Повторная загрузка запрашивает только новые свечи и обновляет последнюю"""
+        self.store.get(self.exchange, 'BTC/USDT', '1h', 10)
+
+        self.exchange.candles[-1][4] = 200.0
+        self.exchange.candles += [[i * HOUR, 1.0, 2.0, 0.5, 1.5, 1.0] for i in range(30, 55)]
+        df = self.store.get(self.exchange, 'BTC/USDT', '1h', 10)
+
+        # Догрузка идет страницами от последней сохраненной свечи
+        self.assertEqual(self.exchange.calls, [None, 29 * HOUR, 38 * HOUR, 47 * HOUR])
+        self.assertEqual(df['timestamp'].iloc[-1], pd.Timestamp(54 * HOUR, unit='ms'))
+
+        full = self.store.get(self.exchange, 'BTC/USDT', '1h', 100)
+        closes = full.set_index('timestamp')['close']
+        self.assertEqual(closes[pd.Timestamp(29 * HOUR, unit='ms')], 200.0)
+        # Хранится не больше max_candles свечей
+        self.assertEqual(len(full), 35)
+
+    def test_gap_fetches_one_window(self):
+        """После простоя догружаются только max_candles последних свечей"""
+        self.store.get(self.exchange, 'BTC/USDT', '1h', 10)
+
+        self.exchange.candles += [[i * HOUR, 1.0, 2.0, 0.5, 1.5, 1.0] for i in range(30, 1000)]
+        full = self.store.get(self.exchange, 'BTC/USDT', '1h', 100)
+
+        # Одна страница от начала окна вместо 97 страниц от последней сохраненной свечи
+        self.assertEqual(self.exchange.calls, [None, 949 * HOUR])
+        self.assertEqual(full['timestamp'].iloc[-1], pd.Timestamp(999 * HOUR, unit='ms'))
+        self.assertEqual(len(full), 50)
+
+    def test_exchange_error_serves_stored_data(self):
+        """При ошибке биржи графики строятся по сохраненным свечам"""
+        self.store.get(self.exchange, 'BTC/USDT', '1h', 10)
+
+        def fail(*args, **kwargs):
+            raise RuntimeError("exchange down")
+        self.exchange.fetch_ohlcv = fail
+
+        df = self.store.get(self.exchange, 'BTC/USDT', '1h', 10)
+        self.assertEqual(len(df), 10)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import unittest
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+import pandas as pd
+from chart_cache import ChartCache
+from handlers.chart import ChartHandler
+
+def candles(last_close=101.0, periods=3):
+    return pd.DataFrame({
+        'timestamp': pd.date_range('2024-01-01', periods=periods, freq='h'),
+        'close': [100.0] * (periods - 1) + [last_close],
+    })
+
+class TestChartCache(unittest.TestCase):
+
+    def test_key_tracks_last_candle(self):
+        """Изменение последней свечи или отметок дает новый ключ"""
+        key = ChartCache.key('BTC/USDT', '1h', candles())
+        self.assertEqual(key, ChartCache.key('BTC/USDT', '1h', candles(), None, None, None))
+        self.assertNotEqual(key, ChartCache.key('BTC/USDT', '1h', candles(102.0)))
+        self.assertNotEqual(key, ChartCache.key('BTC/USDT', '1h', candles(periods=4)))
+        self.assertNotEqual(key, ChartCache.key('BTC/USDT', '1h', candles(), 95.0, None, None))
+
+    def test_show_chart_shared_between_users(self):
+        """Игроки без позиций получают один общий график при любой текущей цене"""
+        cache = ChartCache()
+        render_pool = MagicMock(render=AsyncMock(return_value=b'png'))
+        crypto_data = MagicMock()
+        crypto_data.get_historical_data.return_value = candles()
+        db = AsyncMock()
+        db.scalar.return_value = None
+        get_async_db = MagicMock()
+        get_async_db.return_value.__aenter__.return_value = db
+        context = MagicMock()
+        context.bot.send_photo = AsyncMock(return_value=SimpleNamespace(photo=[SimpleNamespace(file_id='id')]))
+
+        async def two_users():
+            for telegram_id, price in ((1, 101.5), (2, 101.7)):
+                crypto_data.get_current_price.return_value = price
+                query = AsyncMock(data='chart_BTC/USDT_1h')
+                query.from_user.id = telegram_id
+                await ChartHandler.show_chart(SimpleNamespace(callback_query=query), context)
+
+        with patch('handlers.chart.chart_cache', cache), patch('handlers.chart.render_pool', render_pool), \
+                patch('handlers.chart.crypto_data', crypto_data), patch('handlers.chart.get_async_db', get_async_db):
+            asyncio.run(two_users())
+
+        render_pool.render.assert_called_once()
+        # Линия цены - по закрытию последней свечи, а не по тику
+        self.assertEqual(render_pool.render.call_args.args[-1], 101.0)
+        photos = [call.kwargs['photo'] for call in context.bot.send_photo.call_args_list]
+        self.assertEqual(photos, [b'png', 'id'])
+
+    def test_eviction_by_bytes(self):
+        """Объем кэша ограничен, вытесняются давно не читанные графики"""
+        cache = ChartCache(max_entries=10, max_bytes=250)
+        cache.put('a', b'x' * 100)
+        cache.put('b', b'x' * 100)
+        cache.get('a')
+        cache.put('c', b'x' * 100)
+
+        self.assertIsNotNone(cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.total_bytes, 200)
+
+    def test_send_chart_reuses_file_id(self):
+        """Повторная отправка использует file_id вместо загрузки байтов"""
+        cache = ChartCache()
+        render = AsyncMock(return_value=b'png')
+        message = SimpleNamespace(photo=[SimpleNamespace(file_id='small'), SimpleNamespace(file_id='large')])
+        context = MagicMock()
+        context.bot.send_photo = AsyncMock(return_value=message)
+
+        async def send_twice():
+            with patch('handlers.chart.chart_cache', cache):
+                await ChartHandler.send_chart(context, 1, 'key', render, 'caption')
+                await ChartHandler.send_chart(context, 2, 'key', render, 'caption')
+
+        asyncio.run(send_twice())
+
+        render.assert_called_once()
+        photos = [call.kwargs['photo'] for call in context.bot.send_photo.call_args_list]
+        self.assertEqual(photos, [b'png', 'large'])
+
+if __name__ == '__main__':
+    unittest.main()
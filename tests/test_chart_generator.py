@@ -0,0 +1,35 @@
+import unittest
+import pandas as pd
+from matplotlib.figure import Figure
+from chart_generator import ChartGenerator
+
+class TestChartGenerator(unittest.TestCase):
+
+    def setUp(self):
+        self.df = pd.DataFrame({
+            'timestamp': pd.date_range('2024-01-01', periods=4, freq='h'),
+            'open': [100.0, 105.0, 103.0, 103.0],
+            'high': [106.0, 107.0, 104.0, 105.0],
+            'low': [99.0, 102.0, 101.0, 102.0],
+            'close': [105.0, 103.0, 103.0, 104.0],
+        })
+
+    def test_candles_drawn_as_collections(self):
+        """Свечи рисуются двумя коллекциями вместо artist'а на свечу"""
+        ax = Figure().add_subplot(111)
+        ChartGenerator.draw_candles(ax, self.df)
+
+        wicks, bodies = ax.collections
+        self.assertEqual(len(ax.patches) + len(ax.lines), 0)
+        self.assertEqual(len(wicks.get_segments()), 4)
+        # Свеча с open == close рисуется только тенью
+        self.assertEqual(len(bodies.get_paths()), 3)
+        self.assertLessEqual(ax.get_ylim()[0], 99.0)
+        self.assertGreaterEqual(ax.get_ylim()[1], 107.0)
+
+    def test_price_chart_png(self):
+        buf = ChartGenerator.create_price_chart(self.df, 'BTC/USDT', entry_price=102.0)
+        self.assertEqual(buf.read(8), b'\x89PNG\r\n\x1a\n')
+
+if __name__ == '__main__':
+    unittest.main()
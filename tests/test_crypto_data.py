@@ -0,0 +1,108 @@
+import unittest
+import asyncio
+from unittest.mock import patch
+from crypto_data import CryptoData
+from config import Config
+
+class FakeExchange:
+    """Локальная заглушка ccxt-биржи"""
+    
+    def __init__(self, prices, batch=True):
+        self.prices = prices
+        self.has = {'fetchTickers': batch}
+        self.calls = []
+    
+    def fetch_tickers(self, symbols):
+        self.calls.append(('fetch_tickers', tuple(symbols)))
+        return {s: {'symbol': s, 'last': self.prices[s]} for s in symbols if s in self.prices}
+    
+    def fetch_ticker(self, symbol):
+        self.calls.append(('fetch_ticker', symbol))
+        return {'symbol': symbol, 'last': self.prices[symbol]}
+
+class FakeAsyncExchange:
+    """Асинхронная заглушка для проверки ограничения параллельности"""
+    
+    def __init__(self, prices):
+        self.prices = prices
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.closed = False
+    
+    async def fetch_ticker(self, symbol):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        if symbol not in self.prices:
+            raise ValueError(f"unknown symbol {symbol}")
+        return {'symbol': symbol, 'last': self.prices[symbol]}
+    
+    async def close(self):
+        self.closed = True
+
+SYMBOLS = [f'C{i}/USDT' for i in range(12)]
+PRICES = {symbol: float(i + 1) for i, symbol in enumerate(SYMBOLS)}
+
+@patch.object(Config, 'AVAILABLE_COINS', SYMBOLS)
+class TestPriceFetching(unittest.TestCase):
+    
+    def test_batched_fetch_uses_single_call(self):
+        """При поддержке fetchTickers цены загружаются одним запросом"""
+        exchange = FakeExchange(PRICES)
+        crypto_data = CryptoData(exchange=exchange)
+        
+        crypto_data.update_prices()
+        
+        self.assertEqual(exchange.calls, [('fetch_tickers', tuple(SYMBOLS))])
+        self.assertEqual(crypto_data.prices, PRICES)
+        self.assertLess(crypto_data.get_price_age('C0/USDT'), 5)
+    
+    def test_concurrent_fallback_is_bounded(self):
+        """Без fetchTickers используется параллельная загрузка с лимитом"""
+        prices = dict(PRICES)
+        del prices['C5/USDT']
+        created = []
+        crypto_data = CryptoData(
+            exchange=FakeExchange(PRICES, batch=False),
+            async_exchange_factory=lambda: created.append(FakeAsyncExchange(prices)) or created[-1]
+        )
+        
+        async def update_twice():
+            await crypto_data.update_prices_async()
+            await crypto_data.update_prices_async()
+            # Клиент один на все обновления и закрывается только при остановке
+            self.assertFalse(created[0].closed)
+            await crypto_data.close()
+        
+        with patch.object(Config, 'PRICE_FETCH_CONCURRENCY', 3):
+            asyncio.run(update_twice())
+        
+        self.assertEqual(len(created), 1)
+        self.assertEqual(created[0].max_in_flight, 3)
+        self.assertTrue(created[0].closed)
+        self.assertEqual(crypto_data.prices, prices)
+        self.assertEqual(crypto_data.get_stale_symbols(60), ['C5/USDT'])
+    
+    def test_sync_fallback_inside_event_loop(self):
+        """Синхронное обновление без fetchTickers не запускает свой event loop"""
+        exchange = FakeExchange(PRICES, batch=False)
+        crypto_data = CryptoData(exchange=exchange)
+        
+        async def update():
+            crypto_data.update_prices()
+        
+        asyncio.run(update())
+        
+        self.assertEqual(exchange.calls, [('fetch_ticker', symbol) for symbol in SYMBOLS])
+        self.assertEqual(crypto_data.prices, PRICES)
+    
+    def test_async_update(self):
+        """Асинхронное обновление не требует отдельного потока"""
+        crypto_data = CryptoData(exchange=FakeExchange(PRICES))
+        asyncio.run(crypto_data.update_prices_async())
+        self.assertEqual(crypto_data.prices, PRICES)
+        self.assertIsNone(CryptoData(exchange=FakeExchange({})).get_price_age('C0/USDT'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import csv
+import gzip
+import io
+import unittest
+import zipfile
+from unittest.mock import patch
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from database import Base, User, Position, PositionType
+from crypto_data import CryptoData
+from config import Config
+from exports import export_admin_data, export_user_history
+
+class TestExports(unittest.TestCase):
+
+    def setUp(self):
+        """Настройка тестовой базы в памяти"""
+        engine = create_engine('sqlite://')
+        Base.metadata.create_all(bind=engine)
+        self.db = sessionmaker(bind=engine)()
+        self.crypto_data = CryptoData()
+        self.crypto_data.prices['BTC/USDT'] = 110.0
+
+        self.user = User(telegram_id=111, username="trader", balance=1000.0)
+        self.db.add(self.user)
+        self.db.add(User(telegram_id=222, username="idle"))
+        self.db.commit()
+        for i in range(300):
+            self.db.add(Position(
+                user_id=self.user.id,
+                symbol='BTC/USDT',
+                position_type=PositionType.LONG,
+                entry_price=100.0,
+                current_price=100.0,
+                amount=1.0,
+                leverage=10,
+                margin=10.0,
+                liquidation_price=90.0,
+                is_open=i == 0,
+                realized_pnl=5.0
+            ))
+        self.db.commit()
+        # Маленький порог - файл уходит на диск посреди выгрузки
+        self.spool = patch.object(Config, 'EXPORT_SPOOL_SIZE', 1024)
+        self.spool.start()
+
+    def tearDown(self):
+        self.spool.stop()
+        self.db.close()
+
+    def test_user_history_csv(self):
+        """История игрока пишется построчно, открытые позиции - с текущим PnL"""
+        with export_user_history(self.db, self.user.id, self.crypto_data) as output:
+            rows = list(csv.DictReader(io.TextIOWrapper(output, encoding='utf-8')))
+        self.assertEqual(len(rows), 300)
+        self.assertEqual(rows[0]['Status'], 'OPEN')
+        self.assertEqual(rows[0]['Exit Price'], '')
+        self.assertEqual(rows[1]['PnL'], '5.0')
+        self.assertEqual(rows[1]['Type'], 'long')
+
+        self.assertIsNone(export_user_history(self.db, 999, self.crypto_data))
+
+    def test_admin_xlsx(self):
+        """XLSX с листами пользователей и позиций"""
+        [(filename, output)] = export_admin_data(self.db, self.crypto_data, 'xlsx')
+        with output, zipfile.ZipFile(output) as archive:
+            names = archive.namelist()
+            positions_sheet = archive.read('xl/worksheets/sheet2.xml').decode()
+        self.assertEqual(filename, 'trading_game_data.xlsx')
+        self.assertIn('xl/worksheets/sheet1.xml', names)
+        self.assertIn('<row r="301"', positions_sheet)
+
+    def test_admin_csv_gz(self):
+        """Gzip CSV по таблице"""
+        files = export_admin_data(self.db, self.crypto_data, 'csv')
+        self.assertEqual([name for name, _ in files], ['users.csv.gz', 'positions.csv.gz'])
+        counts = []
+        for _, output in files:
+            with output, gzip.open(output, 'rt', encoding='utf-8') as text:
+                counts.append(len(list(csv.reader(text))) - 1)
+        self.assertEqual(counts, [2, 300])
+
+if __name__ == '__main__':
+    unittest.main()
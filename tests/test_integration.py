@@ -4,30 +4,39 @@ from unittest.mock import AsyncMock, MagicMock, patch
 from telegram import Update, Chat, User as TelegramUser
 from telegram.ext import CallbackContext
 from handlers.trading import TradingHandler
-from database import SessionLocal, User, Position
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+from database import Base, User, Position, PositionType
 from crypto_data import CryptoData
+from price_index import PriceIndex
 
-class TestTradingIntegration(unittest.TestCase):
+class TestTradingIntegration(unittest.IsolatedAsyncioTestCase):
     
-    def setUp(self):
-        """Настройка тестовой среды"""
-        self.db = SessionLocal()
+    async def asyncSetUp(self):
+        """Настройка тестовой среды: асинхронная база в памяти"""
+        self.engine = create_async_engine('sqlite+aiosqlite://', poolclass=StaticPool)
+        async with self.engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+        self.sessions = async_sessionmaker(self.engine, expire_on_commit=False)
         self.handler = TradingHandler()
         
         # Создаем тестового пользователя
-        self.test_user = User(
-            telegram_id=999999,
-            username="test_user",
-            first_name="Test",
-            last_name="User",
-            balance=2000.0
-        )
-        self.db.add(self.test_user)
-        self.db.commit()
+        async with self.sessions() as db:
+            self.test_user = User(
+                telegram_id=999999,
+                username="test_user",
+                first_name="Test",
+                last_name="User",
+                balance=2000.0
+            )
+            db.add(self.test_user)
+            await db.commit()
         
         # Мок для update и context
         self.update = AsyncMock(spec=Update)
         self.context = AsyncMock(spec=CallbackContext)
+        self.context.user_data = {}
         
         # Мок для callback query
         self.callback_query = AsyncMock()
@@ -38,12 +47,9 @@ class TestTradingIntegration(unittest.TestCase):
         
         self.update.callback_query = self.callback_query
     
-    def tearDown(self):
+    async def asyncTearDown(self):
         """Очистка после тестов"""
-        self.db.query(Position).delete()
-        self.db.query(User).delete()
-        self.db.commit()
-        self.db.close()
+        await self.engine.dispose()
     
     @patch('handlers.trading.crypto_data')
     async def test_open_position_flow(self, mock_crypto_data):
@@ -71,9 +77,7 @@ class TestTradingIntegration(unittest.TestCase):
         
         # Проверяем что запросили ввод суммы
         self.callback_query.edit_message_text.assert_called()
-        
-        # Тестируем обработку ввода суммы
-        self.context.user_data['awaiting_amount'] = True
+        self.assertTrue(self.context.user_data['awaiting_amount'])
         
         # Создаем мок для сообщения
         message = AsyncMock()
@@ -82,28 +86,33 @@ class TestTradingIntegration(unittest.TestCase):
         self.update.effective_user.id = 999999
         
         # Мок для базы данных
-        with patch('handlers.trading.get_db') as mock_get_db:
-            mock_db = MagicMock()
-            mock_get_db.return_value = mock_db
-            
-            # Мок для query
-            mock_query = MagicMock()
-            mock_db.query.return_value = mock_query
+        with patch('handlers.trading.get_async_db') as mock_get_db:
+            mock_db = AsyncMock()
+            mock_db.add = MagicMock()
+            mock_get_db.return_value.__aenter__.return_value = mock_db
             
-            # Мок для пользователя
-            mock_user = self.test_user
-            mock_query.filter.return_value.first.return_value = mock_user
-            
-            # Мок для позиций
-            mock_query.filter.return_value.count.return_value = 0
+            # Мок для пользователя, количества позиций и ордеров
+            mock_db.scalar.side_effect = [self.test_user, 0, 0]
+            # Списание маржи возвращает новый баланс
+            mock_db.execute.return_value = MagicMock(scalar=MagicMock(return_value=1900.0))
             
             await self.handler.process_amount(self.update, self.context)
             
             # Проверяем что позиция была создана
-            self.assertTrue(mock_db.add.called)
-            self.assertTrue(mock_db.commit.called)
+            position = mock_db.add.call_args.args[0]
+            self.assertIsInstance(position, Position)
+            self.assertEqual((position.symbol, position.leverage, position.margin), ('BTC/USDT', 10, 100.0))
+            mock_db.run_sync.assert_awaited_once()
+            mock_db.commit.assert_awaited_once()
+            mock_crypto_data.price_index.add.assert_called_once_with(position)
+        
+        # Ответ отправлен после выхода из сессии, состояние сброшено
+        self.assertIn("Позиция открыта", message.reply_text.call_args.args[0])
+        self.assertIn("$1900.00", message.reply_text.call_args.args[0])
+        self.assertFalse(self.context.user_data['awaiting_amount'])
+        self.assertIsNone(await self.handler.state.get(999999))
     
-    def test_temp_data_storage(self):
+    async def test_temp_data_storage(self):
         """Тест временного хранения данных"""
         user_id = 123456
         test_data = {
@@ -113,47 +122,98 @@ class TestTradingIntegration(unittest.TestCase):
         }
         
         # Сохраняем данные
-        self.handler.temp_data[user_id] = test_data
+        await self.handler.state.set(user_id, test_data)
         
         # Получаем данные
-        retrieved_data = self.handler.temp_data.get(user_id)
-        
-        self.assertEqual(retrieved_data, test_data)
+        retrieved_data = await self.handler.state.get(user_id)
         
         # Удаляем данные
-        del self.handler.temp_data[user_id]
+        await self.handler.state.delete(user_id)
         
-        self.assertNotIn(user_id, self.handler.temp_data)
+        self.assertEqual(retrieved_data, test_data)
+        self.assertIsNone(await self.handler.state.get(user_id))
     
-    def test_position_count_limit(self):
+    async def test_position_count_limit(self):
         """Тест лимита открытых позиций"""
         user_id = 999999
         
-        # Создаем 5 позиций
-        for i in range(5):
-            position = Position(
-                user_id=self.test_user.id,
-                symbol=f"BTC/USDT",
-                position_type="long",
-                entry_price=50000.0,
-                current_price=50000.0,
-                amount=100.0,
-                leverage=2,
-                margin=20.0,
-                liquidation_price=45000.0,
-                is_open=True
-            )
-            self.db.add(position)
-        
-        self.db.commit()
-        
-        # Проверяем количество открытых позиций
-        positions = self.db.query(Position).filter(
-            Position.user_id == self.test_user.id,
-            Position.is_open == True
-        ).count()
+        async with self.sessions() as db:
+            # Создаем 5 позиций
+            for i in range(5):
+                db.add(Position(
+                    user_id=self.test_user.id,
+                    symbol="BTC/USDT",
+                    position_type=PositionType.LONG,
+                    entry_price=50000.0,
+                    current_price=50000.0,
+                    amount=100.0,
+                    leverage=2,
+                    margin=20.0,
+                    liquidation_price=45000.0,
+                    is_open=True
+                ))
+            await db.commit()
+            
+            # Шестая позиция не открывается, баланс не меняется
+            user_data = {'symbol': 'BTC/USDT', 'position_type': 'long', 'leverage': 2, 'order_type': 'market'}
+            text, done = await self.handler.open_trade(db, user_id, user_data, 100.0)
+        
+        self.assertIn("5 открытых позиций", text)
+        self.assertFalse(done)
+        async with self.sessions() as db:
+            self.assertEqual((await db.get(User, self.test_user.id)).balance, 2000.0)
+    
+    @patch('handlers.trading.crypto_data')
+    async def test_price_index_only_when_loaded(self, mock_crypto_data):
+        """Позиция попадает в индекс уровней только там, где он загружен (лидер)"""
+        mock_crypto_data.get_current_price.return_value = 50000.0
+        mock_crypto_data.calculate_liquidation_price.return_value = 45000.0
+        mock_crypto_data.price_index = PriceIndex()
+        user_data = {'symbol': 'BTC/USDT', 'position_type': 'long', 'leverage': 2, 'order_type': 'market'}
+        
+        async with self.sessions() as db:
+            _, done = await self.handler.open_trade(db, 999999, user_data, 100.0)
+        self.assertTrue(done)
+        self.assertEqual(len(mock_crypto_data.price_index), 0)
+        
+        mock_crypto_data.price_index.loaded = True
+        async with self.sessions() as db:
+            await self.handler.open_trade(db, 999999, user_data, 100.0)
+        self.assertEqual(len(mock_crypto_data.price_index), 1)
+
+class TestBalanceUpdates(unittest.IsolatedAsyncioTestCase):
+    
+    async def asyncSetUp(self):
+        """Асинхронная база в памяти"""
+        self.engine = create_async_engine('sqlite+aiosqlite://', poolclass=StaticPool)
+        async with self.engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+        self.sessions = async_sessionmaker(self.engine, expire_on_commit=False)
+        async with self.sessions() as db:
+            user = User(telegram_id=1, username="trader", balance=100.0)
+            db.add(user)
+            await db.commit()
+            self.user_id = user.id
+    
+    async def asyncTearDown(self):
+        await self.engine.dispose()
+    
+    async def test_change_balance_is_atomic(self):
+        """Списание и возврат - UPDATE в базе, а не запись прочитанного ранее значения"""
+        async with self.sessions() as db:
+            user = await db.get(User, self.user_id)
+            # Параллельное зачисление из другого потока после чтения пользователя
+            async with self.sessions() as other:
+                await other.execute(update(User).where(User.id == self.user_id).values(balance=User.balance + 50))
+                await other.commit()
+            
+            self.assertEqual(await TradingHandler.change_balance(db, user.id, -30.0), 120.0)
+            self.assertIsNone(await TradingHandler.change_balance(db, user.id, -500.0))
+            self.assertEqual(await TradingHandler.change_balance(db, user.id, 10.0), 130.0)
+            await db.commit()
         
-        self.assertEqual(positions, 5)
+        async with self.sessions() as db:
+            self.assertEqual((await db.get(User, self.user_id)).balance, 130.0)
 
 # Для запуска асинхронных тестов
 if __name__ == '__main__':
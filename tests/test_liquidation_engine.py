@@ -0,0 +1,97 @@
+import unittest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from database import Base, User, Position, PositionType
+from liquidation_engine import LiquidationEngine, refresh_pnl
+
+class TestLiquidationEngine(unittest.TestCase):
+    
+    def setUp(self):
+        """Настройка тестовой базы в памяти"""
+        engine = create_engine('sqlite://')
+        Base.metadata.create_all(bind=engine)
+        self.db = sessionmaker(bind=engine)()
+        self.engine = LiquidationEngine(chunk_size=2)
+        
+        self.user = User(telegram_id=111, username="trader", balance=1000.0)
+        self.db.add(self.user)
+        self.db.commit()
+    
+    def tearDown(self):
+        self.db.close()
+    
+    def add_position(self, symbol, position_type, liquidation_price, margin=100.0, is_open=True):
+        position = Position(
+            user_id=self.user.id,
+            symbol=symbol,
+            position_type=position_type,
+            entry_price=50000.0,
+            current_price=50000.0,
+            amount=1.0,
+            leverage=10,
+            margin=margin,
+            liquidation_price=liquidation_price,
+            is_open=is_open
+        )
+        self.db.add(position)
+        self.db.commit()
+        return position
+    
+    def test_long_and_short_breaches(self):
+        """Лонг ликвидируется при падении, шорт - при росте"""
+        long_hit = self.add_position('BTC/USDT', PositionType.LONG, 46000.0)
+        long_safe = self.add_position('BTC/USDT', PositionType.LONG, 44000.0)
+        short_hit = self.add_position('ETH/USDT', PositionType.SHORT, 2500.0)
+        short_safe = self.add_position('ETH/USDT', PositionType.SHORT, 2700.0)
+        
+        liquidated = self.engine.run(self.db, {'BTC/USDT': 45000.0, 'ETH/USDT': 2600.0})
+        self.db.commit()
+        
+        self.assertEqual({p.id for p in liquidated}, {long_hit.id, short_hit.id})
+        self.db.expire_all()
+        self.assertFalse(long_hit.is_open)
+        self.assertEqual(long_hit.realized_pnl, -100.0)
+        self.assertEqual(long_hit.current_price, 45000.0)
+        self.assertIsNotNone(long_hit.closed_at)
+        self.assertTrue(long_safe.is_open)
+        self.assertFalse(short_hit.is_open)
+        self.assertTrue(short_safe.is_open)
+    
+    def test_margin_not_debited_again(self):
+        """Маржа списана при открытии: ликвидация не меняет баланс, убыток - одна маржа"""
+        for _ in range(3):
+            self.add_position('BTC/USDT', PositionType.LONG, 46000.0, margin=400.0)
+        
+        liquidated = self.engine.run(self.db, {'BTC/USDT': 45000.0})
+        self.db.commit()
+        self.db.expire_all()
+        
+        self.assertEqual(len(liquidated), 3)
+        self.assertEqual(self.user.balance, 1000.0)
+        self.assertTrue(all(p.telegram_id == 111 and p.balance == 1000.0 for p in liquidated))
+        self.assertEqual([p.realized_pnl for p in self.user.positions], [-400.0] * 3)
+    
+    def test_unknown_price_and_closed_positions_skipped(self):
+        """Позиции без цены и закрытые позиции не ликвидируются"""
+        self.add_position('BNB/USDT', PositionType.LONG, 250.0)
+        self.add_position('BTC/USDT', PositionType.LONG, 46000.0, is_open=False)
+        
+        self.assertEqual(self.engine.run(self.db, {'BNB/USDT': 0.0, 'BTC/USDT': 45000.0}), [])
+        self.db.expire_all()
+        self.assertEqual(self.user.balance, 1000.0)
+    
+    def test_refresh_pnl(self):
+        """PnL пересчитывается одним UPDATE на символ"""
+        long_pos = self.add_position('BTC/USDT', PositionType.LONG, 46000.0)
+        short_pos = self.add_position('BTC/USDT', PositionType.SHORT, 55000.0)
+        
+        refresh_pnl(self.db, {'BTC/USDT': 51000.0})
+        self.db.commit()
+        self.db.expire_all()
+        
+        self.assertEqual(long_pos.unrealized_pnl, 10000.0)
+        self.assertEqual(short_pos.unrealized_pnl, -10000.0)
+        self.assertEqual(short_pos.current_price, 51000.0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import random
+import unittest
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+from database import Base, User
+from live_leaderboard import LiveLeaderboard, RankedScores
+from utils import calculate_rankings
+
+class TestRankedScores(unittest.TestCase):
+
+    def test_matches_sorting(self):
+        """Ранги и таблица совпадают с полной сортировкой после случайных изменений"""
+        rng = random.Random(7)
+        scores = RankedScores(block_size=4)
+        expected = {}
+        for _ in range(2000):
+            user_id = rng.randrange(200)
+            if rng.random() < 0.2:
+                scores.discard(user_id)
+                expected.pop(user_id, None)
+            else:
+                # Мало различных очков - много равных рангов
+                score = float(rng.randrange(30))
+                scores.set(user_id, score)
+                expected[user_id] = score
+
+        ordered = sorted(expected.items(), key=lambda item: (-item[1], item[0]))
+        for user_id, score in expected.items():
+            better = sum(1 for other in expected.values() if other > score)
+            self.assertEqual(scores.rank(user_id), better + 1)
+        top = scores.top(25)
+        self.assertEqual([(user_id, score) for _, user_id, score in top], ordered[:25])
+        self.assertEqual([rank for rank, user_id, _ in top], [scores.rank(user_id) for _, user_id, _ in top])
+        self.assertEqual(len(scores), len(expected))
+        self.assertIsNone(scores.rank(10_000))
+
+class TestLiveLeaderboard(unittest.TestCase):
+
+    def setUp(self):
+        """Настройка тестовой базы в памяти"""
+        engine = create_engine('sqlite://')
+        Base.metadata.create_all(bind=engine)
+        self.db = sessionmaker(bind=engine)()
+        self.board = LiveLeaderboard(chunk_size=2)
+        for telegram_id in range(1, 7):
+            self.db.add(User(
+                telegram_id=telegram_id,
+                total_profit=telegram_id * 100.0,
+                win_rate=50.0,
+                total_trades=5 if telegram_id != 6 else 0
+            ))
+        self.db.commit()
+
+    def tearDown(self):
+        self.db.close()
+
+    def user(self, telegram_id):
+        return self.db.scalar(select(User).where(User.telegram_id == telegram_id))
+
+    def test_ranks_match_calculate_rankings(self):
+        """Живой рейтинг совпадает с пересчетом в базе, в том числе после изменений"""
+        self.board.reconcile(self.db)
+        self.assertTrue(self.board.loaded)
+        self.assertEqual(len(self.board), 5)
+
+        self.user(1).total_profit = 1000.0
+        self.user(6).total_trades = 1
+        self.db.commit()
+        self.assertEqual(self.board.refresh_users(self.db, [self.user(1).id, self.user(6).id]), 2)
+
+        calculate_rankings(self.db)
+        for user in self.db.scalars(select(User).where(User.total_trades > 0)):
+            self.assertEqual(self.board.rank(user.id), user.rank)
+        self.assertEqual([rank for rank, _, _ in self.board.top(2)], [1, 2])
+
+    def test_reconcile_fixes_drift(self):
+        """Изменения в обход живого рейтинга исправляются сверкой"""
+        self.board.reconcile(self.db)
+        stale = self.user(5)
+        stale.total_trades = 0
+        self.user(2).total_profit = 9000.0
+        self.db.commit()
+
+        self.assertEqual(self.board.reconcile(self.db), 2)
+        self.assertIsNone(self.board.rank(stale.id))
+        self.assertEqual(self.board.rank(self.user(2).id), 1)
+        self.assertEqual(self.board.reconcile(self.db), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import unittest
+from unittest.mock import patch
+import numpy as np
+from config import Config
+from crypto_data import CryptoData
+from market_simulator import MarketSimulator, SimulatedExchange
+
+SYMBOLS = ['BTC/USDT', 'ETH/USDT', 'BNB/USDT']
+HOUR_MS = 3600 * 1000
+
+def simulator(seed=7, **kwargs):
+    return MarketSimulator(SYMBOLS, seed=seed, start_ms=100 * HOUR_MS, **kwargs)
+
+class TestMarketSimulator(unittest.TestCase):
+
+    def test_seeded_and_isolated(self):
+        """Одинаковое зерно - одинаковый путь; глобальный RNG не затрагивается"""
+        np.random.seed(1)
+        expected = np.random.rand()
+        np.random.seed(1)
+
+        first = simulator().step(100)
+        second = simulator().step(100)
+
+        np.testing.assert_array_equal(first, second)
+        self.assertEqual(np.random.rand(), expected)
+
+    def test_correlation(self):
+        """Корреляция приращений близка к заданной"""
+        sim = simulator(correlation=0.8, jump_intensity=0.0)
+        returns = np.diff(np.log(sim.step(20000)), axis=0)
+        corr = np.corrcoef(returns.T)
+        self.assertAlmostEqual(corr[0, 1], 0.8, delta=0.05)
+        self.assertAlmostEqual(corr[1, 2], 0.8, delta=0.05)
+
+    def test_candles_are_consistent(self):
+        """Свечи корректны, мост заканчивается в заданной цене"""
+        sim = simulator()
+        rows = sim.candles(3600, 50, end_price=50000.0, start_price=45000.0)
+        opens, highs, lows, closes = rows[:, 0], rows[:, 1], rows[:, 2], rows[:, 3]
+
+        self.assertAlmostEqual(opens[0], 45000.0)
+        self.assertAlmostEqual(closes[-1], 50000.0)
+        np.testing.assert_allclose(opens[1:], closes[:-1])
+        self.assertTrue(np.all(highs >= np.maximum(opens, closes)))
+        self.assertTrue(np.all(lows <= np.minimum(opens, closes)))
+
+class TestSimulatedExchange(unittest.TestCase):
+
+    def test_incremental_ohlcv(self):
+        """Догрузка по since продолжает уже выданную историю"""
+        exchange = SimulatedExchange(simulator(tick_seconds=1800))
+        first = exchange.fetch_ohlcv('BTC/USDT', '1h', limit=10)
+        self.assertEqual(first[-1][0], 100 * HOUR_MS)
+
+        for _ in range(6):
+            exchange.fetch_tickers(SYMBOLS)
+        update = exchange.fetch_ohlcv('BTC/USDT', '1h', since=first[-1][0], limit=10)
+
+        self.assertEqual([row[0] for row in update], [h * HOUR_MS for h in range(100, 104)])
+        self.assertEqual(update[0][1], first[-1][1])
+        self.assertAlmostEqual(update[-1][4], exchange.simulator.price('BTC/USDT'))
+
+    @patch.object(Config, 'AVAILABLE_COINS', SYMBOLS)
+    def test_crypto_data_end_to_end(self):
+        """CryptoData получает цены и свечи от симулятора"""
+        exchange = SimulatedExchange(simulator())
+        crypto_data = CryptoData(exchange=exchange)
+
+        crypto_data.update_prices()
+        self.assertEqual(crypto_data.prices, exchange.simulator.current_prices())
+
+        df = crypto_data._generate_mock_data('ETH/USDT', '15m', 20)
+        self.assertEqual(len(df), 20)
+        self.assertEqual(list(df.columns), ['timestamp', 'open', 'high', 'low', 'close', 'volume'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+from sqlalchemy import create_engine, delete, select
+from sqlalchemy.orm import sessionmaker
+from database import Base, User, Order, OrderType, OrderSide, Position, PositionType
+from matching_engine import MatchingEngine, OrderBook
+from price_index import PriceIndex
+from utils import match_limit_orders
+
+class TestOrderBook(unittest.TestCase):
+
+    def test_pop_crossed(self):
+        """Покупки исполняются при падении цены до лимита, продажи - при росте"""
+        book = OrderBook()
+        for order_id, price in ((1, 90.0), (2, 95.0), (3, 99.0)):
+            book.buys.add(price, order_id)
+        for order_id, price in ((4, 101.0), (5, 105.0)):
+            book.sells.add(price, order_id)
+
+        self.assertEqual(book.pop_crossed(100.0), [])
+        self.assertEqual(sorted(book.pop_crossed(95.0)), [2, 3])
+        self.assertEqual(book.pop_crossed(101.0), [4])
+        self.assertEqual((book.buys.ids, book.sells.ids), ([1], [5]))
+
+class TestMatchingEngine(unittest.TestCase):
+
+    def setUp(self):
+        """Настройка тестовой базы в памяти"""
+        engine = create_engine('sqlite://')
+        Base.metadata.create_all(bind=engine)
+        self.db = sessionmaker(bind=engine)()
+        self.engine = MatchingEngine(chunk_size=2)
+
+        self.user = User(telegram_id=111, username="trader", balance=1000.0)
+        self.db.add(self.user)
+        self.db.commit()
+
+    def tearDown(self):
+        self.db.close()
+
+    def add_order(self, symbol, side, price, amount=100.0, leverage=5):
+        order = Order(
+            user_id=self.user.id,
+            symbol=symbol,
+            order_type=OrderType.LIMIT,
+            side=side,
+            price=price,
+            amount=amount,
+            leverage=leverage,
+            filled=False
+        )
+        self.db.add(order)
+        self.db.commit()
+        return order
+
+    def test_match_opens_positions(self):
+        """Пересеченные ордера исполняются по своей цене и открывают позиции"""
+        buy_hit = self.add_order('BTC/USDT', OrderSide.BUY, 49000.0)
+        buy_rest = self.add_order('BTC/USDT', OrderSide.BUY, 45000.0)
+        sell_hit = self.add_order('ETH/USDT', OrderSide.SELL, 2500.0, leverage=10)
+
+        filled = self.engine.match(self.db, {'BTC/USDT': 48000.0, 'ETH/USDT': 2600.0})
+        self.db.commit()
+
+        self.assertEqual({o.id for o in filled}, {buy_hit.id, sell_hit.id})
+        self.assertTrue(all(o.telegram_id == 111 for o in filled))
+        self.db.expire_all()
+        self.assertTrue(buy_hit.filled)
+        self.assertIsNotNone(buy_hit.filled_at)
+        self.assertFalse(buy_rest.filled)
+
+        positions = {p.symbol: p for p in self.db.scalars(select(Position))}
+        self.assertEqual(positions['BTC/USDT'].position_type, PositionType.LONG)
+        self.assertEqual(positions['BTC/USDT'].entry_price, 49000.0)
+        self.assertEqual(positions['BTC/USDT'].margin, 50.0)
+        self.assertLess(positions['BTC/USDT'].liquidation_price, 49000.0)
+        self.assertEqual(positions['ETH/USDT'].position_type, PositionType.SHORT)
+        self.assertGreater(positions['ETH/USDT'].liquidation_price, 2500.0)
+        # Маржа зарезервирована при выставлении - баланс при исполнении не меняется
+        self.assertEqual(self.user.balance, 1000.0)
+        self.assertEqual(len(self.engine), 1)
+
+    def test_new_and_cancelled_orders(self):
+        """Новые ордера догружаются, отмененные в базе не исполняются"""
+        self.engine.match(self.db, {'BTC/USDT': 50000.0})
+        self.assertEqual(len(self.engine), 0)
+
+        kept = self.add_order('BTC/USDT', OrderSide.BUY, 49000.0)
+        cancelled = self.add_order('BTC/USDT', OrderSide.BUY, 49500.0)
+        self.engine.sync(self.db)
+        self.assertEqual(len(self.engine), 2)
+
+        # Отмена другим процессом: строки нет, книга об этом не знает
+        self.db.execute(delete(Order).where(Order.id == cancelled.id))
+        self.db.commit()
+
+        filled = self.engine.match(self.db, {'BTC/USDT': 48000.0})
+        self.assertEqual([o.id for o in filled], [kept.id])
+        self.assertEqual(self.engine.match(self.db, {'BTC/USDT': 47000.0}), [])
+
+    def test_out_of_order_orders(self):
+        """Ордер с меньшим id, закоммиченный после догрузки, попадает в книгу, а не теряется"""
+        self.engine.sync(self.db)
+        started = self.engine.synced_at
+        self.db.add(Order(id=10, user_id=self.user.id, symbol='BTC/USDT', order_type=OrderType.LIMIT,
+                          side=OrderSide.BUY, price=48000.0, amount=100.0, leverage=5, filled=False))
+        self.db.commit()
+        self.engine.sync(self.db)
+        # Другой процесс выставил ордер раньше, а закоммитил позже
+        self.db.add(Order(id=5, user_id=self.user.id, symbol='BTC/USDT', order_type=OrderType.LIMIT,
+                          side=OrderSide.BUY, price=49000.0, amount=100.0, leverage=5, filled=False,
+                          created_at=started))
+        self.db.commit()
+
+        self.engine.sync(self.db)
+        self.engine.sync(self.db)
+        self.assertEqual(len(self.engine), 2)
+        self.assertEqual([o.id for o in self.engine.match(self.db, {'BTC/USDT': 48500.0})], [5])
+
+    def test_filled_positions_indexed(self):
+        """Позиции исполненных ордеров попадают в индекс уровней сразу, а не через догрузку"""
+        order = self.add_order('BTC/USDT', OrderSide.BUY, 49000.0)
+        crypto_data = SimpleNamespace(prices={'BTC/USDT': 48000.0}, price_index=PriceIndex())
+        crypto_data.price_index.load(self.db)
+
+        with patch('utils.matching_engine', self.engine):
+            filled = match_limit_orders(self.db, crypto_data)
+        position = self.db.scalar(select(Position))
+        self.assertEqual([(o.id, o.position_id) for o in filled], [(order.id, position.id)])
+
+        # Обработчик добавил свою позицию с большим id до догрузки индекса
+        crypto_data.price_index.add_position(position.id + 1, 'BTC/USDT', True, 30000.0)
+        crypto_data.price_index.load_new(self.db)
+        self.assertIn(position.id, crypto_data.price_index)
+        self.assertEqual(
+            crypto_data.price_index.triggered('BTC/USDT', position.liquidation_price)['liquidation'],
+            [position.id]
+        )
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+import asyncio
+import time
+from telegram.error import Forbidden, RetryAfter
+from notifier import NotificationDispatcher, TokenBucket
+
+class FakeBot:
+    """Bot API: запоминает отправленные сообщения, может отвечать ошибками"""
+
+    def __init__(self, errors=None):
+        self.sent = []
+        self.errors = list(errors or [])
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if self.errors:
+            raise self.errors.pop(0)
+        self.sent.append((chat_id, text, time.monotonic()))
+
+def run_dispatcher(bot, events, **kwargs):
+    """Отправка событий (chat_id, item) и ожидание доставки"""
+    async def scenario():
+        dispatcher = NotificationDispatcher(**kwargs)
+        dispatcher.register('alert', lambda items: ','.join(map(str, items)))
+        dispatcher.start(bot)
+        for chat_id, item in events:
+            dispatcher.notify(chat_id, 'alert', item)
+        await dispatcher.stop(timeout=10)
+        return dispatcher
+
+    return asyncio.run(scenario())
+
+class TestTokenBucket(unittest.TestCase):
+
+    def test_reserve(self):
+        """Запас расходуется сразу, дальше - ожидание 1/rate на сообщение"""
+        bucket = TokenBucket(rate=10, capacity=2)
+        self.assertEqual(bucket.reserve(), 0.0)
+        self.assertEqual(bucket.reserve(), 0.0)
+        self.assertAlmostEqual(bucket.reserve(), 0.1, delta=0.01)
+        self.assertAlmostEqual(bucket.reserve(), 0.2, delta=0.01)
+
+class TestNotificationDispatcher(unittest.TestCase):
+
+    def test_coalescing(self):
+        """События одного чата до отправки склеиваются в одно сообщение"""
+        bot = FakeBot()
+        events = [(1, 'a'), (2, 'x'), (1, 'b'), (1, 'c')]
+        dispatcher = run_dispatcher(bot, events, workers=2, global_rate=100, chat_rate=1)
+
+        self.assertEqual(sorted((chat_id, text) for chat_id, text, _ in bot.sent), [(1, 'a,b,c'), (2, 'x')])
+        stats = dispatcher.stats()
+        self.assertEqual((stats['sent'], stats['coalesced'], stats['failed']), (2, 2, 0))
+        self.assertGreater(stats['latency_p95_ms'], 0)
+
+    def test_global_rate_limit(self):
+        """Общая частота не превышает global_rate при любом числе отправителей"""
+        bot = FakeBot()
+        events = [(chat_id, 'x') for chat_id in range(30)]
+        dispatcher = run_dispatcher(bot, events, workers=8, global_rate=20, chat_rate=1)
+
+        times = sorted(sent_at for _, _, sent_at in bot.sent)
+        self.assertEqual(len(times), 30)
+        # 20 сообщений сразу из запаса, остальные 10 - не быстрее 20 в секунду
+        self.assertGreaterEqual(times[-1] - times[0], 0.45)
+
+    def test_retry_after_and_permanent_errors(self):
+        """429 повторяется после паузы, заблокированный чат не повторяется"""
+        bot = FakeBot(errors=[RetryAfter(1)])
+        dispatcher = run_dispatcher(bot, [(1, 'a')], workers=1, global_rate=100, chat_rate=10)
+        self.assertEqual([text for _, text, _ in bot.sent], ['a'])
+        self.assertEqual((dispatcher.rate_limited, dispatcher.retries), (1, 1))
+        self.assertGreaterEqual(dispatcher.stats()['latency_p50_ms'], 1000)
+
+        bot = FakeBot(errors=[Forbidden('bot was blocked by the user')])
+        dispatcher = run_dispatcher(bot, [(1, 'a')], workers=1, global_rate=100, chat_rate=10)
+        self.assertEqual((len(bot.sent), dispatcher.failed, dispatcher.retries), (0, 1, 0))
+
+if __name__ == '__main__':
+    unittest.main()
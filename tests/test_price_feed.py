@@ -0,0 +1,106 @@
+import unittest
+import asyncio
+import os
+import tempfile
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from database import Base
+from price_feed import PriceFeed, ReplayPriceSource, SharedPriceSource, publish_prices
+
+class FakeCryptoData:
+    def __init__(self):
+        self.prices = {}
+    
+    def set_prices(self, prices):
+        self.prices.update(prices)
+
+class TestPriceFeed(unittest.TestCase):
+    
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(fd, 'w') as f:
+            f.write("timestamp,symbol,price\n")
+            f.write("1,BTC/USDT,45000\n1,ETH/USDT,2400\n")
+            f.write("2,BTC/USDT,44000\n2,ETH/USDT,2400\n")
+    
+    def tearDown(self):
+        os.remove(self.path)
+    
+    def test_replay_ticks_published_to_subscribers(self):
+        """Тики из файла рассылаются подписчикам по порядку"""
+        crypto_data = FakeCryptoData()
+        feed = PriceFeed(crypto_data, source=ReplayPriceSource(self.path), interval=0)
+        received = []
+        
+        async def subscriber(ticks):
+            received.append({t.symbol: (t.previous, t.price) for t in ticks})
+        
+        async def failing(ticks):
+            raise RuntimeError("subscriber error")
+        
+        feed.subscribe(failing)
+        feed.subscribe(subscriber)
+        
+        async def scenario():
+            for _ in range(3):
+                await feed.poll_once()
+        
+        asyncio.run(scenario())
+        
+        self.assertEqual(len(received), 2)
+        self.assertEqual(received[0]['BTC/USDT'], (None, 45000.0))
+        self.assertEqual(received[1]['BTC/USDT'], (45000.0, 44000.0))
+        # Цена ETH не изменилась - тик не рассылается
+        self.assertNotIn('ETH/USDT', received[1])
+        self.assertEqual(crypto_data.prices['BTC/USDT'], 44000.0)
+    
+    def test_shared_prices_from_leader(self):
+        """Процесс без опроса биржи получает цены, опубликованные ведущим"""
+        engine = create_engine('sqlite://', poolclass=StaticPool, connect_args={'check_same_thread': False})
+        Base.metadata.create_all(bind=engine)
+        sessions = sessionmaker(bind=engine)
+        crypto_data = FakeCryptoData()
+        feed = PriceFeed(crypto_data, source=SharedPriceSource(sessions), interval=0)
+        
+        def publish(prices, now):
+            with sessions() as db:
+                publish_prices(db, prices, now)
+                db.commit()
+        
+        async def scenario():
+            publish({'BTC/USDT': 45000.0, 'ETH/USDT': 2400.0}, 1.0)
+            first = await feed.poll_once()
+            # Без новой публикации цены не обновляются
+            second = await feed.poll_once()
+            publish({'BTC/USDT': 44000.0}, 2.0)
+            third = await feed.poll_once()
+            return first, second, third
+        
+        first, second, third = asyncio.run(scenario())
+        self.assertEqual(len(first), 2)
+        self.assertEqual(second, [])
+        self.assertEqual([(t.symbol, t.previous, t.price) for t in third], [('BTC/USDT', 45000.0, 44000.0)])
+        self.assertEqual(crypto_data.prices, {'BTC/USDT': 44000.0, 'ETH/USDT': 2400.0})
+    
+    def test_run_and_stop(self):
+        """Цикл ленты запускается и останавливается внутри event loop"""
+        feed = PriceFeed(FakeCryptoData(), source=ReplayPriceSource(self.path, loop=True), interval=0.001)
+        ticks = []
+        
+        async def subscriber(batch):
+            ticks.extend(batch)
+        
+        feed.subscribe(subscriber)
+        
+        async def scenario():
+            feed.start()
+            await asyncio.sleep(0.05)
+            await feed.stop()
+        
+        asyncio.run(scenario())
+        self.assertGreater(len(ticks), 4)
+        self.assertIsNone(feed.task)
+
+if __name__ == '__main__':
+    unittest.main()
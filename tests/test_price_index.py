@@ -0,0 +1,94 @@
+import unittest
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from database import Base, User, Position, PositionType
+from price_index import PriceIndex
+
+class TestPriceIndex(unittest.TestCase):
+    
+    def setUp(self):
+        self.index = PriceIndex()
+        self.index.add_position(1, 'BTC/USDT', True, 45000.0, stop_loss=48000.0, take_profit=55000.0)
+        self.index.add_position(2, 'BTC/USDT', True, 40000.0)
+        self.index.add_position(3, 'BTC/USDT', False, 55000.0, stop_loss=52000.0, take_profit=46000.0)
+        self.index.add_position(4, 'ETH/USDT', True, 2000.0)
+    
+    def test_liquidation_levels(self):
+        """Срабатывают только пересеченные уровни ликвидации"""
+        self.assertEqual(self.index.triggered('BTC/USDT', 50000.0)['liquidation'], [])
+        self.assertEqual(self.index.triggered('BTC/USDT', 45000.0)['liquidation'], [1])
+        self.assertEqual(self.index.triggered('BTC/USDT', 39000.0)['liquidation'], [2, 1])
+        self.assertEqual(self.index.triggered('BTC/USDT', 56000.0)['liquidation'], [3])
+    
+    def test_stop_loss_and_take_profit(self):
+        """Стоп-лосс и тейк-профит учитывают сторону позиции"""
+        drop = self.index.triggered('BTC/USDT', 46000.0)
+        self.assertEqual(drop['stop_loss'], [1])
+        self.assertEqual(drop['take_profit'], [3])
+        
+        rise = self.index.triggered('BTC/USDT', 55000.0)
+        self.assertEqual(rise['stop_loss'], [3])
+        self.assertEqual(rise['take_profit'], [1])
+    
+    def test_remove_and_replace(self):
+        """Закрытая позиция больше не срабатывает"""
+        self.assertTrue(self.index.remove_position(1))
+        self.assertFalse(self.index.remove_position(1))
+        self.assertEqual(self.index.triggered('BTC/USDT', 30000.0)['liquidation'], [2])
+        
+        self.index.add_position(2, 'BTC/USDT', True, 35000.0)
+        self.assertEqual(self.index.triggered('BTC/USDT', 38000.0)['liquidation'], [])
+        self.assertEqual(len(self.index), 3)
+    
+    def test_remove_positions_batch(self):
+        """Пакетное удаление, в том числе позиций с одинаковой ценой уровня"""
+        for position_id in range(10, 20):
+            self.index.add_position(position_id, 'ETH/USDT', True, 2000.0)
+        
+        self.assertEqual(self.index.remove_positions([1, 4, 12, 15, 99]), 4)
+        self.assertEqual(self.index.triggered('BTC/USDT', 30000.0)['liquidation'], [2])
+        self.assertEqual(self.index.triggered('BTC/USDT', 46000.0)['stop_loss'], [])
+        self.assertEqual(
+            self.index.triggered('ETH/USDT', 1900.0)['liquidation'],
+            [10, 11, 13, 14, 16, 17, 18, 19]
+        )
+
+class TestPriceIndexSync(unittest.TestCase):
+    
+    def setUp(self):
+        """Настройка тестовой базы в памяти"""
+        engine = create_engine('sqlite://')
+        Base.metadata.create_all(bind=engine)
+        self.db = sessionmaker(bind=engine)()
+        self.user = User(telegram_id=111, balance=1000.0)
+        self.db.add(self.user)
+        self.db.commit()
+        self.index = PriceIndex()
+        self.index.load(self.db)
+    
+    def tearDown(self):
+        self.db.close()
+    
+    def add_position(self, position_id, opened_at):
+        self.db.add(Position(
+            id=position_id, user_id=self.user.id, symbol='BTC/USDT', position_type=PositionType.LONG,
+            entry_price=50000.0, current_price=50000.0, amount=10.0, leverage=10, margin=10.0,
+            liquidation_price=45000.0, is_open=True, opened_at=opened_at
+        ))
+        self.db.commit()
+    
+    def test_load_new_out_of_order_commits(self):
+        """Позиции с меньшим id, закоммиченные позже, догружаются по окну opened_at"""
+        # Своя позиция ведущего с большим id попадает в индекс сразу
+        self.index.add_position(20, 'BTC/USDT', True, 45000.0)
+        # Другой процесс открыл позицию до прошлой загрузки, а закоммитил после
+        self.add_position(5, self.index.synced_at - timedelta(seconds=10))
+        self.add_position(10, datetime.utcnow())
+        
+        self.assertEqual(self.index.load_new(self.db), 2)
+        self.assertEqual(sorted(self.index.entries), [5, 10, 20])
+        self.assertEqual(self.index.load_new(self.db), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+from database import Base, User, LeaderboardEntry
+from utils import calculate_rankings
+
+class TestRankings(unittest.TestCase):
+
+    def setUp(self):
+        """Настройка тестовой базы в памяти"""
+        engine = create_engine('sqlite://')
+        Base.metadata.create_all(bind=engine)
+        self.db = sessionmaker(bind=engine)()
+
+    def tearDown(self):
+        self.db.close()
+
+    def add_user(self, telegram_id, total_profit, win_rate, total_trades):
+        user = User(
+            telegram_id=telegram_id,
+            first_name=f"user{telegram_id}",
+            total_profit=total_profit,
+            win_rate=win_rate,
+            total_trades=total_trades
+        )
+        self.db.add(user)
+        self.db.commit()
+        return user
+
+    def test_ranks_and_ties(self):
+        """Равные очки - равный ранг, игроки без сделок не ранжируются"""
+        best = self.add_user(1, 1000.0, 80.0, 10)
+        tie_a = self.add_user(2, 100.0, 50.0, 5)
+        tie_b = self.add_user(3, 100.0, 50.0, 5)
+        last = self.add_user(4, -500.0, 10.0, 1)
+        idle = self.add_user(5, 0.0, 0.0, 0)
+
+        top = calculate_rankings(self.db)
+        self.db.expire_all()
+
+        self.assertEqual([best.rank, tie_a.rank, tie_b.rank, last.rank], [1, 2, 2, 4])
+        self.assertEqual(idle.rank, 0)
+        self.assertEqual([row['position'] for row in top], [1, 2, 3, 4])
+        self.assertEqual([row['rank'] for row in top], [1, 2, 2, 4])
+        self.assertEqual(top[0]['telegram_id'], 1)
+        self.assertEqual(top[0]['score'], 1000.0 * 0.5 + 80.0 * 1000 + 10 * 10)
+
+    def test_leaderboard_is_top_n(self):
+        """Таблица лидеров хранит только первые top_n и пересобирается при пересчете"""
+        for telegram_id in range(1, 11):
+            self.add_user(telegram_id, telegram_id * 100.0, 50.0, 5)
+
+        calculate_rankings(self.db, top_n=3)
+        entries = self.db.scalars(select(LeaderboardEntry).order_by(LeaderboardEntry.position)).all()
+        self.assertEqual([e.telegram_id for e in entries], [10, 9, 8])
+
+        user = self.db.scalar(select(User).where(User.telegram_id == 1))
+        user.total_profit = 5000.0
+        self.db.commit()
+
+        calculate_rankings(self.db, top_n=3)
+        entries = self.db.scalars(select(LeaderboardEntry).order_by(LeaderboardEntry.position)).all()
+        self.assertEqual([(e.telegram_id, e.rank) for e in entries], [(1, 1), (10, 2), (9, 3)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+import asyncio
+import threading
+from unittest.mock import patch
+import pandas as pd
+import render_pool as render_module
+from render_pool import RenderPool, RenderQueueFull
+
+def candles():
+    return pd.DataFrame({
+        'timestamp': pd.date_range('2024-01-01', periods=3, freq='h'),
+        'open': [100.0, 101.0, 102.0],
+        'high': [102.0, 103.0, 104.0],
+        'low': [99.0, 100.0, 101.0],
+        'close': [101.0, 102.0, 101.5],
+    })
+
+class TestRenderPool(unittest.TestCase):
+
+    def test_process_pool_renders_png(self):
+        """Графики отрисовываются в процессах пула"""
+        pool = RenderPool(workers=1, max_queue=2, timeout=60)
+        try:
+            pool.start()
+            data = asyncio.run(pool.render('price', candles(), 'BTC/USDT'))
+        finally:
+            pool.shutdown()
+
+        self.assertTrue(data.startswith(b'\x89PNG'))
+        stats = pool.stats()
+        self.assertEqual(stats['rendered'], 1)
+        self.assertEqual(stats['queue_depth'], 0)
+        self.assertGreater(stats['render_p50_ms'], 0)
+
+    def test_queue_limit_and_timeout(self):
+        """Сверх лимита очереди запросы отклоняются, долгие - по таймауту"""
+        release = threading.Event()
+
+        def slow_render(kind, args):
+            release.wait(5)
+            return b'png', 0.0
+
+        pool = RenderPool(workers=0, max_queue=1, timeout=0.2)
+
+        async def scenario():
+            first = asyncio.ensure_future(pool.render('pnl', [0, 1]))
+            second = asyncio.ensure_future(pool.render('pnl', [0, 1]))
+            await asyncio.sleep(0.05)
+            self.assertEqual(pool.stats()['queue_depth'], 1)
+            with self.assertRaises(RenderQueueFull):
+                await pool.render('pnl', [0, 1])
+            results = await asyncio.gather(first, second, return_exceptions=True)
+            release.set()
+            return results
+
+        with patch.object(render_module, '_render', slow_render):
+            results = asyncio.run(scenario())
+
+        self.assertTrue(all(isinstance(r, asyncio.TimeoutError) for r in results))
+        stats = pool.stats()
+        self.assertEqual((stats['rejected'], stats['timeouts']), (1, 2))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from datetime import datetime, timedelta
+import pyarrow.parquet as pq
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import sessionmaker
+from config import Config
+from database import Base, User, Position, PositionType, Transaction, UserStats
+from retention import cleanup
+
+class TestRetention(unittest.TestCase):
+
+    def setUp(self):
+        """Настройка тестовой базы в памяти: 50 старых и 10 свежих закрытых позиций, 5 открытых"""
+        engine = create_engine('sqlite://')
+        Base.metadata.create_all(bind=engine)
+        self.db = sessionmaker(bind=engine)()
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+        self.user = User(telegram_id=111, username="trader", balance=1000.0)
+        self.db.add(self.user)
+        self.db.commit()
+        self.now = datetime.utcnow()
+        old = self.now - timedelta(days=40)
+        for i in range(65):
+            closed_at = None if i >= 60 else old + timedelta(minutes=i % 7) if i < 50 else self.now
+            self.db.add(Position(
+                user_id=self.user.id,
+                symbol='BTC/USDT',
+                position_type=PositionType.LONG if i % 2 else PositionType.SHORT,
+                entry_price=100.0,
+                current_price=100.0,
+                amount=1.0,
+                leverage=10,
+                margin=10.0,
+                liquidation_price=90.0,
+                realized_pnl=5.0 if i % 3 else -5.0,
+                is_open=i >= 60,
+                opened_at=old,
+                closed_at=closed_at
+            ))
+        for i in range(30):
+            self.db.add(Transaction(
+                user_id=self.user.id, type='trade', amount=1.0, balance_before=1000.0, balance_after=1001.0,
+                details={'position': i}, created_at=old if i < 25 else self.now
+            ))
+        self.db.commit()
+
+    def tearDown(self):
+        self.db.close()
+        self.tmpdir.cleanup()
+
+    def count(self, model, *conditions):
+        return self.db.scalar(select(func.count()).select_from(model).where(*conditions))
+
+    def test_batched_delete(self):
+        """Удаляются только старые закрытые позиции и старые транзакции, порциями"""
+        deleted = cleanup(self.db, self.now - timedelta(days=30), batch_size=7, pause=0)
+        self.assertEqual(deleted, {'positions': 50, 'transactions': 25})
+        self.assertEqual(self.count(Position, Position.is_open == False), 10)
+        self.assertEqual(self.count(Position, Position.is_open == True), 5)
+        self.assertEqual(self.count(Transaction), 5)
+
+    def test_user_stats_kept(self):
+        """Агрегаты игрока без строки user_stats строятся до удаления его истории"""
+        cleanup(self.db, self.now - timedelta(days=30), batch_size=20, pause=0)
+        stats = self.db.get(UserStats, self.user.id)
+        self.assertEqual(stats.closed_trades, 60)
+        self.assertEqual(stats.open_positions, 5)
+
+    def test_archive(self):
+        """Удаленные строки читаются из архива Parquet; файлы закрыты и переименованы"""
+        # Несколько файлов: строки удаляются после закрытия каждого
+        with patch.object(Config, 'ARCHIVE_FILE_ROWS', 20):
+            deleted = cleanup(self.db, self.now - timedelta(days=30), archive_dir=self.tmpdir.name,
+                              batch_size=7, pause=0)
+        self.assertEqual(deleted, {'positions': 50, 'transactions': 25})
+        files = sorted(os.listdir(self.tmpdir.name))
+        self.assertEqual(len([name for name in files if name.startswith('positions-')]), 3)
+        self.assertFalse([name for name in files if name.endswith('.part')])
+
+        positions = [row for name in files if name.startswith('positions-')
+                     for row in pq.read_table(os.path.join(self.tmpdir.name, name)).to_pylist()]
+        self.assertEqual(len(positions), 50)
+        self.assertEqual(len({row['id'] for row in positions}), 50)
+        self.assertIn(positions[0]['position_type'], ('long', 'short'))
+        self.assertFalse(any(row['is_open'] for row in positions))
+
+        transactions = [row for name in files if name.startswith('transactions-')
+                        for row in pq.read_table(os.path.join(self.tmpdir.name, name)).to_pylist()]
+        self.assertEqual(sorted(json.loads(row['details'])['position'] for row in transactions), list(range(25)))
+
+if __name__ == '__main__':
+    unittest.main()
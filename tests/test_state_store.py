@@ -0,0 +1,87 @@
+import unittest
+import asyncio
+import os
+import tempfile
+from state_store import MemoryStateStore, SQLiteStateStore, RedisStateStore
+from resp_server import LocalRespServer
+
+DATA = {'position_type': 'short', 'symbol': 'ETH/USDT', 'leverage': 5}
+
+class StateStoreChecks:
+    """Общие проверки для всех реализаций хранилища"""
+
+    def make_store(self, ttl):
+        raise NotImplementedError
+
+    def run_with_store(self, scenario, ttl=60):
+        return asyncio.run(scenario(self.make_store(ttl)))
+
+    def test_set_get_delete(self):
+        async def scenario(store):
+            await store.set(1, DATA)
+            stored = await store.get(1)
+            await store.delete(1)
+            return stored, await store.get(1), await store.get(2)
+
+        self.assertEqual(self.run_with_store(scenario), (DATA, None, None))
+
+    def test_ttl_expiry(self):
+        """Брошенный диалог истекает по TTL"""
+        async def scenario(store):
+            await store.set(1, DATA)
+            await asyncio.sleep(1.1)
+            return await store.get(1)
+
+        self.assertIsNone(self.run_with_store(scenario, ttl=1))
+
+class TestMemoryStateStore(StateStoreChecks, unittest.TestCase):
+
+    def make_store(self, ttl):
+        return MemoryStateStore(ttl=ttl, max_entries=2)
+
+    def test_bounded(self):
+        """Число записей ограничено, вытесняются самые старые"""
+        async def scenario(store):
+            for user_id in range(5):
+                await store.set(user_id, DATA)
+            return len(store), await store.get(0), await store.get(4)
+
+        self.assertEqual(self.run_with_store(scenario), (2, None, DATA))
+
+class TestSQLiteStateStore(StateStoreChecks, unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'state.db')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def make_store(self, ttl):
+        return SQLiteStateStore(self.path, ttl=ttl)
+
+    def test_shared_between_instances(self):
+        """Два процесса бота видят одно состояние"""
+        async def scenario(store):
+            await store.set(1, DATA)
+            return await SQLiteStateStore(self.path).get(1)
+
+        self.assertEqual(self.run_with_store(scenario), DATA)
+
+class TestRedisStateStore(StateStoreChecks, unittest.TestCase):
+    """Redis-протокол против локального RESP-сервера"""
+
+    def run_with_store(self, scenario, ttl=60):
+        async def with_server():
+            server = LocalRespServer()
+            port = await server.start()
+            store = RedisStateStore(f'redis://127.0.0.1:{port}/0', ttl=ttl)
+            try:
+                return await scenario(store)
+            finally:
+                await store.close()
+                await server.stop()
+        return asyncio.run(with_server())
+
+if __name__ == '__main__':
+    unittest.main()
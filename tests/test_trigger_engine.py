@@ -0,0 +1,100 @@
+import unittest
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+from database import Base, User, Position, PositionType, Transaction
+from trigger_engine import TriggerEngine
+
+class TestTriggerEngine(unittest.TestCase):
+
+    def setUp(self):
+        """Настройка тестовой базы в памяти"""
+        engine = create_engine('sqlite://')
+        Base.metadata.create_all(bind=engine)
+        self.db = sessionmaker(bind=engine)()
+        self.engine = TriggerEngine(chunk_size=2)
+
+        self.user = User(telegram_id=111, username="trader", balance=1000.0)
+        self.db.add(self.user)
+        self.db.commit()
+
+    def tearDown(self):
+        self.db.close()
+
+    def add_position(self, symbol, position_type, stop_loss=None, take_profit=None, entry_price=100.0, margin=50.0):
+        position = Position(
+            user_id=self.user.id,
+            symbol=symbol,
+            position_type=position_type,
+            entry_price=entry_price,
+            current_price=entry_price,
+            amount=1.0,
+            leverage=10,
+            margin=margin,
+            liquidation_price=1.0 if position_type == PositionType.LONG else 1000.0,
+            stop_loss=stop_loss,
+            take_profit=take_profit,
+            is_open=True
+        )
+        self.db.add(position)
+        self.db.commit()
+        return position
+
+    def test_long_and_short_triggers(self):
+        """Стоп-лосс и тейк-профит учитывают сторону позиции"""
+        long_stop = self.add_position('BTC/USDT', PositionType.LONG, stop_loss=95.0, take_profit=120.0)
+        short_take = self.add_position('BTC/USDT', PositionType.SHORT, stop_loss=110.0, take_profit=95.0)
+        long_safe = self.add_position('BTC/USDT', PositionType.LONG, stop_loss=90.0)
+        no_levels = self.add_position('BTC/USDT', PositionType.SHORT)
+        short_stop = self.add_position('ETH/USDT', PositionType.SHORT, stop_loss=105.0)
+
+        closed = self.engine.run(self.db, {'BTC/USDT': 94.0, 'ETH/USDT': 106.0})
+        self.db.commit()
+
+        self.assertEqual(
+            {(p.id, p.reason) for p in closed},
+            {(long_stop.id, 'stop_loss'), (short_take.id, 'take_profit'), (short_stop.id, 'stop_loss')}
+        )
+        self.db.expire_all()
+        self.assertFalse(long_stop.is_open)
+        self.assertEqual(long_stop.realized_pnl, -50.0)
+        self.assertEqual(long_stop.current_price, 94.0)
+        self.assertEqual(short_take.realized_pnl, 60.0)
+        self.assertTrue(long_safe.is_open)
+        self.assertTrue(no_levels.is_open)
+
+    def test_balance_stats_and_transactions(self):
+        """Маржа с результатом зачисляется, статистика и журнал операций обновляются"""
+        self.add_position('BTC/USDT', PositionType.LONG, take_profit=110.0)
+        self.add_position('BTC/USDT', PositionType.LONG, take_profit=105.0)
+        self.add_position('BTC/USDT', PositionType.SHORT, stop_loss=110.0, margin=20.0)
+
+        closed = self.engine.run(self.db, {'BTC/USDT': 112.0})
+        self.db.commit()
+        self.db.expire_all()
+
+        # +120 +120 и убыток шорта, ограниченный маржой (-20): зачислено 170 + 170 + 0
+        self.assertEqual(sorted(p.pnl for p in closed), [-20.0, 120.0, 120.0])
+        self.assertAlmostEqual(self.user.balance, 1340.0)
+        self.assertEqual(self.user.total_trades, 3)
+        self.assertAlmostEqual(self.user.total_profit, 220.0)
+        self.assertAlmostEqual(self.user.win_rate, 200 / 3)
+        self.assertTrue(all(p.telegram_id == 111 for p in closed))
+
+        transactions = self.db.scalars(select(Transaction).order_by(Transaction.id)).all()
+        self.assertEqual([t.type for t in transactions], ['trade'] * 3)
+        self.assertEqual(transactions[0].balance_before, 1000.0)
+        for previous, current in zip(transactions, transactions[1:]):
+            self.assertAlmostEqual(current.balance_before, previous.balance_after)
+        self.assertAlmostEqual(transactions[-1].balance_after, 1340.0)
+        self.assertEqual(closed[-1].balance, transactions[-1].balance_after)
+        self.assertEqual(transactions[0].details['reason'], 'take_profit')
+
+    def test_unknown_price_skipped(self):
+        """Без цены позиции не закрываются"""
+        self.add_position('BNB/USDT', PositionType.LONG, stop_loss=95.0)
+
+        self.assertEqual(self.engine.run(self.db, {'BNB/USDT': 0.0}), [])
+        self.assertEqual(self.engine.run(self.db, {}), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+from unittest.mock import patch
+from user_cache import UserCache, UserSnapshot
+
+def snapshot(telegram_id, balance=2000.0):
+    return UserSnapshot(
+        id=telegram_id, telegram_id=telegram_id, first_name='Test',
+        balance=balance, total_profit=0.0, total_trades=0, win_rate=0.0, rank=0
+    )
+
+class TestUserCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = UserCache(max_size=2, ttl=10)
+
+    def test_hit_and_miss(self):
+        """Попадания и промахи учитываются в метриках"""
+        self.assertIsNone(self.cache.get(1))
+        self.cache.put(snapshot(1))
+        self.assertEqual(self.cache.get(1).balance, 2000.0)
+
+        stats = self.cache.stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+        self.assertAlmostEqual(stats['hit_rate'], 0.5)
+
+    def test_lru_eviction(self):
+        """При переполнении вытесняется давно не читанная запись"""
+        self.cache.put(snapshot(1))
+        self.cache.put(snapshot(2))
+        self.cache.get(1)
+        self.cache.put(snapshot(3))
+
+        self.assertIsNotNone(self.cache.get(1))
+        self.assertIsNone(self.cache.get(2))
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+
+    def test_ttl_expiry(self):
+        """Запись с истекшим TTL не возвращается"""
+        with patch('user_cache.time.monotonic', return_value=100.0):
+            self.cache.put(snapshot(1))
+        with patch('user_cache.time.monotonic', return_value=111.0):
+            self.assertIsNone(self.cache.get(1))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_invalidate(self):
+        """Изменение баланса сбрасывает запись"""
+        self.cache.put(snapshot(1))
+        self.cache.invalidate(1)
+        self.cache.invalidate(1)
+        self.assertIsNone(self.cache.get(1))
+        self.assertEqual(self.cache.stats()['invalidations'], 1)
+
+if __name__ == '__main__':
+    unittest.main()
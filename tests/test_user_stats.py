@@ -0,0 +1,97 @@
+import unittest
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+from database import Base, User, Order, OrderType, OrderSide, Position, PositionType, UserStats
+from liquidation_engine import LiquidationEngine
+from matching_engine import MatchingEngine
+from trigger_engine import TriggerEngine
+import user_stats
+
+class TestUserStats(unittest.TestCase):
+
+    def setUp(self):
+        """Настройка тестовой базы в памяти"""
+        engine = create_engine('sqlite://')
+        Base.metadata.create_all(bind=engine)
+        self.db = sessionmaker(bind=engine)()
+
+        self.user = User(telegram_id=111, username="trader", balance=1000.0)
+        self.db.add(self.user)
+        self.db.commit()
+
+    def tearDown(self):
+        self.db.close()
+
+    def add_position(self, symbol, position_type, entry_price, stop_loss=None, liquidation_price=None):
+        position = Position(
+            user_id=self.user.id,
+            symbol=symbol,
+            position_type=position_type,
+            entry_price=entry_price,
+            current_price=entry_price,
+            amount=2.0,
+            leverage=5,
+            margin=100.0,
+            liquidation_price=liquidation_price or (1.0 if position_type == PositionType.LONG else 1e9),
+            stop_loss=stop_loss,
+            is_open=True
+        )
+        self.db.add(position)
+        self.db.commit()
+        return position
+
+    def snapshot(self):
+        row = self.db.execute(select(UserStats).where(UserStats.user_id == self.user.id)).scalar_one()
+        stats = (row.open_positions, round(row.open_margin, 6), row.leverage_sum,
+                 row.closed_trades, row.wins, row.losses, row.liquidations, round(row.realized_pnl, 6))
+        self.db.expunge(row)
+        return stats
+
+    def test_trade_path_matches_rebuild(self):
+        """Открытие, стоп-лосс и ликвидация дают те же агрегаты, что и пересчет по позициям"""
+        # Позиции, созданные до появления агрегатов, учитываются при первой записи
+        self.add_position('BTC/USDT', PositionType.LONG, 100.0, stop_loss=90.0)
+        self.add_position('ETH/USDT', PositionType.SHORT, 50.0, liquidation_price=60.0)
+
+        self.db.add(Order(user_id=self.user.id, symbol='BTC/USDT', order_type=OrderType.LIMIT,
+                          side=OrderSide.BUY, price=95.0, amount=10.0, leverage=2, filled=False))
+        self.db.commit()
+        MatchingEngine().match(self.db, {'BTC/USDT': 94.0})
+        self.db.commit()
+        self.assertEqual(self.snapshot()[:3], (3, 202.0, 12))
+
+        TriggerEngine().run(self.db, {'BTC/USDT': 89.0})
+        LiquidationEngine().run(self.db, {'ETH/USDT': 61.0})
+        self.db.commit()
+
+        live = self.snapshot()
+        self.assertEqual(live, (1, 2.0, 2, 2, 0, 2, 1, -200.0))
+        user_stats.rebuild(self.db)
+        self.db.commit()
+        self.assertEqual(self.snapshot(), live)
+
+        self.db.refresh(self.user)
+        self.assertEqual(self.user.total_trades, 2)
+        self.assertEqual(self.user.total_profit, -200.0)
+        self.assertEqual(self.user.win_rate, 0.0)
+
+    def test_portfolio_stats(self):
+        """Стоимость и PnL по текущим ценам совпадают с расчетом по позициям"""
+        self.add_position('BTC/USDT', PositionType.LONG, 100.0)
+        self.add_position('BTC/USDT', PositionType.SHORT, 120.0)
+        self.add_position('ETH/USDT', PositionType.LONG, 50.0)
+        user_stats.backfill(self.db)
+
+        stats = user_stats.portfolio_stats(self.db, self.user.id, {'BTC/USDT': 110.0})
+        self.assertEqual(stats['open_positions'], 3)
+        self.assertEqual(stats['total_margin'], 300.0)
+        self.assertEqual(stats['average_leverage'], 5)
+        # BTC: лонг +100, шорт +100; ETH без цены - по цене входа, без PnL
+        self.assertAlmostEqual(stats['total_pnl'], 200.0)
+        self.assertAlmostEqual(stats['total_value'], 2 * 10 * 110.0 + 10 * 50.0)
+
+        empty = user_stats.portfolio_stats(self.db, 999, {})
+        self.assertEqual((empty['open_positions'], empty['total_value']), (0, 0))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+import unittest
+import asyncio
+import json
+import os
+import queue
+import tempfile
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from telegram import Bot
+from database import Base, User, Position, PositionType
+from price_index import PriceIndex
+from telegram_stub import FakeTelegramApi
+from webhook import LeaderLock, WebhookDispatcher, partition, update_user_id
+
+def message_update(update_id, user_id):
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id, 'date': 0, 'text': '/start',
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': 6}],
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'Trader'},
+        },
+    }
+
+async def post(port, body, headers=None):
+    """Минимальный HTTP POST к диспетчеру; возвращает код ответа"""
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    head = ''.join(f"{name}: {value}\r\n" for name, value in (headers or {}).items())
+    writer.write(
+        f"POST /telegram HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(body)}\r\n{head}\r\n".encode() + body
+    )
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    writer.close()
+    return status
+
+class TestPartitioning(unittest.TestCase):
+
+    def test_user_id_and_partition(self):
+        """Обновления одного пользователя всегда попадают в один процесс"""
+        callback = {'update_id': 2, 'callback_query': {'id': '1', 'from': {'id': 42}, 'data': 'portfolio'}}
+        self.assertEqual(update_user_id(message_update(1, 42)), 42)
+        self.assertEqual(update_user_id(callback), 42)
+        self.assertIsNone(update_user_id({'update_id': 3, 'poll': {'id': '1'}}))
+
+        self.assertEqual(partition(42, 4), partition(42, 4))
+        self.assertEqual(partition(None, 4), 0)
+        self.assertEqual({partition(user_id, 4) for user_id in range(100)}, {0, 1, 2, 3})
+
+class TestLeaderLock(unittest.TestCase):
+
+    def test_single_leader(self):
+        """Ведущим может быть только один; после освобождения блокировку получает другой"""
+        path = os.path.join(tempfile.mkdtemp(), 'leader.lock')
+        first, second = LeaderLock(path), LeaderLock(path)
+
+        self.assertTrue(first.acquire())
+        self.assertFalse(second.acquire())
+        self.assertTrue(first.is_leader)
+        self.assertFalse(second.is_leader)
+
+        first.release()
+        self.assertTrue(second.acquire())
+        second.release()
+
+class TestWebhookDispatcher(unittest.TestCase):
+
+    def test_routing_and_secret(self):
+        """Обновления раскладываются по очередям; без секрета - 403"""
+        queues = [queue.Queue() for _ in range(3)]
+        dispatcher = WebhookDispatcher(queues, secret='s3cret', path='/telegram')
+
+        async def scenario():
+            port = await dispatcher.start('127.0.0.1', 0)
+            secret = {'X-Telegram-Bot-Api-Secret-Token': 's3cret'}
+            statuses = [
+                await post(port, json.dumps(message_update(i, user_id)).encode(), secret)
+                for i, user_id in enumerate([10, 11, 12, 13])
+            ]
+            statuses.append(await post(port, json.dumps(message_update(9, 10)).encode()))
+            statuses.append(await post(port, b'not json', secret))
+            await dispatcher.stop()
+            return statuses
+
+        self.assertEqual(asyncio.run(scenario()), [200, 200, 200, 200, 403, 400])
+        routed = [[update['message']['from']['id'] for update in q.queue] for q in queues]
+        self.assertEqual(routed, [[12], [10, 13], [11]])
+
+class TestTelegramStub(unittest.TestCase):
+
+    def test_bot_against_stub(self):
+        """Bot из python-telegram-bot работает с локальной заменой API"""
+        api = FakeTelegramApi()
+
+        async def scenario():
+            await api.start()
+            async with Bot('123:TEST', base_url=f"{api.url}/bot") as bot:
+                message = await bot.send_message(chat_id=42, text='Привет')
+                photo = await bot.send_photo(chat_id=42, photo=b'\x89PNG fake')
+            await api.stop()
+            return message, photo
+
+        message, photo = asyncio.run(scenario())
+        self.assertEqual(message.text, 'Привет')
+        self.assertEqual(message.chat_id, 42)
+        self.assertTrue(photo.photo[-1].file_id)
+        self.assertEqual(api.calls_to('sendMessage')[0]['text'], 'Привет')
+        self.assertEqual(api.calls_to('sendPhoto')[0]['photo'], b'\x89PNG fake')
+
+class TestPriceIndexCatchUp(unittest.TestCase):
+
+    def test_load_new(self):
+        """Позиции, открытые другим процессом, догружаются в индекс"""
+        engine = create_engine('sqlite://')
+        Base.metadata.create_all(bind=engine)
+        db = sessionmaker(bind=engine)()
+        user = User(telegram_id=111, username="trader", balance=1000.0)
+        db.add(user)
+        db.commit()
+
+        def open_position(liquidation_price):
+            db.add(Position(
+                user_id=user.id, symbol='BTC/USDT', position_type=PositionType.LONG,
+                entry_price=50000.0, current_price=50000.0, amount=1.0, leverage=10,
+                margin=100.0, liquidation_price=liquidation_price, is_open=True
+            ))
+            db.commit()
+
+        open_position(45000.0)
+        index = PriceIndex()
+        index.load(db)
+        self.assertEqual(len(index), 1)
+
+        open_position(46000.0)
+        self.assertEqual(index.load_new(db), 1)
+        self.assertEqual(index.load_new(db), 0)
+        self.assertEqual(len(index.triggered('BTC/USDT', 44000.0)['liquidation']), 2)
+        db.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,234 @@
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import bindparam, insert, select, update
+
+from database import Position, PositionType, Transaction, User, chunked
+from liquidation_engine import LiquidationEngine
+from user_stats import record_closed
+
+# Таблицы для Core-операций: bulk UPDATE/INSERT без загрузки ORM-объектов
+positions_table = Position.__table__
+users_table = User.__table__
+transactions_table = Transaction.__table__
+
+
+class ClosedPosition(NamedTuple):
+    """Данные позиции, закрытой по стоп-лоссу или тейк-профиту"""
+    id: int
+    user_id: int
+    telegram_id: int
+    symbol: str
+    position_type: str
+    leverage: int
+    reason: str  # 'stop_loss' | 'take_profit'
+    entry_price: float
+    trigger_price: float
+    close_price: float
+    margin: float
+    pnl: float
+    balance: float
+
+
+class TriggerEngine:
+    """Векторизованное исполнение стоп-лоссов и тейк-профитов"""
+
+    COLUMNS = (
+        'id', 'user_id', 'symbol', 'is_long', 'entry_price',
+        'amount', 'leverage', 'margin', 'stop_loss', 'take_profit',
+    )
+
+    def __init__(self, chunk_size: int = 500):
+        self.chunk_size = chunk_size
+
+    def load_open_positions(
+        self,
+        db,
+        symbols: Optional[Sequence[str]] = None,
+        position_ids: Optional[Sequence[int]] = None
+    ) -> Dict[str, np.ndarray]:
+        """Открытые позиции с заданным SL или TP в виде колонок NumPy (пустой уровень - NaN)"""
+        stmt = select(
+            Position.id,
+            Position.user_id,
+            Position.symbol,
+            (Position.position_type == PositionType.LONG).label('is_long'),
+            Position.entry_price,
+            Position.amount,
+            Position.leverage,
+            Position.margin,
+            Position.stop_loss,
+            Position.take_profit,
+        ).where(
+            Position.is_open == True,
+            (Position.stop_loss != None) | (Position.take_profit != None),
+        )
+
+        if symbols is not None:
+            stmt = stmt.where(Position.symbol.in_(list(symbols)))
+
+        if position_ids is not None:
+            rows = []
+            for chunk in chunked(list(position_ids), self.chunk_size):
+                rows.extend(db.execute(stmt.where(Position.id.in_(chunk))).all())
+        else:
+            rows = db.execute(stmt).all()
+
+        if not rows:
+            return {name: np.empty(0) for name in self.COLUMNS}
+
+        ids, user_ids, syms, is_long, entry, amount, leverage, margin, stop_loss, take_profit = zip(*rows)
+        return {
+            'id': np.asarray(ids, dtype=np.int64),
+            'user_id': np.asarray(user_ids, dtype=np.int64),
+            'symbol': np.asarray(syms, dtype=object),
+            'is_long': np.asarray(is_long, dtype=bool),
+            'entry_price': np.asarray(entry, dtype=np.float64),
+            'amount': np.asarray(amount, dtype=np.float64),
+            'leverage': np.asarray(leverage, dtype=np.int64),
+            'margin': np.asarray(margin, dtype=np.float64),
+            'stop_loss': np.asarray(stop_loss, dtype=np.float64),
+            'take_profit': np.asarray(take_profit, dtype=np.float64),
+        }
+
+    @staticmethod
+    def find_triggers(columns: Dict[str, np.ndarray], current: np.ndarray):
+        """Маски сработавших стоп-лоссов и тейк-профитов (при обоих - стоп-лосс)"""
+        is_long = columns['is_long']
+        stop_loss = columns['stop_loss']
+        take_profit = columns['take_profit']
+        known = current > 0
+        # Сравнение с NaN (уровень не задан) всегда ложно
+        with np.errstate(invalid='ignore'):
+            stop = known & np.where(is_long, current <= stop_loss, current >= stop_loss)
+            take = known & ~stop & np.where(is_long, current >= take_profit, current <= take_profit)
+        return stop, take
+
+    @staticmethod
+    def realized_pnl(columns: Dict[str, np.ndarray], current: np.ndarray) -> np.ndarray:
+        """PnL при закрытии по цене current; убыток не больше маржи"""
+        direction = np.where(columns['is_long'], 1.0, -1.0)
+        pnl = direction * (current - columns['entry_price']) * columns['amount'] * columns['leverage']
+        return np.maximum(pnl, -columns['margin'])
+
+    def run(
+        self,
+        db,
+        prices: Dict[str, float],
+        position_ids: Optional[Sequence[int]] = None
+    ) -> List[ClosedPosition]:
+        """Закрытие сработавших позиций; изменения пишутся bulk-операциями, коммит за вызывающим"""
+        columns = self.load_open_positions(db, list(prices.keys()), position_ids)
+        current = LiquidationEngine.current_prices(columns, prices)
+        if not len(current):
+            return []
+        stop, take = self.find_triggers(columns, current)
+        mask = stop | take
+        if not mask.any():
+            return []
+
+        idx = np.flatnonzero(mask)
+        closed_prices = current[idx]
+        pnl = self.realized_pnl(columns, current)[idx]
+        margins = columns['margin'][idx]
+        user_ids = columns['user_id'][idx]
+        # Возврат маржи вместе с результатом сделки
+        credits = margins + pnl
+        now = datetime.utcnow()
+
+        # Агрегаты и статистика игроков - до закрытия позиций в той же транзакции
+        record_closed(db, {name: values[idx] for name, values in columns.items()}, pnl)
+
+        db.execute(
+            update(positions_table)
+            .where(positions_table.c.id == bindparam('pid'))
+            .values(
+                is_open=False,
+                closed_at=now,
+                current_price=bindparam('price'),
+                unrealized_pnl=0.0,
+                realized_pnl=bindparam('pnl'),
+            ),
+            [
+                {'pid': int(pid), 'price': float(price), 'pnl': float(value)}
+                for pid, price, value in zip(columns['id'][idx], closed_prices, pnl)
+            ]
+        )
+
+        # Возврат на баланс: один UPDATE на пользователя
+        credit_users, inverse = np.unique(user_ids, return_inverse=True)
+        user_credits = np.bincount(inverse, weights=credits)
+        db.execute(
+            update(users_table)
+            .where(users_table.c.id == bindparam('uid'))
+            .values(balance=users_table.c.balance + bindparam('credit')),
+            [
+                {'uid': int(uid), 'credit': float(credit)}
+                for uid, credit in zip(credit_users, user_credits)
+            ]
+        )
+
+        accounts = {}
+        for chunk in chunked(credit_users.tolist(), self.chunk_size):
+            accounts.update({
+                uid: (telegram_id, balance)
+                for uid, telegram_id, balance in db.execute(
+                    select(User.id, User.telegram_id, User.balance).where(User.id.in_(chunk))
+                )
+            })
+
+        # Баланс после каждой сделки: итоговый баланс минус зачисления
+        # последующих сделок того же пользователя (суммы внутри групп по user_id)
+        order = np.argsort(inverse, kind='stable')
+        groups = inverse[order]
+        cumulative = np.cumsum(credits[order])
+        starts = np.searchsorted(groups, np.arange(len(credit_users)))
+        before_group = cumulative[starts] - credits[order][starts]
+        remaining = np.empty(len(idx))
+        remaining[order] = user_credits[groups] - (cumulative - before_group[groups])
+        final_balances = np.array([accounts[int(uid)][1] for uid in credit_users])
+        balance_after = final_balances[inverse] - remaining
+
+        closed = []
+        transactions = []
+        for n, i in enumerate(idx):
+            user_id = int(user_ids[n])
+            reason = 'stop_loss' if stop[i] else 'take_profit'
+            closed.append(ClosedPosition(
+                id=int(columns['id'][i]),
+                user_id=user_id,
+                telegram_id=accounts[user_id][0],
+                symbol=columns['symbol'][i],
+                position_type='long' if columns['is_long'][i] else 'short',
+                leverage=int(columns['leverage'][i]),
+                reason=reason,
+                entry_price=float(columns['entry_price'][i]),
+                trigger_price=float(columns[reason][i]),
+                close_price=float(closed_prices[n]),
+                margin=float(margins[n]),
+                pnl=float(pnl[n]),
+                balance=float(balance_after[n]),
+            ))
+            transactions.append({
+                'user_id': user_id,
+                'type': 'trade',
+                'amount': float(credits[n]),
+                'balance_before': float(balance_after[n] - credits[n]),
+                'balance_after': float(balance_after[n]),
+                'details': {
+                    'position_id': int(columns['id'][i]),
+                    'symbol': columns['symbol'][i],
+                    'reason': reason,
+                    'price': float(closed_prices[n]),
+                    'pnl': float(pnl[n]),
+                },
+                'created_at': now,
+            })
+
+        db.execute(insert(transactions_table), transactions)
+        return closed
+
+
+# Глобальный экземпляр
+trigger_engine = TriggerEngine()
@@ -7,9 +7,15 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from database import init_db, SessionLocal, User, Position
+import argparse
+import asyncio
+from database import init_db, SessionLocal
 from crypto_data import crypto_data
+from liquidation_engine import refresh_pnl
+from price_feed import PriceFeed
 from utils import check_liquidations, calculate_rankings
+from retention import cleanup
+from config import Config
 from datetime import datetime, timedelta
 import logging
 
@@ -17,75 +23,49 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 def update_market_data():
-    """Обновление рыночных данных"""
+    """Обновление рыночных данных (однократный опрос ленты цен)"""
     logger.info("🔄 Обновление рыночных данных...")
     
     try:
-        crypto_data.update_prices()
-        logger.info("✅ Цены обновлены")
-        
-        # Обновление PnL открытых позиций
         db = SessionLocal()
-        positions = db.query(Position).filter(Position.is_open == True).all()
-        
-        updated_count = 0
-        for position in positions:
-            current_price = crypto_data.get_current_price(position.symbol)
-            if current_price:
-                position.current_price = current_price
-                position.unrealized_pnl = crypto_data.calculate_pnl(
-                    position.entry_price,
-                    current_price,
-                    position.amount,
-                    position.leverage,
-                    position.position_type.value
-                )
-                updated_count += 1
-        
-        db.commit()
-        logger.info(f"✅ Обновлено {updated_count} позиций")
+        feed = PriceFeed(crypto_data)
+        
+        async def on_ticks(ticks):
+            # Обновление PnL открытых позиций, цена которых изменилась
+            if not Config.PNL_ON_READ:
+                refresh_pnl(db, {tick.symbol: tick.price for tick in ticks})
+                db.commit()
+            logger.info(f"✅ Цены обновлены: {len(ticks)} символов")
+            
+            # Проверка ликвидаций
+            liquidated = check_liquidations(db, crypto_data)
+            if liquidated:
+                logger.info(f"⚠️ Ликвидировано {len(liquidated)} позиций")
         
-        # Проверка ликвидаций
-        liquidated = check_liquidations(db, crypto_data)
-        if liquidated:
-            logger.info(f"⚠️ Ликвидировано {len(liquidated)} позиций")
+        feed.subscribe(on_ticks)
+        asyncio.run(feed.poll_once())
         
         db.close()
         
     except Exception as e:
         logger.error(f"❌ Ошибка при обновлении данных: {e}")
 
-def cleanup_old_data(days: int = 30):
-    """Очистка старых данных"""
+def cleanup_old_data(days: int = None, archive_dir: str = None):
+    """Очистка старых данных порциями (с архивом в Parquet при archive_dir)"""
+    days = days or Config.CLEANUP_DAYS
+    archive_dir = archive_dir or Config.CLEANUP_ARCHIVE_DIR
     logger.info(f"🧹 Очистка данных старше {days} дней...")
     
     try:
         db = SessionLocal()
         cutoff_date = datetime.utcnow() - timedelta(days=days)
-        
-        # Закрытые позиции старше cutoff_date
-        old_positions = db.query(Position).filter(
-            Position.is_open == False,
-            Position.closed_at < cutoff_date
-        ).all()
-        
-        deleted_count = 0
-        for position in old_positions:
-            db.delete(position)
-            deleted_count += 1
-        
-        # Старые транзакции
-        from models.transaction import Transaction
-        old_transactions = db.query(Transaction).filter(
-            Transaction.created_at < cutoff_date
-        ).all()
-        
-        for transaction in old_transactions:
-            db.delete(transaction)
-            deleted_count += 1
-        
-        db.commit()
-        logger.info(f"✅ Удалено {deleted_count} записей")
+        deleted = cleanup(db, cutoff_date, archive_dir=archive_dir)
+        logger.info(
+            f"✅ Удалено {sum(deleted.values())} записей "
+            f"(позиций: {deleted['positions']}, транзакций: {deleted['transactions']})"
+        )
+        if archive_dir:
+            logger.info(f"📦 Архив: {archive_dir}")
         
         db.close()
         
@@ -109,13 +89,19 @@ def backup_database():
     logger.info("💾 Резервное копирование базы данных...")
     
     try:
-        import shutil
+        import sqlite3
         from config import Config
         
         db_path = Config.DATABASE_URL.replace('sqlite:///', '')
         backup_path = f"{db_path}.backup.{datetime.now().strftime('%Y%m%d_%H%M%S')}"
         
-        shutil.copy2(db_path, backup_path)
+        # Backup API SQLite учитывает страницы из WAL-журнала
+        source = sqlite3.connect(db_path)
+        target = sqlite3.connect(backup_path)
+        with target:
+            source.backup(target)
+        target.close()
+        source.close()
         logger.info(f"✅ Резервная копия создана: {backup_path}")
         
         # Удаление старых бэкапов (оставляем последние 7)
@@ -130,16 +116,32 @@ def backup_database():
 
 def main():
     """Основная функция"""
+    parser = argparse.ArgumentParser(description="Обслуживание Trading Game Bot")
+    parser.add_argument('--market', action='store_true', help="однократное обновление цен и ликвидаций")
+    parser.add_argument('--rankings', action='store_true', help="пересчет рейтингов")
+    parser.add_argument('--cleanup', action='store_true', help="очистка старых данных")
+    parser.add_argument('--backup', action='store_true', help="резервное копирование")
+    parser.add_argument('--days', type=int, default=Config.CLEANUP_DAYS, help="срок хранения для --cleanup, дней")
+    parser.add_argument('--archive-dir', default=Config.CLEANUP_ARCHIVE_DIR, help="архив удаляемых строк в Parquet")
+    args = parser.parse_args()
+    
+    # Без флагов выполняются все задачи
+    run_all = not (args.market or args.rankings or args.cleanup or args.backup)
+    
     logger.info("🛠️ Запуск обслуживания Trading Game Bot")
     
     # Инициализация базы данных
     init_db()
     
     # Выполняем задачи обслуживания
-    update_market_data()
-    update_rankings()
-    cleanup_old_data(30)
-    backup_database()
+    if run_all or args.market:
+        update_market_data()
+    if run_all or args.rankings:
+        update_rankings()
+    if run_all or args.cleanup:
+        cleanup_old_data(args.days, args.archive_dir)
+    if run_all or args.backup:
+        backup_database()
     
     logger.info("✅ Обслуживание завершено")
 
@@ -0,0 +1,121 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, NamedTuple, Optional
+
+from sqlalchemy import select
+
+from config import Config
+from database import User
+
+
+class UserSnapshot(NamedTuple):
+    """Компактный снимок пользователя для экранов только на чтение"""
+    id: int
+    telegram_id: int
+    first_name: Optional[str]
+    balance: float
+    total_profit: float
+    total_trades: int
+    win_rate: float
+    rank: int
+
+    @classmethod
+    def from_user(cls, user: User) -> 'UserSnapshot':
+        return cls(
+            id=user.id,
+            telegram_id=user.telegram_id,
+            first_name=user.first_name,
+            balance=user.balance,
+            total_profit=user.total_profit,
+            total_trades=user.total_trades,
+            win_rate=user.win_rate,
+            rank=user.rank,
+        )
+
+
+class UserCache:
+    """LRU-кэш снимков пользователей по telegram_id с TTL"""
+
+    def __init__(self, max_size: int = None, ttl: float = None):
+        self.max_size = max_size if max_size is not None else Config.USER_CACHE_SIZE
+        self.ttl = ttl if ttl is not None else Config.USER_CACHE_TTL
+        self.entries: 'OrderedDict[int, tuple]' = OrderedDict()
+        # Инвалидация приходит и из рабочих потоков (ликвидации)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, telegram_id: int) -> Optional[UserSnapshot]:
+        with self.lock:
+            entry = self.entries.get(telegram_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, snapshot = entry
+            if expires_at < time.monotonic():
+                del self.entries[telegram_id]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(telegram_id)
+            self.hits += 1
+            return snapshot
+
+    def put(self, snapshot: UserSnapshot):
+        with self.lock:
+            self.entries[snapshot.telegram_id] = (time.monotonic() + self.ttl, snapshot)
+            self.entries.move_to_end(snapshot.telegram_id)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def put_user(self, user: User) -> UserSnapshot:
+        snapshot = UserSnapshot.from_user(user)
+        self.put(snapshot)
+        return snapshot
+
+    def invalidate(self, telegram_id: int):
+        """Сброс записи после изменения баланса или статистики"""
+        with self.lock:
+            if self.entries.pop(telegram_id, None) is not None:
+                self.invalidations += 1
+
+    def invalidate_many(self, telegram_ids: Iterable[int]):
+        for telegram_id in telegram_ids:
+            self.invalidate(telegram_id)
+
+    def clear(self):
+        with self.lock:
+            self.invalidations += len(self.entries)
+            self.entries.clear()
+
+    async def get_or_load(self, telegram_id: int, db) -> Optional[UserSnapshot]:
+        """Снимок из кэша или из базы (db - AsyncSession)"""
+        snapshot = self.get(telegram_id)
+        if snapshot is not None:
+            return snapshot
+        user = await db.scalar(select(User).where(User.telegram_id == telegram_id))
+        if user is None:
+            return None
+        return self.put_user(user)
+
+    def stats(self) -> Dict[str, float]:
+        """Метрики попаданий для мониторинга нагрузки на БД"""
+        requests = self.hits + self.misses
+        return {
+            'size': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / requests if requests else 0.0,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+        }
+
+
+# Глобальный экземпляр
+user_cache = UserCache()
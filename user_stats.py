@@ -0,0 +1,301 @@
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import bindparam, case, delete, func, insert, literal, select, update
+
+from database import Position, PositionType, User, UserExposure, UserStats, chunked
+
+# Таблицы для Core-операций: bulk UPDATE/INSERT без загрузки ORM-объектов
+positions_table = Position.__table__
+users_table = User.__table__
+stats_table = UserStats.__table__
+exposure_table = UserExposure.__table__
+
+CHUNK_SIZE = 500
+
+
+def rebuild(db, user_ids: Optional[Iterable[int]] = None):
+    """Пересчет агрегатов по таблице позиций (для всех игроков или для user_ids);
+    закрытые позиции, удаленные очисткой (retention), в пересчет не попадают"""
+    if user_ids is None:
+        db.execute(delete(exposure_table))
+        db.execute(delete(stats_table))
+        _insert_from_positions(db, None)
+        return
+    for chunk in chunked(sorted(set(user_ids)), CHUNK_SIZE):
+        db.execute(delete(exposure_table).where(exposure_table.c.user_id.in_(chunk)))
+        db.execute(delete(stats_table).where(stats_table.c.user_id.in_(chunk)))
+        _insert_from_positions(db, chunk)
+
+
+def _insert_from_positions(db, user_ids: Optional[Sequence[int]]):
+    p = positions_table.c
+    size = p.amount * p.leverage
+    is_long = p.position_type == PositionType.LONG
+
+    def only(stmt, column):
+        return stmt if user_ids is None else stmt.where(column.in_(user_ids))
+
+    open_agg = only(
+        select(
+            p.user_id,
+            func.count().label('positions'),
+            func.sum(p.margin).label('margin'),
+            func.sum(p.leverage).label('leverage'),
+        ).where(p.is_open == True).group_by(p.user_id),
+        p.user_id
+    ).subquery()
+    closed_agg = only(
+        select(
+            p.user_id,
+            func.count().label('trades'),
+            func.sum(case((p.realized_pnl > 0, 1), else_=0)).label('wins'),
+            func.sum(p.realized_pnl).label('pnl'),
+            # Ликвидация - закрытие по цене за уровнем ликвидации
+            func.sum(case(
+                (is_long & (p.current_price <= p.liquidation_price), 1),
+                (~is_long & (p.current_price >= p.liquidation_price), 1),
+                else_=0
+            )).label('liquidations'),
+        ).where(p.is_open == False).group_by(p.user_id),
+        p.user_id
+    ).subquery()
+
+    trades = func.coalesce(closed_agg.c.trades, 0)
+    wins = func.coalesce(closed_agg.c.wins, 0)
+    db.execute(insert(stats_table).from_select(
+        ['user_id', 'open_positions', 'open_margin', 'leverage_sum',
+         'closed_trades', 'wins', 'losses', 'liquidations', 'realized_pnl', 'updated_at'],
+        only(
+            select(
+                users_table.c.id,
+                func.coalesce(open_agg.c.positions, 0),
+                func.coalesce(open_agg.c.margin, 0.0),
+                func.coalesce(open_agg.c.leverage, 0),
+                trades,
+                wins,
+                trades - wins,
+                func.coalesce(closed_agg.c.liquidations, 0),
+                func.coalesce(closed_agg.c.pnl, 0.0),
+                literal(datetime.utcnow()),
+            )
+            .outerjoin(open_agg, open_agg.c.user_id == users_table.c.id)
+            .outerjoin(closed_agg, closed_agg.c.user_id == users_table.c.id),
+            users_table.c.id
+        )
+    ))
+    db.execute(insert(exposure_table).from_select(
+        ['user_id', 'symbol', 'open_positions', 'long_size', 'long_cost', 'short_size', 'short_cost'],
+        only(
+            select(
+                p.user_id,
+                p.symbol,
+                func.count(),
+                func.sum(case((is_long, size), else_=0.0)),
+                func.sum(case((is_long, size * p.entry_price), else_=0.0)),
+                func.sum(case((is_long, 0.0), else_=size)),
+                func.sum(case((is_long, 0.0), else_=size * p.entry_price)),
+            ).where(p.is_open == True).group_by(p.user_id, p.symbol),
+            p.user_id
+        )
+    ))
+
+
+def backfill(db) -> int:
+    """Агрегаты для игроков, у которых их еще нет (база до появления user_stats)"""
+    missing = db.scalars(
+        select(users_table.c.id).where(~users_table.c.id.in_(select(stats_table.c.user_id)))
+    ).all()
+    rebuild(db, missing)
+    return len(missing)
+
+
+def ensure_rows(db, user_ids: Sequence[int]):
+    """Недостающие строки строятся по позициям - до изменения позиций в этой транзакции"""
+    for chunk in chunked(list(user_ids), CHUNK_SIZE):
+        existing = set(db.scalars(select(stats_table.c.user_id).where(stats_table.c.user_id.in_(chunk))))
+        missing = [user_id for user_id in chunk if user_id not in existing]
+        if missing:
+            rebuild(db, missing)
+
+
+def _columns(columns: Dict[str, Sequence]) -> Dict[str, np.ndarray]:
+    return {
+        'user_id': np.asarray(columns['user_id'], dtype=np.int64),
+        'symbol': np.asarray(columns['symbol'], dtype=object),
+        'is_long': np.asarray(columns['is_long'], dtype=bool),
+        'amount': np.asarray(columns['amount'], dtype=np.float64),
+        'leverage': np.asarray(columns['leverage'], dtype=np.int64),
+        'entry_price': np.asarray(columns['entry_price'], dtype=np.float64),
+        'margin': np.asarray(columns['margin'], dtype=np.float64),
+    }
+
+
+def _apply(db, columns: Dict[str, Sequence], sign: int, pnl: Optional[Sequence[float]] = None,
+           liquidated: bool = False):
+    columns = _columns(columns)
+    if not len(columns['user_id']):
+        return []
+    users, inverse = np.unique(columns['user_id'], return_inverse=True)
+    ensure_rows(db, users.tolist())
+
+    # Открытые позиции: один UPDATE на игрока; при нуле позиций суммы обнуляются,
+    # чтобы не копить ошибку округления
+    count = np.bincount(inverse) * sign
+    margin = np.bincount(inverse, weights=columns['margin']) * sign
+    leverage = np.bincount(inverse, weights=columns['leverage']).astype(np.int64) * sign
+    if pnl is None:
+        trades = wins = liquidations = np.zeros(len(users), dtype=np.int64)
+        realized = np.zeros(len(users))
+    else:
+        pnl = np.asarray(pnl, dtype=np.float64)
+        trades = np.bincount(inverse)
+        wins = np.bincount(inverse, weights=(pnl > 0).astype(np.float64)).astype(np.int64)
+        realized = np.bincount(inverse, weights=pnl)
+        liquidations = trades if liquidated else np.zeros(len(users), dtype=np.int64)
+
+    s = stats_table.c
+    empty = s.open_positions + bindparam('count') == 0
+    db.execute(
+        update(stats_table)
+        .where(s.user_id == bindparam('uid'))
+        .values(
+            open_positions=s.open_positions + bindparam('count'),
+            open_margin=case((empty, 0.0), else_=s.open_margin + bindparam('margin')),
+            leverage_sum=s.leverage_sum + bindparam('leverage'),
+            closed_trades=s.closed_trades + bindparam('trades'),
+            wins=s.wins + bindparam('wins'),
+            losses=s.losses + bindparam('trades') - bindparam('wins'),
+            liquidations=s.liquidations + bindparam('liquidations'),
+            realized_pnl=s.realized_pnl + bindparam('realized'),
+            updated_at=datetime.utcnow(),
+        ),
+        [
+            {'uid': uid, 'count': n, 'margin': m, 'leverage': lev, 'trades': t, 'wins': w, 'realized': r,
+             'liquidations': liq}
+            for uid, n, m, lev, t, w, r, liq in zip(
+                users.tolist(), count.tolist(), margin.tolist(), leverage.tolist(),
+                trades.tolist(), wins.tolist(), realized.tolist(), liquidations.tolist()
+            )
+        ]
+    )
+
+    # Объем по символу: ключ (игрок, символ) кодируется одним целым
+    symbols, symbol_idx = np.unique(columns['symbol'], return_inverse=True)
+    keys, key_inverse = np.unique(inverse * len(symbols) + symbol_idx, return_inverse=True)
+    size = columns['amount'] * columns['leverage']
+    cost = size * columns['entry_price']
+    is_long = columns['is_long']
+    sums = {
+        'count': np.bincount(key_inverse) * sign,
+        'long_size': np.bincount(key_inverse, weights=np.where(is_long, size, 0.0)) * sign,
+        'long_cost': np.bincount(key_inverse, weights=np.where(is_long, cost, 0.0)) * sign,
+        'short_size': np.bincount(key_inverse, weights=np.where(is_long, 0.0, size)) * sign,
+        'short_cost': np.bincount(key_inverse, weights=np.where(is_long, 0.0, cost)) * sign,
+    }
+    rows = [
+        dict(
+            {'uid': int(users[key // len(symbols)]), 'sym': symbols[key % len(symbols)]},
+            **{name: values[i].item() for name, values in sums.items()}
+        )
+        for i, key in enumerate(keys.tolist())
+    ]
+    e = exposure_table.c
+    if sign > 0:
+        # Строки новых символов создаются нулевыми и обновляются вместе с остальными
+        existing = set()
+        for chunk in chunked(users.tolist(), CHUNK_SIZE):
+            existing.update(map(tuple, db.execute(select(e.user_id, e.symbol).where(e.user_id.in_(chunk)))))
+        new_rows = [
+            {'user_id': row['uid'], 'symbol': row['sym'], 'open_positions': 0,
+             'long_size': 0.0, 'long_cost': 0.0, 'short_size': 0.0, 'short_cost': 0.0}
+            for row in rows if (row['uid'], row['sym']) not in existing
+        ]
+        if new_rows:
+            db.execute(insert(exposure_table), new_rows)
+    empty = e.open_positions + bindparam('count') == 0
+    db.execute(
+        update(exposure_table)
+        .where(e.user_id == bindparam('uid'), e.symbol == bindparam('sym'))
+        .values(
+            open_positions=e.open_positions + bindparam('count'),
+            **{
+                name: case((empty, 0.0), else_=getattr(e, name) + bindparam(name))
+                for name in ('long_size', 'long_cost', 'short_size', 'short_cost')
+            }
+        ),
+        rows
+    )
+    return users.tolist()
+
+
+def sync_user_totals(db, user_ids: Sequence[int]):
+    """Статистика в users (total_profit, total_trades, win_rate) из агрегатов"""
+    s = stats_table.c
+    for chunk in chunked(list(user_ids), CHUNK_SIZE):
+        db.execute(
+            update(users_table)
+            .where(users_table.c.id == s.user_id, users_table.c.id.in_(chunk))
+            .values(
+                total_profit=s.realized_pnl,
+                total_trades=s.closed_trades,
+                win_rate=case((s.closed_trades > 0, s.wins * 100.0 / s.closed_trades), else_=0.0),
+            )
+        )
+
+
+def record_opened(db, columns: Dict[str, Sequence]):
+    """Учет открытых позиций; вызывается в той же транзакции до их вставки"""
+    _apply(db, columns, 1)
+
+
+def record_closed(db, columns: Dict[str, Sequence], pnl: Sequence[float], liquidated: bool = False):
+    """Учет закрытых позиций (liquidated - ликвидированных) и обновление
+    статистики игроков; вызывается в той же транзакции до закрытия позиций"""
+    users = _apply(db, columns, -1, pnl, liquidated)
+    sync_user_totals(db, users)
+
+
+def portfolio_stats(db, user_id: int, prices: Dict[str, float]) -> Dict[str, float]:
+    """Статистика портфеля одним запросом по агрегатам игрока"""
+    s, e = stats_table.c, exposure_table.c
+    rows = db.execute(
+        select(
+            s.open_positions, s.open_margin, s.leverage_sum, s.closed_trades, s.wins, s.losses, s.realized_pnl,
+            e.symbol, e.long_size, e.long_cost, e.short_size, e.short_cost,
+        )
+        .select_from(stats_table)
+        .outerjoin(exposure_table, (e.user_id == s.user_id) & (e.open_positions > 0))
+        .where(s.user_id == user_id)
+    ).all()
+    if not rows:
+        return {
+            'total_value': 0, 'total_pnl': 0, 'total_margin': 0, 'open_positions': 0,
+            'average_leverage': 0, 'closed_trades': 0, 'wins': 0, 'losses': 0, 'realized_pnl': 0,
+        }
+
+    total_value = total_pnl = 0.0
+    for row in rows:
+        if row.symbol is None:
+            continue
+        price = prices.get(row.symbol)
+        if not price:
+            # Без цены - стоимость по входу, PnL не учитывается
+            total_value += row.long_cost + row.short_cost
+            continue
+        total_value += (row.long_size + row.short_size) * price
+        total_pnl += row.long_size * price - row.long_cost + row.short_cost - row.short_size * price
+
+    first = rows[0]
+    return {
+        'total_value': total_value,
+        'total_pnl': total_pnl,
+        'total_margin': first.open_margin,
+        'open_positions': first.open_positions,
+        'average_leverage': first.leverage_sum / first.open_positions if first.open_positions else 0,
+        'closed_trades': first.closed_trades,
+        'wins': first.wins,
+        'losses': first.losses,
+        'realized_pnl': first.realized_pnl,
+    }
@@ -1,9 +1,14 @@
 from datetime import datetime
 from typing import Dict, Any, List, Optional
 import pandas as pd
-from models.user import User
-from models.position import Position
-import numpy as np
+from sqlalchemy import delete, func, insert, literal, select, update
+from database import User, LeaderboardEntry
+from liquidation_engine import liquidation_engine
+from trigger_engine import trigger_engine
+from matching_engine import matching_engine
+from live_leaderboard import live_leaderboard, ranking_score
+from user_stats import portfolio_stats
+from user_cache import user_cache
 from config import Config
 
 def format_price(price: float) -> str:
@@ -19,103 +24,175 @@ def format_percentage(value: float) -> str:
     """Форматирование процентов"""
     return f"{value:+.2f}%"
 
-def calculate_rankings(db) -> List[Dict]:
-    """Расчет рейтинга игроков"""
-    users = db.query(User).filter(User.total_trades > 0).all()
+def calculate_rankings(db, top_n: int = None) -> List[Dict]:
+    """Расчет рейтинга игроков на стороне базы
+
+    Ранги считаются RANK() OVER и записываются одним UPDATE ... FROM
+    только там, где изменились; первые top_n игроков материализуются
+    в таблицу leaderboard, которую читает экран рейтинга.
+    """
+    top_n = top_n or Config.LEADERBOARD_SIZE
+    score = ranking_score()
+    ranked = (
+        select(User.id, func.rank().over(order_by=score.desc()).label('rank'))
+        .where(User.total_trades > 0)
+        .subquery()
+    )
+    db.execute(
+        update(User)
+        .where(User.id == ranked.c.id, User.rank.is_distinct_from(ranked.c.rank))
+        .values(rank=ranked.c.rank)
+        .execution_options(synchronize_session=False)
+    )
     
-    ranked_users = []
-    for user in users:
-        # Расчет рейтингового очка (можно настроить формулу)
-        score = (
-            user.total_profit * 0.5 +
-            user.win_rate * 1000 +
-            user.total_trades * 10
+    # Таблица лидеров: индекс по rank отдает первые top_n без сортировки всех игроков
+    now = datetime.utcnow()
+    top = (
+        select(
+            func.row_number().over(order_by=(User.rank, User.id)).label('position'),
+            User.rank,
+            User.id,
+            User.telegram_id,
+            func.coalesce(User.first_name, User.username).label('name'),
+            score.label('score'),
+            User.total_profit,
+            User.win_rate,
+            User.total_trades,
+            literal(now).label('updated_at'),
         )
-        
-        ranked_users.append({
-            'user': user,
-            'score': score
-        })
-    
-    # Сортировка по рейтингу
-    ranked_users.sort(key=lambda x: x['score'], reverse=True)
-    
-    # Обновление рангов
-    for i, item in enumerate(ranked_users, 1):
-        item['user'].rank = i
+        .where(User.total_trades > 0, User.rank >= 1)
+        .order_by(User.rank, User.id)
+        .limit(top_n)
+    )
+    db.execute(delete(LeaderboardEntry))
+    db.execute(insert(LeaderboardEntry).from_select(
+        ['position', 'rank', 'user_id', 'telegram_id', 'name', 'score',
+         'total_profit', 'win_rate', 'total_trades', 'updated_at'],
+        top
+    ))
     
     db.commit()
+    user_cache.clear()
     
-    return ranked_users[:20]  # Топ 20
+    return leaderboard_rows(db, 20)  # Топ 20
+
+def leaderboard_rows(db, limit: int = None) -> List[Dict]:
+    """Строки материализованной таблицы лидеров"""
+    stmt = select(LeaderboardEntry).order_by(LeaderboardEntry.position)
+    if limit:
+        stmt = stmt.limit(limit)
+    return [
+        {
+            'position': entry.position,
+            'rank': entry.rank,
+            'user_id': entry.user_id,
+            'telegram_id': entry.telegram_id,
+            'name': entry.name,
+            'score': entry.score,
+            'total_profit': entry.total_profit,
+            'win_rate': entry.win_rate,
+            'total_trades': entry.total_trades,
+        }
+        for entry in db.scalars(stmt)
+    ]
+
+def synced_price_index(db, crypto_data):
+    """Индекс уровней, загруженный из базы и догруженный новыми позициями"""
+    index = crypto_data.price_index
+    if not index.loaded:
+        index.load(db)
+    else:
+        index.load_new(db)
+    return index
+
+def match_limit_orders(db, crypto_data):
+    """Исполнение лимитных ордеров, пересеченных текущими ценами"""
+    filled = matching_engine.match(db, dict(crypto_data.prices))
+
+    db.commit()
+
+    # Новые позиции сразу попадают в индекс уровней, не дожидаясь догрузки
+    index = crypto_data.price_index
+    for order in filled:
+        index.add_position(order.position_id, order.symbol, order.position_type == 'long', order.liquidation_price)
+
+    user_cache.invalidate_many({order.telegram_id for order in filled})
+
+    return filled
+
+def check_stop_orders(db, crypto_data):
+    """Исполнение стоп-лоссов и тейк-профитов"""
+    prices = dict(crypto_data.prices)
+
+    # Кандидаты берутся из индекса уровней, движок перепроверяет их по текущим ценам
+    index = synced_price_index(db, crypto_data)
+    candidates = []
+    for symbol, price in prices.items():
+        if price:
+            triggered = index.triggered(symbol, price)
+            candidates += triggered['stop_loss'] + triggered['take_profit']
+
+    closed = trigger_engine.run(db, prices, candidates) if candidates else []
+
+    db.commit()
+
+    index.remove_positions(position.id for position in closed)
+
+    user_cache.invalidate_many({position.telegram_id for position in closed})
+
+    # Статистика игроков изменилась - их места в живом рейтинге тоже
+    if closed and live_leaderboard.loaded:
+        live_leaderboard.refresh_users(db, {position.user_id for position in closed})
+
+    return closed
 
 def check_liquidations(db, crypto_data):
     """Проверка ликвидаций позиций"""
-    positions = db.query(Position).filter(Position.is_open == True).all()
-    liquidated = []
-    
-    for position in positions:
-        current_price = crypto_data.get_current_price(position.symbol)
-        
-        if position.position_type == 'long':
-            if current_price <= position.liquidation_price:
-                # Ликвидация лонга
-                position.is_open = False
-                position.closed_at = datetime.utcnow()
-                position.current_price = current_price
-                position.realized_pnl = -position.margin  # Потеря всей маржи
-                liquidated.append(position)
-                
-                # Обновление баланса пользователя
-                position.user.balance = max(0, position.user.balance + position.realized_pnl)
-                
-        else:  # short
-            if current_price >= position.liquidation_price:
-                # Ликвидация шорта
-                position.is_open = False
-                position.closed_at = datetime.utcnow()
-                position.current_price = current_price
-                position.realized_pnl = -position.margin  # Потеря всей маржи
-                liquidated.append(position)
-                
-                # Обновление баланса пользователя
-                position.user.balance = max(0, position.user.balance + position.realized_pnl)
-        
-        # Обновление текущей цены и PnL
-        position.current_price = current_price
-        position.unrealized_pnl = crypto_data.calculate_pnl(
-            position.entry_price,
-            current_price,
-            position.amount,
-            position.leverage,
-            position.position_type.value
-        )
-    
+    prices = dict(crypto_data.prices)
+
+    # Кандидаты на ликвидацию берутся из индекса уровней
+    index = synced_price_index(db, crypto_data)
+
+    candidates = []
+    for symbol, price in prices.items():
+        if price:
+            candidates += index.triggered(symbol, price)['liquidation']
+
+    liquidated = liquidation_engine.run(db, prices, candidates) if candidates else []
+
     db.commit()
+
+    # Кандидат, не попавший в ликвидацию, уже закрыт - из индекса убираем всех
+    index.remove_positions(candidates)
+
+    user_cache.invalidate_many({position.telegram_id for position in liquidated})
+
+    # Ликвидация меняет статистику игроков так же, как стоп-ордера
+    if liquidated and live_leaderboard.loaded:
+        live_leaderboard.refresh_users(db, {position.user_id for position in liquidated})
+
     return liquidated
 
-def calculate_portfolio_stats(user_id: int, db) -> Dict[str, Any]:
-    """Расчет статистики портфеля"""
-    positions = db.query(Position).filter(
-        Position.user_id == user_id,
-        Position.is_open == True
-    ).all()
-    
-    total_value = 0
-    total_pnl = 0
-    total_margin = 0
-    
-    for position in positions:
-        total_value += position.amount * position.current_price * position.leverage
-        total_pnl += position.unrealized_pnl
-        total_margin += position.margin
-    
-    return {
-        'total_value': total_value,
-        'total_pnl': total_pnl,
-        'total_margin': total_margin,
-        'open_positions': len(positions),
-        'average_leverage': np.mean([p.leverage for p in positions]) if positions else 0
-    }
+def position_mark_price(position, crypto_data) -> float:
+    """Текущая цена позиции: кэш цен, иначе последняя записанная в БД"""
+    return crypto_data.get_current_price(position.symbol) or position.current_price
+
+def position_unrealized_pnl(position, crypto_data) -> float:
+    """Нереализованный PnL позиции (при PNL_ON_READ - по кэшу цен)"""
+    if not Config.PNL_ON_READ:
+        return position.unrealized_pnl
+    return crypto_data.calculate_pnl(
+        position.entry_price,
+        position_mark_price(position, crypto_data),
+        position.amount,
+        position.leverage,
+        position.position_type.value
+    )
+
+def calculate_portfolio_stats(user_id: int, db, crypto_data=None) -> Dict[str, Any]:
+    """Расчет статистики портфеля по поддерживаемым агрегатам игрока"""
+    prices = dict(crypto_data.prices) if crypto_data is not None else {}
+    return portfolio_stats(db, user_id, prices)
 
 def validate_trade_amount(amount: float, user_balance: float, leverage: int) -> bool:
     """Проверка суммы сделки"""
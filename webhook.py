@@ -0,0 +1,246 @@
+import asyncio
+import fcntl
+import json
+import logging
+import multiprocessing
+import os
+import signal
+from typing import Dict, List, Optional, Tuple
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Типы обновлений, в которых есть отправитель
+USER_FIELDS = (
+    'message', 'edited_message', 'callback_query', 'inline_query', 'chosen_inline_result',
+    'shipping_query', 'pre_checkout_query', 'poll_answer', 'my_chat_member', 'chat_member',
+    'chat_join_request',
+)
+
+HTTP_STATUS = {200: 'OK', 400: 'Bad Request', 403: 'Forbidden', 404: 'Not Found', 405: 'Method Not Allowed'}
+
+
+def update_user_id(payload: dict) -> Optional[int]:
+    """Telegram id отправителя обновления"""
+    for field in USER_FIELDS:
+        item = payload.get(field)
+        if item:
+            user = item.get('from') or item.get('user')
+            if user:
+                return user.get('id')
+    return None
+
+
+def partition(user_id: Optional[int], workers: int) -> int:
+    """Номер процесса для пользователя: все его обновления идут в один процесс по порядку"""
+    return user_id % workers if user_id is not None else 0
+
+
+class LeaderLock:
+    """Выбор ведущего процесса через flock: блокировку держит не больше одного процесса,
+    при его завершении ОС снимает ее автоматически"""
+
+    def __init__(self, path: str = None):
+        self.path = path or Config.LEADER_LOCK_FILE
+        self.fd: Optional[int] = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self.fd is not None
+
+    def acquire(self) -> bool:
+        """Попытка стать ведущим без ожидания"""
+        if self.fd is not None:
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self.fd = fd
+        return True
+
+    def release(self):
+        if self.fd is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+            os.close(self.fd)
+            self.fd = None
+
+
+async def read_http_request(reader: asyncio.StreamReader) -> Optional[Tuple[str, str, Dict[str, str], bytes]]:
+    """Разбор HTTP/1.1 запроса: метод, путь, заголовки (в нижнем регистре), тело"""
+    request_line = await reader.readline()
+    if not request_line.strip():
+        return None
+    method, path, _ = request_line.decode('latin-1').split(' ', 2)
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    body = await reader.readexactly(int(headers.get('content-length', 0)))
+    return method, path, headers, body
+
+
+async def write_http_response(writer: asyncio.StreamWriter, status: int, body: bytes = b'',
+                              content_type: str = 'application/json'):
+    writer.write(
+        f"HTTP/1.1 {status} {HTTP_STATUS.get(status, '')}\r\n"
+        f"Content-Type: {content_type}\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: close\r\n\r\n".encode() + body
+    )
+    await writer.drain()
+    writer.close()
+
+
+class WebhookDispatcher:
+    """Прием обновлений от Telegram и раздача по очередям процессов по id пользователя"""
+
+    def __init__(self, queues: List, secret: Optional[str] = None, path: str = None):
+        self.queues = queues
+        self.secret = secret
+        self.path = path or Config.WEBHOOK_PATH
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.dispatched = [0] * len(queues)
+
+    def dispatch(self, payload: dict) -> int:
+        worker = partition(update_user_id(payload), len(self.queues))
+        self.queues[worker].put(payload)
+        self.dispatched[worker] += 1
+        return worker
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = await read_http_request(reader)
+        except (ValueError, asyncio.IncompleteReadError):
+            request = None
+        if request is None:
+            await write_http_response(writer, 400)
+            return
+
+        method, path, headers, body = request
+        if path != self.path:
+            status = 404
+        elif method != 'POST':
+            status = 405
+        elif self.secret and headers.get('x-telegram-bot-api-secret-token') != self.secret:
+            status = 403
+        else:
+            try:
+                self.dispatch(json.loads(body))
+                status = 200
+            except ValueError:
+                status = 400
+        await write_http_response(writer, status)
+
+    async def start(self, host: str, port: int) -> int:
+        """Запуск HTTP-сервера; возвращает фактический порт"""
+        self.server = await asyncio.start_server(self.handle, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+
+async def run_worker(bot, queue):
+    """Процесс-обработчик: обновления из очереди диспетчера в Application без Updater"""
+    from telegram import Update
+
+    application = bot.build_application(updater=False)
+    async with application:
+        # post_init вызывают только run_polling/run_webhook - здесь вызываем сами
+        await bot.post_init(application)
+        await application.start()
+        try:
+            while True:
+                payload = await asyncio.to_thread(queue.get)
+                if payload is None:
+                    break
+                await application.update_queue.put(Update.de_json(payload, application.bot))
+        finally:
+            await application.stop()
+            await bot.post_stop(application)
+
+
+def worker_main(index: int, queue, token: str):
+    """Точка входа процесса-обработчика"""
+    # Формат логов задается до импорта bot, который настраивает логирование сам
+    logging.basicConfig(
+        format=f'%(asctime)s - worker {index} - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    from bot import TradingBot
+
+    bot = TradingBot(token, leader_lock=LeaderLock())
+    try:
+        asyncio.run(run_worker(bot, queue))
+    except KeyboardInterrupt:
+        pass
+
+
+async def serve_dispatcher(token: str, queues: List):
+    """Регистрация webhook и прием обновлений до SIGINT/SIGTERM"""
+    from telegram import Bot, Update
+
+    if Config.WEBHOOK_URL:
+        async with Bot(token, **telegram_api_urls()) as bot:
+            await bot.set_webhook(
+                url=Config.WEBHOOK_URL,
+                secret_token=Config.WEBHOOK_SECRET,
+                allowed_updates=Update.ALL_TYPES
+            )
+
+    dispatcher = WebhookDispatcher(queues, secret=Config.WEBHOOK_SECRET)
+    port = await dispatcher.start(Config.WEBHOOK_LISTEN, Config.WEBHOOK_PORT)
+    logger.info(f"Webhook dispatcher listening on {Config.WEBHOOK_LISTEN}:{port}{dispatcher.path}")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+    await dispatcher.stop()
+    logger.info(f"Dispatched updates per worker: {dispatcher.dispatched}")
+
+
+def telegram_api_urls() -> dict:
+    """base_url / base_file_url для Bot при локальной замене Telegram API"""
+    if not Config.TELEGRAM_API_URL:
+        return {}
+    return {
+        'base_url': f"{Config.TELEGRAM_API_URL}/bot",
+        'base_file_url': f"{Config.TELEGRAM_API_URL}/file/bot",
+    }
+
+
+def run_webhook(token: str, workers: int = None):
+    """Диспетчер в текущем процессе и workers процессов-обработчиков"""
+    workers = workers or Config.WEBHOOK_WORKERS
+    context = multiprocessing.get_context('spawn')
+    queues = [context.Queue() for _ in range(workers)]
+    processes = [
+        context.Process(target=worker_main, args=(i, queue, token), name=f'bot-worker-{i}')
+        for i, queue in enumerate(queues)
+    ]
+    for process in processes:
+        process.start()
+
+    try:
+        asyncio.run(serve_dispatcher(token, queues))
+    finally:
+        for queue in queues:
+            queue.put(None)
+        for process in processes:
+            process.join(timeout=30)
+            if process.is_alive():
+                process.terminate()